@@ -1,14 +1,36 @@
-from fastapi import APIRouter, HTTPException
+import json
+from typing import Any, AsyncIterator, Dict, Optional
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from app.models.dto import DraftRequest, DraftResponse
 from app.services.llm_client import llm_client
 from app.core.field_catalog import field_catalog
-from app.core.prompt import SYSTEM_PROMPT
+from app.core.prompt import SYSTEM_PROMPT, EXAMPLES_SECTION, PROMPT_VERSION
+from app.core.cache import draft_cache
+from app.core.json_stream import JSONObjectStreamParser
+from app.core.templates import template_store, normalize_nl_query
+from app.core.examples import example_store
+from app.core.analyzer import dsl_analyzer
+from app.core.risk import risk_analyzer
+from app.core.approximate import approximator
+from app.core.draft_signing import draft_signer
+from app.core.metrics import DRAFT_SOURCE
+from app.core.config import settings
 from app.core.errors import LLMGenerationError
 
 router = APIRouter()
 
-@router.post("/draft", response_model=DraftResponse)
-async def create_draft(request: DraftRequest):
+def _draft_cache_key(request: DraftRequest) -> tuple:
+    return (
+        request.index,
+        normalize_nl_query(request.nl_query),
+        request.user_context.get("timezone", "UTC"),
+        PROMPT_VERSION,
+        field_catalog.version,
+        example_store.generation(request.index) if settings.EXAMPLES_ENABLED else 0,
+    )
+
+def _build_system_prompt(request: DraftRequest) -> str:
     # 1. Get Fields
     catalog_subset = field_catalog.get_index_fields(request.index)
     if not catalog_subset:
@@ -17,30 +39,151 @@ async def create_draft(request: DraftRequest):
         pass
 
     # 2. Prepare Prompt
-    # Truncate catalog if too large (MVP mitigation)
-    catalog_str = str(catalog_subset)[:10000] 
-    
-    sys_prompt = SYSTEM_PROMPT.format(
+    # Only the fields most relevant to the question, within a token budget
+    catalog_str = field_catalog.render_for_prompt(
+        request.index,
+        request.nl_query,
+        top_k=settings.PROMPT_FIELD_TOP_K,
+        token_budget=settings.PROMPT_FIELD_TOKEN_BUDGET
+    )
+
+    # 3. Nearest validated examples as few-shots, within their own token budget
+    examples_str = ""
+    if settings.EXAMPLES_ENABLED:
+        examples = example_store.render(
+            request.index,
+            request.nl_query,
+            top_k=settings.EXAMPLE_TOP_K,
+            token_budget=settings.EXAMPLE_TOKEN_BUDGET
+        )
+        if examples:
+            examples_str = EXAMPLES_SECTION.format(examples=examples)
+
+    return SYSTEM_PROMPT.format(
         index=request.index,
         timezone=request.user_context.get("timezone", "UTC"),
-        catalog=catalog_str
+        catalog=catalog_str,
+        examples=examples_str
     )
-    
-    try:
-        # 3. Call LLM
-        result = await llm_client.generate_json(
-            system_prompt=sys_prompt,
-            user_prompt=request.nl_query
+
+def _template_draft(request: DraftRequest) -> Optional[Dict[str, Any]]:
+    """Deterministic answer from a learned template, or None on a miss."""
+    if not settings.TEMPLATE_ENABLED:
+        return None
+    timezone = request.user_context.get("timezone", "UTC")
+    matched = template_store.match(request.index, timezone, request.nl_query)
+    if matched is None:
+        return None
+    dsl, template = matched
+    # Filled values must still pass the local checks the original draft passed
+    _, fixes, errors = dsl_analyzer.analyze(request.index, dsl)
+    if fixes or errors:
+        return None
+    risk = risk_analyzer.evaluate(dsl, request.index)
+    return {
+        "dsl": dsl,
+        "explanation": [f"Matched a validated template learned from: {template.source}"],
+        "confidence": 1.0,
+        "risk": {"level": risk["level"], "reasons": risk["reasons"]}
+    }
+
+async def _generate_draft(request: DraftRequest) -> dict:
+    # 4. Call LLM
+    return await llm_client.generate_json(
+        system_prompt=_build_system_prompt(request),
+        user_prompt=request.nl_query
+    )
+
+def _to_response(result: Dict[str, Any], request: DraftRequest) -> DraftResponse:
+    approximation = None
+    dsl = result.get("dsl", {})
+    if request.mode == "approximate" and dsl:
+        # Only the plan; the DSL stays exact so it can also be run as is
+        approximation = approximator.plan(dsl, request.index, risk_analyzer.evaluate(dsl, request.index))
+    return DraftResponse(
+        dsl=dsl,
+        explanation=result.get("explanation", []),
+        risk=result.get("risk", {"level": "unknown", "reasons": []}),
+        confidence=result.get("confidence", 0.0),
+        approximation=approximation,
+        draft_id=draft_signer.sign(request.index, request.user_context.get("timezone", "UTC"), request.nl_query, dsl)
+    )
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _stream_draft(request: DraftRequest) -> AsyncIterator[str]:
+    """
+    SSE events: `explanation` ({index, delta}) as tokens arrive, `dsl` as soon
+    as the object closes, then `done` with the full draft (or `error`).
+    """
+    key = _draft_cache_key(request)
+    cached, source = _template_draft(request), "template"
+    if cached is None and settings.DRAFT_CACHE_ENABLED:
+        cached, source = draft_cache.get(key), "cache"
+
+    if cached is not None:
+        result = cached
+        DRAFT_SOURCE.inc(source=source)
+        yield _sse("dsl", result.get("dsl", {}))
+        for i, step in enumerate(result.get("explanation", [])):
+            yield _sse("explanation", {"index": i, "delta": step})
+    else:
+        DRAFT_SOURCE.inc(source="llm")
+        parser = JSONObjectStreamParser(stream_arrays=("explanation",))
+        try:
+            async for chunk in llm_client.stream_json(
+                system_prompt=_build_system_prompt(request),
+                user_prompt=request.nl_query
+            ):
+                for event in parser.feed(chunk):
+                    if event[0] == "string_delta":
+                        yield _sse("explanation", {"index": event[2], "delta": event[3]})
+                    elif event[1] == "dsl":
+                        # Client can start /validate before the explanation finishes
+                        yield _sse("dsl", event[2])
+            result = parser.result()
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+            return
+
+        if settings.DRAFT_CACHE_ENABLED:
+            draft_cache.set(key, result)
+
+    yield _sse("done", _to_response(result, request).model_dump())
+
+@router.post("/draft", response_model=DraftResponse)
+async def create_draft(request: DraftRequest, response: Response):
+    if request.stream:
+        return StreamingResponse(
+            _stream_draft(request),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
         )
-        
+
+    # Known question shapes are answered from a template, without the LLM
+    result = _template_draft(request)
+    if result is not None:
+        response.headers["X-Draft-Source"] = "template"
+        DRAFT_SOURCE.inc(source="template")
+        return _to_response(result, request)
+    response.headers["X-Draft-Source"] = "llm"
+
+    try:
+        if settings.DRAFT_CACHE_ENABLED:
+            # Identical questions share one LLM call, and repeats are served from memory
+            result, status = await draft_cache.get_or_load(
+                _draft_cache_key(request),
+                lambda: _generate_draft(request)
+            )
+            DRAFT_SOURCE.inc(source={"hit": "cache", "coalesced": "coalesced"}.get(status, "llm"))
+        else:
+            result = await _generate_draft(request)
+            DRAFT_SOURCE.inc(source="llm")
+
         # 4. Parse result (already JSON)
-        return DraftResponse(
-            dsl=result.get("dsl", {}),
-            explanation=result.get("explanation", []),
-            risk=result.get("risk", {"level": "unknown", "reasons": []}),
-            confidence=result.get("confidence", 0.0)
-        )
-        
+        return _to_response(result, request)
+
     except LLMGenerationError as e:
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
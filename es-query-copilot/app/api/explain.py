@@ -1,6 +1,12 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
 from fastapi import APIRouter, HTTPException
-from app.models.dto import ExplainRequest, ExplainResponse
+from app.models.dto import (
+    ExplainRequest, ExplainResponse,
+    BatchExplainRequest, BatchExplainItem, BatchExplainResponse
+)
 from app.services.es_client import es_client
+from app.core.config import settings
 
 router = APIRouter()
 
@@ -19,3 +25,120 @@ async def explain_query(request: ExplainRequest):
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+def _unwrap(explanation: Dict[str, Any]) -> Dict[str, Any]:
+    # The ids filter shows up as a zero-score "match on required clause" next to
+    # the user's query; drop the wrapper so the result reads like /explain
+    details = [
+        d for d in explanation.get("details", [])
+        if not d.get("description", "").startswith("match on required clause")
+    ]
+    return details[0] if len(details) == 1 else explanation
+
+@router.post("/explain/batch", response_model=BatchExplainResponse)
+async def explain_batch(request: BatchExplainRequest):
+    """
+    Explains many docs in two concurrent round trips: a search restricted to
+    the ids with explain=true for the matching side, and an mget to tell
+    non-matching docs from missing ones. When mget is not possible (e.g. on a
+    wildcard pattern) an ids search resolves each doc's concrete indices
+    instead. An id found in several indices gets one result per index. Only
+    misses with explain_misses fall back to per-doc _explain,
+    EXPLAIN_CONCURRENCY at a time.
+    """
+    ids = list(dict.fromkeys(request.doc_ids))
+    if len(ids) > settings.EXPLAIN_MAX_DOCS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(ids)} > {settings.EXPLAIN_MAX_DOCS}"
+        )
+    if not ids:
+        return BatchExplainResponse(results=[])
+
+    query = request.dsl.get("query", {"match_all": {}})
+    # Behind a pattern or alias one id can exist in several indices, so hits are
+    # keyed by (_index, _id) and may outnumber the ids; the ids filter bounds them
+    window = settings.MAX_FROM_SIZE
+    body = {
+        "query": {"bool": {"must": [query], "filter": [{"ids": {"values": ids}}]}},
+        "explain": True,
+        "size": window,
+        "_source": False,
+        "track_total_hits": False,
+    }
+    search_resp, mget_resp = await asyncio.gather(
+        es_client.search(index=request.index, body=body),
+        es_client.mget(index=request.index, ids=ids, _source=False),
+        return_exceptions=True
+    )
+    if isinstance(search_resp, Exception):
+        raise HTTPException(status_code=500, detail=str(search_resp))
+
+    results: Dict[Tuple[str, str], BatchExplainItem] = {}
+    # id -> concrete indices it exists in, in the order ES reported them
+    existing: Dict[str, Dict[str, None]] = {}
+    for hit in search_resp.get("hits", {}).get("hits", []):
+        key = (hit["_index"], hit["_id"])
+        existing.setdefault(hit["_id"], {})[hit["_index"]] = None
+        results.setdefault(key, BatchExplainItem(
+            doc_id=hit["_id"], index=hit["_index"], found=True,
+            matched=True, explanation=_unwrap(hit.get("_explanation", {}))
+        ))
+
+    if not isinstance(mget_resp, Exception):
+        docs = [d for d in mget_resp.get("docs", []) if d.get("found")]
+    else:
+        # mget needs a concrete index; _explain does too, so look every id up
+        # (a matched id may also exist, unmatched, in another index)
+        try:
+            ids_resp = await es_client.search(index=request.index, body={
+                "query": {"ids": {"values": ids}},
+                "size": window,
+                "_source": False,
+                "track_total_hits": False,
+            })
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        docs = ids_resp.get("hits", {}).get("hits", [])
+    for doc in docs:
+        existing.setdefault(doc["_id"], {})[doc["_index"]] = None
+
+    order: List[Tuple[str, str]] = []
+    fallback: List[Tuple[str, str]] = []
+    for doc_id in ids:
+        if doc_id not in existing:
+            order.append(("", doc_id))
+            results[("", doc_id)] = BatchExplainItem(doc_id=doc_id, found=False, matched=False, explanation={})
+            continue
+        for index in existing[doc_id]:
+            key = (index, doc_id)
+            order.append(key)
+            if key in results:
+                continue
+            if request.explain_misses:
+                fallback.append(key)
+            else:
+                results[key] = BatchExplainItem(
+                    doc_id=doc_id, index=index, found=True, matched=False, explanation={}
+                )
+
+    semaphore = asyncio.Semaphore(max(1, settings.EXPLAIN_CONCURRENCY))
+
+    async def explain_one(index: str, doc_id: str) -> BatchExplainItem:
+        async with semaphore:
+            try:
+                resp = await es_client.explain(index=index, id=doc_id, body={"query": query})
+            except Exception as e:
+                return BatchExplainItem(
+                    doc_id=doc_id, index=index, found=True,
+                    matched=False, explanation={}, error=str(e)
+                )
+        return BatchExplainItem(
+            doc_id=doc_id, index=resp.get("_index", index), found=True,
+            matched=resp.get("matched", False), explanation=resp.get("explanation", {})
+        )
+
+    items = await asyncio.gather(*(explain_one(index, doc_id) for index, doc_id in fallback))
+    results.update(zip(fallback, items))
+
+    return BatchExplainResponse(results=[results[key] for key in order])
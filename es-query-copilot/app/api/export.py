@@ -0,0 +1,174 @@
+import asyncio
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from app.models.dto import ExportRequest
+from app.api.run import _tenant, _too_busy
+from app.core.risk import risk_analyzer
+from app.core.admission import admission, weight_for, AdmissionRejected
+from app.core.config import settings
+from app.services.es_client import es_client
+
+router = APIRouter()
+
+_SLICE_DONE = object()
+_PIT_KEEP_ALIVE = "2m"
+
+def _flatten(source: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    flat = {}
+    for key, value in source.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        else:
+            flat[name] = value
+    return flat
+
+def _csv_cell(value: Any) -> Any:
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+async def _merge_slices(pages: List[AsyncIterator[List[dict]]], queue_size: int) -> AsyncIterator[List[dict]]:
+    """
+    Runs slice iterators concurrently. The bounded queue is the backpressure:
+    producers block once `queue_size` pages are waiting for the client.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def pump(gen):
+        try:
+            async for hits in gen:
+                await queue.put(hits)
+            await queue.put(_SLICE_DONE)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await gen.aclose()
+
+    tasks = [asyncio.create_task(pump(gen)) for gen in pages]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            item = await queue.get()
+            if item is _SLICE_DONE:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _admitted(pages: AsyncIterator[List[dict]], tenant: str, weight: float) -> AsyncIterator[List[dict]]:
+    """
+    Holds an admission slot around each page fetch, like one /run search. The
+    slot is released while the page waits for the client, so a slow reader
+    does not keep ES capacity reserved.
+    """
+    try:
+        while True:
+            async with admission.slot(tenant, weight):
+                try:
+                    hits = await pages.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield hits
+    finally:
+        await pages.aclose()
+
+async def _export_stream(request: ExportRequest, pit_id: str, tenant: str, weight: float) -> AsyncIterator[bytes]:
+    body = dict(request.dsl)
+    if request.fields:
+        body["_source"] = request.fields
+    slices = max(1, min(request.slices, settings.EXPORT_MAX_SLICES))
+    limit = min(request.max_docs or settings.EXPORT_MAX_DOCS, settings.EXPORT_MAX_DOCS)
+
+    # Every slice fetches concurrently, so each holds its own weighted slot
+    if slices == 1:
+        pages = _admitted(
+            es_client.iter_pit_pages(pit_id, body, settings.EXPORT_PAGE_SIZE, _PIT_KEEP_ALIVE), tenant, weight
+        )
+    else:
+        pages = _merge_slices(
+            [
+                _admitted(
+                    es_client.iter_pit_pages(pit_id, body, settings.EXPORT_PAGE_SIZE, _PIT_KEEP_ALIVE, i, slices),
+                    tenant, weight
+                )
+                for i in range(slices)
+            ],
+            queue_size=slices
+        )
+
+    columns: Optional[List[str]] = list(request.fields) if request.fields else None
+    sent = 0
+    try:
+        async for hits in pages:
+            hits = hits[:limit - sent]
+            out = io.StringIO()
+            if request.format == "csv":
+                writer = csv.writer(out)
+                if sent == 0:
+                    if columns is None:
+                        # No explicit fields: take the columns from the first document
+                        columns = list(_flatten(hits[0].get("_source", {})).keys())
+                    writer.writerow(["_id"] + columns)
+                for hit in hits:
+                    flat = _flatten(hit.get("_source", {}))
+                    writer.writerow([hit.get("_id")] + [_csv_cell(flat.get(c)) for c in columns])
+            else:
+                for hit in hits:
+                    out.write(json.dumps({"_id": hit.get("_id"), **hit.get("_source", {})}, ensure_ascii=False))
+                    out.write("\n")
+            sent += len(hits)
+            yield out.getvalue().encode("utf-8")
+            if sent >= limit:
+                break
+    except Exception as e:
+        # Headers are already sent; the best we can do is mark the stream as truncated.
+        # CSV has no room for a marker that cannot be mistaken for data, so abort the
+        # response instead: the client sees an incomplete transfer, not a short file
+        if request.format != "ndjson":
+            raise
+        yield (json.dumps({"_error": str(e)}) + "\n").encode("utf-8")
+    finally:
+        await pages.aclose()
+        await es_client.close_point_in_time(pit_id)
+
+@router.post("/export")
+async def export_query(request: ExportRequest, http_request: Request):
+    # 1. Risk Check (exports ignore size/from, so only query shape matters)
+    risk_dsl = {k: v for k, v in request.dsl.items() if k not in ("size", "from")}
+    if settings.RISK_CALIBRATION_ENABLED:
+        await risk_analyzer.calibrate(request.index)
+    risk = risk_analyzer.evaluate(risk_dsl, request.index)
+    if risk["level"] == "high":
+        raise HTTPException(
+            status_code=403,
+            detail=f"High risk query blocked: {risk['reasons']}"
+        )
+
+    # 2. Open the PIT up front so connection errors (and a full admission
+    # queue) still get a proper status code
+    tenant = _tenant(http_request)
+    weight = weight_for(risk)
+    try:
+        async with admission.slot(tenant, weight):
+            pit_id = await es_client.open_point_in_time(request.index, keep_alive=_PIT_KEEP_ALIVE)
+    except AdmissionRejected as e:
+        raise _too_busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    media_type = "text/csv" if request.format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export_stream(request, pit_id, tenant, weight),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=export.{request.format}"}
+    )
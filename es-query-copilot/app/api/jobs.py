@@ -0,0 +1,126 @@
+from typing import Any, Dict
+from elasticsearch import NotFoundError
+from fastapi import APIRouter, HTTPException
+from app.models.dto import JobSubmitRequest, JobResponse
+from app.core.risk import risk_analyzer
+from app.core.optimizer import dsl_optimizer
+from app.core.job_store import job_store
+from app.core.config import settings
+from app.core.errors import in_cause_chain
+from app.services.es_client import es_client
+
+router = APIRouter()
+
+def _job_response(job_id: str, job: Dict[str, Any], resp: Dict[str, Any]) -> JobResponse:
+    """Maps an _async_search get/submit (or status) body onto JobResponse."""
+    resp = getattr(resp, "body", resp)
+    result = resp.get("response", {})
+    error = resp.get("error")
+    if resp.get("is_running", False):
+        state = "running"
+    elif error or resp.get("completion_status", 200) >= 400:
+        state = "failed"
+    else:
+        state = "completed"
+    if isinstance(error, dict):
+        error = error.get("reason", str(error))
+    return JobResponse(
+        job_id=job_id,
+        state=state,
+        is_partial=resp.get("is_partial", False),
+        took=result.get("took"),
+        hits=result.get("hits", {}),
+        aggs=result.get("aggregations", {}),
+        shards=result.get("_shards", resp.get("_shards", {})),
+        warnings=job["warnings"],
+        error=error
+    )
+
+def _wait_timeout(wait_ms: int) -> str:
+    # Each waiting request holds a connection open; cap how long that can be
+    return f"{max(0, min(wait_ms, settings.JOB_MAX_WAIT_MS))}ms"
+
+async def _get_job(job_id: str, touch: bool = True) -> Dict[str, Any]:
+    job = await job_store.get(job_id, touch=touch)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job expired or unknown")
+    return job
+
+def _is_not_found(exc: BaseException) -> bool:
+    return in_cause_chain(exc, lambda e: isinstance(e, NotFoundError))
+
+async def _es_failure(job_id: str, exc: Exception) -> HTTPException:
+    if _is_not_found(exc):
+        # ES already dropped it (expired or deleted elsewhere)
+        await job_store.release(job_id)
+        return HTTPException(status_code=404, detail=str(exc))
+    # Transient ES trouble: keep the job so the caller can poll again
+    return HTTPException(status_code=500, detail=str(exc))
+
+@router.post("/jobs", response_model=JobResponse)
+async def submit_job(request: JobSubmitRequest):
+    """
+    Runs a heavy query as an ES async search instead of on the request path.
+    Fast queries come back completed within wait_ms; the rest return a
+    job_id to poll.
+    """
+    risk = risk_analyzer.evaluate(request.dsl, request.index)
+    if risk["level"] == "high":
+        raise HTTPException(
+            status_code=403,
+            detail=f"High risk query blocked: {risk['reasons']}"
+        )
+
+    dsl = dict(request.dsl)
+    if dsl.get("size", 10) > settings.MAX_SIZE:
+        dsl["size"] = settings.MAX_SIZE
+    warnings = []
+    if request.optimize != "off":
+        dsl, warnings = dsl_optimizer.optimize(dsl, dry_run=request.optimize == "dry_run")
+
+    try:
+        resp = await es_client.submit_async_search(
+            request.index, dsl,
+            wait_for_completion_timeout=_wait_timeout(request.wait_ms),
+            keep_alive=job_store.keep_alive
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    job = {"es_id": resp["id"], "index": request.index, "warnings": warnings}
+    job_id = await job_store.create(job)
+    return _job_response(job_id, job, resp)
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, wait_ms: int = 0):
+    """Results so far (partial while running); waits up to wait_ms for completion."""
+    job = await _get_job(job_id)
+    try:
+        resp = await es_client.get_async_search(
+            job["es_id"],
+            wait_for_completion_timeout=_wait_timeout(wait_ms),
+            keep_alive=job_store.keep_alive
+        )
+    except Exception as e:
+        raise await _es_failure(job_id, e)
+    return _job_response(job_id, job, resp)
+
+@router.get("/jobs/{job_id}/status", response_model=JobResponse)
+async def get_job_status(job_id: str):
+    """
+    Cheap progress poll: state and shard counts, no hits or aggregations.
+    The status API cannot extend the ES keep_alive, so polling it does not
+    extend the job's local TTL either.
+    """
+    job = await _get_job(job_id, touch=False)
+    try:
+        resp = await es_client.async_search_status(job["es_id"])
+    except Exception as e:
+        raise await _es_failure(job_id, e)
+    return _job_response(job_id, job, resp)
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    if not await job_store.release(job_id):
+        raise HTTPException(status_code=404, detail="Job expired or unknown")
+    return {"job_id": job_id, "cancelled": True}
@@ -0,0 +1,59 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.core.metrics import registry
+from app.core.cache import draft_cache, search_cache
+from app.core.templates import template_store
+from app.services.llm_client import llm_client
+from app.core.admission import admission
+
+router = APIRouter()
+
+_CACHE_COUNTERS = ("hits", "misses", "coalesced", "evictions", "expirations")
+
+def _cache_metrics():
+    caches = {"draft": draft_cache.stats(), "search": search_cache.stats()}
+    families = [
+        (f"copilot_cache_{name}_total", "counter", f"Cache {name} by cache.",
+         [({"cache": cache}, stats[name]) for cache, stats in caches.items()])
+        for name in _CACHE_COUNTERS
+    ]
+    families.append(("copilot_cache_entries", "gauge", "Entries held per cache.",
+                     [({"cache": cache}, stats["size"]) for cache, stats in caches.items()]))
+    families.append(("copilot_cache_bytes", "gauge", "Approximate bytes held per cache.",
+                     [({"cache": cache}, stats["bytes"]) for cache, stats in caches.items()]))
+    template_stats = template_store.stats()
+    families.append(("copilot_template_lookups_total", "counter", "Template matcher lookups by result.",
+                     [({"result": "hit"}, template_stats["hits"]), ({"result": "miss"}, template_stats["misses"])]))
+    return families
+
+def _llm_metrics():
+    stats = llm_client.stats()
+    states = {"closed": 0, "half_open": 1, "open": 2}
+    return [
+        ("copilot_llm_in_flight", "gauge", "LLM calls holding a concurrency slot.", [({}, stats["in_flight"])]),
+        ("copilot_llm_waiting", "gauge", "LLM calls queued for a concurrency slot.", [({}, stats["waiting"])]),
+        ("copilot_llm_queue_wait_seconds_total", "counter", "Total time spent queued for an LLM slot.",
+         [({}, stats["queue_wait_total_s"])]),
+        ("copilot_llm_hedged_total", "counter", "Hedged LLM requests.", [({}, stats["hedged"])]),
+        ("copilot_llm_failovers_total", "counter", "LLM failovers to the next backend.", [({}, stats["failovers"])]),
+        ("copilot_llm_breaker_state", "gauge", "Circuit breaker per backend (0 closed, 1 half-open, 2 open).",
+         [({"backend": name}, states[b["state"]]) for name, b in stats["backends"].items()]),
+    ]
+
+def _admission_metrics():
+    stats = admission.stats()
+    return [
+        ("copilot_admission_limit", "gauge", "Current adaptive ES slot limit.", [({}, stats["limit"])]),
+        ("copilot_admission_in_use", "gauge", "ES slots held by running searches.", [({}, stats["in_use"])]),
+        ("copilot_admission_waiting", "gauge", "Searches queued for a slot.", [({}, stats["waiting"])]),
+        ("copilot_admission_rejected_total", "counter", "Searches refused with 429 by reason.",
+         [({"reason": "queue_full"}, stats["rejected_full"]), ({"reason": "deadline"}, stats["rejected_deadline"])]),
+    ]
+
+registry.register_collector(_cache_metrics)
+registry.register_collector(_llm_metrics)
+registry.register_collector(_admission_metrics)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
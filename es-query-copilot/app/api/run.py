@@ -1,50 +1,401 @@
-from fastapi import APIRouter, HTTPException
-from app.models.dto import RunRequest, RunResponse
+import asyncio
+import copy
+import json
+import math
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from app.models.dto import RunRequest, RunResponse, BatchRunRequest, BatchRunResponse, BatchRunItem
 from app.core.risk import risk_analyzer
 from app.core.errors import HighRiskBlockedError
-from app.services.es_client import es_client
+from app.core.cursor_store import cursor_store
+from app.core.cache import search_cache, dsl_fingerprint, search_ttl, Loaded
+from app.core.optimizer import dsl_optimizer
+from app.core.columnar import AggTable, MEDIA_TYPES, paginated_composite
+from app.core.approximate import approximator
+from app.core.admission import admission, weight_for, AdmissionRejected
+from app.core.metrics import SEARCH_CACHE
+from app.core.field_catalog import field_catalog
+from app.services.es_client import es_client, with_shard_doc_tiebreaker
 from app.core.config import settings
 
 router = APIRouter()
 
-@router.post("/run", response_model=RunResponse)
-async def run_query(request: RunRequest):
+# What /run actually returns; everything else (_shards, per-hit metadata) is
+# dropped by ES before it goes on the wire
+_HITS_FILTER = ("hits.hits._index", "hits.hits._id", "hits.hits._score", "hits.hits._source",
+                "hits.hits.fields", "hits.hits.highlight", "hits.hits.sort")
+
+def _tenant(http_request: Request) -> str:
+    return http_request.headers.get(settings.ADMISSION_TENANT_HEADER) or "default"
+
+def _too_busy(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+
+def _filter_path(dsl: Dict[str, Any]) -> str:
+    paths = ["took", "timed_out", "hits.total", "hits.max_score", "aggregations"]
+    if dsl.get("size", 10) != 0:
+        paths.extend(_HITS_FILTER)
+    return ",".join(paths)
+
+def _pit_keep_alive() -> str:
+    return f"{int(settings.CURSOR_TTL_S)}s"
+
+async def _start_pagination(request: RunRequest, weight: float) -> Dict[str, Any]:
+    body = copy.deepcopy(request.dsl)
+    body.pop("from", None)
+    body["size"] = min(body.get("size", 10), settings.MAX_SIZE)
+    body["sort"] = with_shard_doc_tiebreaker(body.get("sort"))
+    pit_id = await es_client.open_point_in_time(request.index, keep_alive=_pit_keep_alive())
+    # Starts in flight: the first page runs right after the cursor is created
+    return {
+        "body": body, "pit_id": pit_id, "search_after": None, "lock": asyncio.Lock(), "weight": weight,
+        "in_flight": 1, "closed": False,
+    }
+
+async def _run_page(state: Dict[str, Any], timeout_ms: int, tenant: str) -> Dict[str, Any]:
+    body = dict(state["body"])
+    body["pit"] = {"id": state["pit_id"], "keep_alive": _pit_keep_alive()}
+    if state["search_after"] is not None:
+        body["search_after"] = state["search_after"]
+        # Aggregations only need computing once, on the first page
+        body.pop("aggs", None)
+        body.pop("aggregations", None)
+
+    async with admission.slot(tenant, state["weight"]) as ticket:
+        resp = await es_client.search(index=None, body=body, timeout=f"{timeout_ms}ms")
+        ticket.observe(resp)
+
+    # ES may hand back a new PIT id; always continue with the latest
+    state["pit_id"] = resp.get("pit_id", state["pit_id"])
+    hits = resp.get("hits", {}).get("hits", [])
+    # An empty page keeps the position, so a late retry never restarts at page one
+    if hits:
+        state["search_after"] = hits[-1]["sort"]
+    return resp
+
+async def _run_cursor_page(token: str, state: Dict[str, Any], timeout_ms: int, tenant: str) -> RunResponse:
+    """Runs the next page while holding the cursor in flight (safe from eviction)."""
+    try:
+        async with state["lock"]:
+            if state["closed"]:
+                # Finished, expired or evicted while this request waited for the lock
+                raise HTTPException(status_code=410, detail="Cursor expired or unknown")
+            resp = await _run_page(state, timeout_ms, tenant)
+            return await _page_response(token, state, resp)
+    finally:
+        state["in_flight"] -= 1
+
+async def _page_response(token: str, state: Dict[str, Any], resp: Dict[str, Any]) -> RunResponse:
+    hits = resp.get("hits", {})
+    page = hits.get("hits", [])
+    # A short page means there is nothing left; free the PIT right away
+    has_more = bool(page) and len(page) >= state["body"]["size"]
+    if not has_more:
+        await cursor_store.release(token)
+
+    return RunResponse(
+        took=resp.get("took", 0),
+        timed_out=resp.get("timed_out", False),
+        hits=hits,
+        aggs=resp.get("aggregations", {}),
+        warnings=[],
+        cursor=token if has_more else None
+    )
+
+async def _run_columnar(request: RunRequest, dsl: Dict[str, Any], tenant: str, weight: float) -> Response:
+    """
+    Aggregations as a table (one row per leaf bucket). A lone composite agg is
+    paged through after_key, each page appended to the same table.
+    """
+    aggs = dsl.get("aggs") or dsl.get("aggregations") or {}
+    composite = paginated_composite(aggs)
+    agg_key = "aggs" if "aggs" in dsl else "aggregations"
+
+    table = AggTable()
+    body, pages, truncated = dsl, 0, False
+    while True:
+        async with admission.slot(tenant, weight) as ticket:
+            resp = await es_client.search(index=request.index, body=body, timeout=f"{request.timeout_ms}ms")
+            ticket.observe(resp)
+        resp = getattr(resp, "body", resp)
+        table.append(aggs, resp.get("aggregations", {}))
+        pages += 1
+        if composite is None:
+            break
+        result = resp.get("aggregations", {}).get(composite, {})
+        after_key = result.get("after_key")
+        if after_key is None or not result.get("buckets"):
+            break
+        if pages >= settings.COLUMNAR_MAX_PAGES or table.num_rows >= settings.COLUMNAR_MAX_ROWS:
+            truncated = True
+            break
+        spec = copy.deepcopy(aggs[composite])
+        spec["composite"]["after"] = after_key
+        # Hits only matter once; later pages only advance the composite
+        body = {**dsl, agg_key: {composite: spec}, "size": 0}
+
+    headers = {"X-Columnar-Pages": str(pages), "X-Columnar-Rows": str(table.num_rows)}
+    if truncated:
+        headers["X-Columnar-Truncated"] = "true"
+    if request.format != "arrow":
+        headers["Content-Disposition"] = f"attachment; filename=aggs.{request.format}"
+    return Response(table.encode(request.format), media_type=MEDIA_TYPES[request.format], headers=headers)
+
+@router.post("/run", response_model=RunResponse, response_class=ORJSONResponse)
+async def run_query(request: RunRequest, http_request: Request, response: Response):
+    tenant = _tenant(http_request)
+    # 0. Cursor continuation: state lives server-side, risk was checked on page one
+    if request.cursor:
+        state = await cursor_store.get(request.cursor)
+        if state is None:
+            raise HTTPException(status_code=410, detail="Cursor expired or unknown")
+        state["in_flight"] += 1
+        try:
+            return await _run_cursor_page(request.cursor, state, request.timeout_ms, tenant)
+        except HTTPException:
+            raise
+        except AdmissionRejected as e:
+            # The cursor stays valid; the client retries the same page
+            raise _too_busy(e)
+        except Exception as e:
+            await cursor_store.release(request.cursor)
+            raise HTTPException(status_code=500, detail=str(e))
+
     # 1. Risk Check
-    risk = risk_analyzer.evaluate(request.dsl)
-    if risk["level"] == "high":
+    # Cursor paging ignores "from", so it must not count towards deep-paging risk
+    risk_dsl = {k: v for k, v in request.dsl.items() if k != "from"} if request.paginate else request.dsl
+    if settings.RISK_CALIBRATION_ENABLED:
+        await risk_analyzer.calibrate(request.index)
+    risk = risk_analyzer.evaluate(risk_dsl, request.index)
+    # Approximate runs are judged on their sampled cost further down
+    approximate = request.mode == "approximate" and not request.paginate
+    if risk["level"] == "high" and not approximate:
         raise HTTPException(
-            status_code=403, 
+            status_code=403,
             detail=f"High risk query blocked: {risk['reasons']}"
         )
-    
+    # ES slots this query holds while it runs (admission control)
+    weight = weight_for(risk)
+
     # 2. Deep Paging Handling (PIT + search_after)
-    # MVP Simplified: We won't fully implement automatic PIT loop here as it requires
-    # keeping state or return cursor. For MVP, we'll just check limits and
-    # error if too deep without PIT, OR if user requested simple page, we run it.
-    
+    # With paginate=true we open a PIT and hand back an opaque cursor; follow-up
+    # calls page in O(page) instead of from+size.
+    if request.paginate:
+        token = None
+        try:
+            state = await _start_pagination(request, weight)
+            token = await cursor_store.create(state)
+            return await _run_cursor_page(token, state, request.timeout_ms, tenant)
+        except AdmissionRejected as e:
+            if token is not None:
+                await cursor_store.release(token)
+            raise _too_busy(e)
+        except Exception as e:
+            if token is not None:
+                await cursor_store.release(token)
+            raise HTTPException(status_code=500, detail=str(e))
+
+    if approximate and (request.passthrough or request.format != "json"):
+        raise HTTPException(status_code=400, detail="mode=approximate is only available for JSON responses")
+    if request.format != "json" and not (request.dsl.get("aggs") or request.dsl.get("aggregations")):
+        raise HTTPException(status_code=400, detail=f"format={request.format} needs aggregations in the DSL")
+
     # If standard search
     try:
         size = request.dsl.get("size", 10)
         from_ = request.dsl.get("from", 0)
-        
+
         # Enforce max size if not set
         if size > settings.MAX_SIZE:
              request.dsl["size"] = settings.MAX_SIZE
-             
-        # Execute
-        resp = await es_client.search(
-            index=request.index,
-            body=request.dsl,
-            timeout=f"{request.timeout_ms}ms"
-        )
-        
+
+        # 3. Rule-based performance rewrites (reported back as warnings)
+        dsl, warnings = request.dsl, []
+        if request.optimize != "off":
+            dsl, warnings = dsl_optimizer.optimize(request.dsl, dry_run=request.optimize == "dry_run")
+        if request.fields is not None:
+            dsl = {**dsl, "_source": {"includes": request.fields}}
+
+        if request.format != "json":
+            return await _run_columnar(request, dsl, tenant, weight)
+
+        if request.passthrough:
+            # ES bytes go straight to the client: no parse, no RunResponse, no cache
+            # The slot covers ES producing the response, not the client reading it
+            async with admission.slot(tenant, weight):
+                raw = await es_client.search_raw(
+                    request.index, dsl,
+                    filter_path=_filter_path(dsl),
+                    timeout=f"{request.timeout_ms}ms"
+                )
+            response.headers["X-Search-Cache"] = "bypass"
+            SEARCH_CACHE.inc(status="bypass")
+            headers = dict(response.headers)
+            if warnings:
+                # No body to carry them in; JSON keeps the header ASCII
+                headers["X-Run-Warnings"] = json.dumps(warnings)
+            return StreamingResponse(
+                raw.aiter_bytes(), media_type="application/json", headers=headers,
+                background=BackgroundTask(raw.aclose)
+            )
+
+        # 4. Approximation: random_sampler / terminate_after, chosen from the risk estimate
+        plan = None
+        run_cost = risk["estimated_cost"]
+        if approximate:
+            plan = approximator.plan(dsl, request.index, risk)
+            run_cost = plan.get("estimated_cost", run_cost)
+            if risk["level"] == "high" and run_cost >= settings.RISK_HIGH_COST:
+                raise HTTPException(
+                    status_code=403,
+                    detail=f"High risk query blocked: {risk['reasons']}"
+                )
+            warnings.append(f"approximate ({plan['method']}): {plan['reason']}")
+            dsl = approximator.rewrite(dsl, plan)
+
+        async def execute():
+            async with admission.slot(tenant, weight) as ticket:
+                resp = await es_client.search(
+                    index=request.index,
+                    body=dsl,
+                    timeout=f"{request.timeout_ms}ms"
+                )
+                ticket.observe(resp)
+            # ES bodies are not compressed, so Content-Length is the bytes we cache
+            meta = getattr(resp, "meta", None)
+            length = meta.headers.get("content-length") if meta is not None else None
+            resp = getattr(resp, "body", resp)
+            # An early-terminated search did an unknown fraction of its estimated work
+            if not resp.get("timed_out", False) and "terminate_after" not in dsl:
+                approximator.observe(request.index, run_cost, resp.get("took", 0))
+            result = approximator.finish(resp, plan) if plan else resp
+            # Partial results must not be served to later callers
+            return Loaded(result, store=not resp.get("timed_out", False),
+                          size=int(length) if length else None)
+
+        # Execute (through the result cache unless the client opts out)
+        no_cache = "no-cache" in http_request.headers.get("cache-control", "")
+        if settings.SEARCH_CACHE_ENABLED and not no_cache:
+            key = (request.index, dsl_fingerprint(dsl), field_catalog.version)
+            resp, cache_status = await search_cache.get_or_load(key, execute, ttl=search_ttl(dsl))
+        else:
+            resp, cache_status = (await execute()).value, "bypass"
+        response.headers["X-Search-Cache"] = cache_status
+        SEARCH_CACHE.inc(status=cache_status)
+
         return RunResponse(
             took=resp.get("took", 0),
             timed_out=resp.get("timed_out", False),
             hits=resp.get("hits", {}),
             aggs=resp.get("aggregations", {}),
-            warnings=[]
+            warnings=warnings,
+            approximation=resp.get("approximation")
         )
-        
+
+    except HTTPException:
+        raise
+    except AdmissionRejected as e:
+        raise _too_busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+def _batch_unsupported(item: RunRequest) -> Optional[str]:
+    """Names the first option a batch item sets that only /run can honor."""
+    if item.paginate or item.cursor:
+        return "Cursor pagination"
+    if item.passthrough:
+        return "passthrough"
+    if item.format != "json":
+        return f"format={item.format}"
+    if item.mode != "exact":
+        return f"mode={item.mode}"
+    return None
+
+def _batch_result(resp: Dict[str, Any], warnings: List[str]) -> RunResponse:
+    return RunResponse(
+        took=resp.get("took", 0),
+        timed_out=resp.get("timed_out", False),
+        hits=resp.get("hits", {}),
+        aggs=resp.get("aggregations", {}),
+        warnings=warnings
+    )
+
+@router.post("/run/batch", response_model=BatchRunResponse, response_class=ORJSONResponse)
+async def run_batch(request: BatchRunRequest, http_request: Request):
+    """Risk-checks every item, then sends the allowed ones to ES in a single _msearch."""
+    if len(request.requests) > settings.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(request.requests)} > {settings.MAX_BATCH_SIZE}"
+        )
+
+    results: List[Optional[BatchRunItem]] = [None] * len(request.requests)
+    searches = []
+    positions = []
+    cache_keys = []
+    weight = 0.0
+    use_cache = settings.SEARCH_CACHE_ENABLED and "no-cache" not in http_request.headers.get("cache-control", "")
+
+    # 1. Risk Check per item
+    for i, item in enumerate(request.requests):
+        unsupported = _batch_unsupported(item)
+        if unsupported:
+            results[i] = BatchRunItem(status=400, error=f"{unsupported} is not supported in batch; use /run")
+            continue
+        risk = risk_analyzer.evaluate(item.dsl, item.index)
+        if risk["level"] == "high":
+            results[i] = BatchRunItem(status=403, error=f"High risk query blocked: {risk['reasons']}")
+            continue
+
+        body = dict(item.dsl)
+        if body.get("size", 10) > settings.MAX_SIZE:
+            body["size"] = settings.MAX_SIZE
+        warnings = []
+        if item.optimize != "off":
+            body, warnings = dsl_optimizer.optimize(body, dry_run=item.optimize == "dry_run")
+        if item.fields is not None:
+            body = {**body, "_source": {"includes": item.fields}}
+
+        key = (item.index, dsl_fingerprint(body), field_catalog.version) if use_cache else None
+        cached = search_cache.get(key) if key else None
+        if cached is not None:
+            SEARCH_CACHE.inc(status="hit")
+            results[i] = BatchRunItem(status=200, result=_batch_result(cached, warnings))
+            continue
+        SEARCH_CACHE.inc(status="miss" if key else "bypass")
+
+        searches.append((item.index, {**body, "timeout": f"{item.timeout_ms}ms"}))
+        positions.append(i)
+        cache_keys.append((key, body, warnings))
+        weight += weight_for(risk)
+
+    # 2. One round trip for everything allowed
+    took = 0
+    if searches:
+        try:
+            # The whole batch is admitted as one unit holding its items' combined
+            # weight, capped at the limit so a big batch does not starve behind it
+            async with admission.slot(_tenant(http_request), min(weight, admission.limit)) as ticket:
+                resp = await es_client.msearch(searches)
+                ticket.observe(resp)
+        except AdmissionRejected as e:
+            raise _too_busy(e)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        took = resp.get("took", 0)
+
+        for i, (key, body, warnings), item_resp in zip(positions, cache_keys, resp.get("responses", [])):
+            if "error" in item_resp:
+                error = item_resp["error"]
+                reason = error.get("reason", str(error)) if isinstance(error, dict) else str(error)
+                results[i] = BatchRunItem(status=item_resp.get("status", 500), error=reason)
+                continue
+            if key and not item_resp.get("timed_out", False):
+                search_cache.set(key, item_resp, search_ttl(body))
+            results[i] = BatchRunItem(status=200, result=_batch_result(item_resp, warnings))
+
+    # Defensive: ES returned fewer responses than searches sent
+    results = [r or BatchRunItem(status=500, error="Missing response from ES") for r in results]
+    return BatchRunResponse(took=took, results=results)
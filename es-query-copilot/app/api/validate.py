@@ -1,20 +1,36 @@
 from fastapi import APIRouter
 from app.models.dto import ValidateRequest, ValidateResponse
 from app.core.fixer import dsl_fixer
+from app.core.templates import template_store
+from app.core.examples import example_store
+from app.core.draft_signing import draft_signer
+from app.core.config import settings
 
 router = APIRouter()
 
 @router.post("/validate", response_model=ValidateResponse)
 async def validate_query(request: ValidateRequest):
-    is_valid, final_dsl, errors, was_fixed = await dsl_fixer.validate_and_fix(
+    is_valid, final_dsl, errors, was_fixed, warnings = await dsl_fixer.validate_and_fix(
         request.index, 
         request.dsl
     )
-    
+
+    # Validated drafts teach the /draft template fast path and few-shot examples,
+    # but only DSL that /draft itself produced for this question
+    timezone = request.user_context.get("timezone", "UTC")
+    drafted = bool(request.nl_query and request.draft_id) and draft_signer.verify(
+        request.draft_id, request.index, timezone, request.nl_query, request.dsl
+    )
+    if is_valid and drafted:
+        if settings.TEMPLATE_ENABLED:
+            template_store.learn(request.index, timezone, request.nl_query, final_dsl)
+        if settings.EXAMPLES_ENABLED:
+            example_store.add(request.index, request.nl_query, final_dsl)
+
     return ValidateResponse(
         valid=is_valid,
         errors=errors,
         auto_fixed=was_fixed,
         fixed_dsl=final_dsl if was_fixed else None,
-        warnings=[]
+        warnings=warnings
     )
@@ -0,0 +1,165 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+from app.core.config import settings
+from app.core.errors import AppError, in_cause_chain
+
+class AdmissionRejected(AppError):
+    """Raised when a query cannot get an ES slot: queue full or queue deadline passed."""
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        self.retry_after = retry_after
+        super().__init__(reason)
+
+def weight_for(risk: Dict[str, Any]) -> float:
+    """Slots a query occupies: 1 for trivial ones, up to 5 at the top of the risk scale."""
+    return 1.0 + max(0, min(100, risk.get("score", 0))) / 25.0
+
+def _is_overload(exc: BaseException) -> bool:
+    return in_cause_chain(
+        exc, lambda e: getattr(e, "status_code", None) == 429 or "es_rejected_execution_exception" in str(e)
+    )
+
+class Ticket:
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.took_ms: Optional[float] = None
+        self.timed_out = False
+
+    def observe(self, resp: Any):
+        """Records ES `took` / `timed_out` from a search response for the adaptive limit."""
+        if hasattr(resp, "get"):
+            took = resp.get("took")
+            self.took_ms = took if isinstance(took, (int, float)) else None
+            self.timed_out = bool(resp.get("timed_out", False))
+
+class _Waiter:
+    __slots__ = ("weight", "future")
+
+    def __init__(self, weight: float, future: asyncio.Future):
+        self.weight = weight
+        self.future = future
+
+class AdmissionController:
+    """
+    Weighted concurrency limit in front of ES searches. Each query holds
+    weight_for(risk) slots while it runs; callers beyond the limit wait in a
+    per-tenant queue served round-robin, are rejected after
+    ADMISSION_QUEUE_TIMEOUT_S, and are refused outright when the queue is
+    full. The limit itself is AIMD: it grows by about one slot per limit's
+    worth of fast searches and shrinks by ADMISSION_BACKOFF when ES is slow
+    (`took` above target, timeouts) or rejects work.
+    """
+    def __init__(self):
+        self.limit = float(settings.ADMISSION_INITIAL_LIMIT)
+        self.in_use = 0.0
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._last_decrease = 0.0
+        self._stats = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_deadline": 0}
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "limit": self.limit, "in_use": self.in_use, "waiting": self.queued()}
+
+    def _fits(self, weight: float) -> bool:
+        # A query heavier than the whole limit still runs, alone
+        return self.in_use + weight <= self.limit or self.in_use == 0
+
+    def _dispatch(self):
+        # One grant per tenant per pass; stop at the first head that does not
+        # fit so heavy queries are not overtaken forever
+        while self._queues:
+            tenant, queue = next(iter(self._queues.items()))
+            waiter = queue[0]
+            if not waiter.future.done() and not self._fits(waiter.weight):
+                return
+            queue.popleft()
+            if queue:
+                self._queues.move_to_end(tenant)
+            else:
+                del self._queues[tenant]
+            if not waiter.future.done():
+                self.in_use += waiter.weight
+                waiter.future.set_result(None)
+
+    def _remove(self, tenant: str, waiter: _Waiter):
+        queue = self._queues.get(tenant)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[tenant]
+
+    async def acquire(self, tenant: str, weight: float) -> Ticket:
+        if not self._queues and self._fits(weight):
+            self.in_use += weight
+            self._stats["admitted"] += 1
+            return Ticket(weight)
+
+        queue = self._queues.get(tenant)
+        if self.queued() >= settings.ADMISSION_MAX_QUEUE or \
+                (queue is not None and len(queue) >= settings.ADMISSION_MAX_QUEUE_PER_TENANT):
+            self._stats["rejected_full"] += 1
+            raise AdmissionRejected("Search queue is full; retry shortly")
+
+        waiter = _Waiter(weight, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(tenant, deque()).append(waiter)
+        self._stats["queued"] += 1
+        try:
+            await asyncio.wait_for(waiter.future, settings.ADMISSION_QUEUE_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            # The waiter may have been the head blocking lighter ones behind it
+            self._remove(tenant, waiter)
+            self._dispatch()
+            self._stats["rejected_deadline"] += 1
+            raise AdmissionRejected(
+                f"Waited {settings.ADMISSION_QUEUE_TIMEOUT_S}s for a search slot; retry shortly",
+                retry_after=settings.ADMISSION_QUEUE_TIMEOUT_S
+            )
+        except asyncio.CancelledError:
+            self._remove(tenant, waiter)
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as the caller went away
+                self._release(weight)
+            else:
+                self._dispatch()
+            raise
+        self._stats["admitted"] += 1
+        return Ticket(weight)
+
+    def _release(self, weight: float):
+        self.in_use = max(0.0, self.in_use - weight)
+        self._dispatch()
+
+    def release(self, ticket: Ticket, overloaded: bool = False):
+        now = time.monotonic()
+        slow = ticket.timed_out or (ticket.took_ms is not None and ticket.took_ms > settings.ADMISSION_TARGET_TOOK_MS)
+        if overloaded or slow:
+            # One cut per interval: a burst of slow responses is one congestion signal
+            if now - self._last_decrease >= settings.ADMISSION_DECREASE_INTERVAL_S:
+                self.limit = max(settings.ADMISSION_MIN_LIMIT, self.limit * settings.ADMISSION_BACKOFF)
+                self._last_decrease = now
+        elif ticket.took_ms is not None:
+            self.limit = min(settings.ADMISSION_MAX_LIMIT, self.limit + 1.0 / self.limit)
+        self._release(ticket.weight)
+
+    @asynccontextmanager
+    async def slot(self, tenant: str, weight: float):
+        """Holds `weight` slots around one ES call; call ticket.observe(resp) inside."""
+        if not settings.ADMISSION_ENABLED:
+            yield Ticket(weight)
+            return
+        ticket = await self.acquire(tenant, weight)
+        overloaded = False
+        try:
+            yield ticket
+        except Exception as e:
+            overloaded = _is_overload(e)
+            raise
+        finally:
+            self.release(ticket, overloaded)
+
+admission = AdmissionController()
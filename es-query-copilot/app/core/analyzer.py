@@ -0,0 +1,305 @@
+import copy
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.field_catalog import field_catalog, FieldCatalog
+from app.core.field_index import TEXT_TYPES, NUMERIC_TYPES, DATE_TYPES
+
+# Leaf queries shaped like {"clause": {"<field>": value_or_params}}
+FIELD_QUERIES = {
+    "term", "terms", "match", "match_phrase", "match_phrase_prefix", "match_bool_prefix",
+    "range", "prefix", "wildcard", "regexp", "fuzzy"
+}
+# Exact-value queries that never match analyzed text as intended
+EXACT_QUERIES = {"term", "terms", "prefix", "wildcard", "regexp", "fuzzy"}
+# Non-field keys that may sit next to the field in a leaf query
+LEAF_PARAMS = {"boost", "_name"}
+
+NUMERIC_AGGS = {
+    "avg", "sum", "stats", "extended_stats", "percentiles",
+    "median_absolute_deviation", "histogram", "range"
+}
+# min/max also accept dates
+NUMERIC_OR_DATE_AGGS = {"min", "max"}
+DATE_AGGS = {"date_histogram", "date_range"}
+
+class DSLAnalyzer:
+    """
+    Walks a DSL once against the field catalog. Mechanical problems
+    (text fields in exact/agg positions, unknown fields) are rewritten in
+    place; anything it cannot repair is reported as an error.
+    """
+    def __init__(self, catalog: FieldCatalog = field_catalog):
+        self.catalog = catalog
+
+    def analyze(self, index: str, dsl: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str], List[str]]:
+        """
+        Returns: (rewritten_dsl, applied_fixes, unfixable_errors)
+        """
+        fields = self.catalog.get_index_fields(index)
+        if not fields or not isinstance(dsl, dict):
+            # Without a catalog there is nothing to check against
+            return dsl, [], []
+
+        runtime = _runtime_fields(dsl.get("runtime_mappings"))
+        ctx = _Context({**fields, **runtime} if runtime else fields)
+        out = copy.deepcopy(dsl)
+
+        for key in ("query", "post_filter"):
+            if key in out:
+                query = ctx.visit_query(out[key], key)
+                if query is None:
+                    if key == "query":
+                        out[key] = {"match_all": {}}
+                    else:
+                        del out[key]
+                else:
+                    out[key] = query
+
+        for key in ("aggs", "aggregations"):
+            if key in out:
+                out[key] = ctx.visit_aggs(out[key], key)
+
+        if "sort" in out:
+            out["sort"] = ctx.visit_sort(out["sort"])
+
+        return out, ctx.fixes, ctx.errors
+
+def _runtime_fields(mappings: Any) -> Dict[str, Any]:
+    """Catalog-shaped entries for fields the request defines in its own runtime_mappings."""
+    fields: Dict[str, Any] = {}
+    if not isinstance(mappings, dict):
+        return fields
+    for name, spec in mappings.items():
+        if not isinstance(spec, dict):
+            continue
+        if spec.get("type") == "composite" and isinstance(spec.get("fields"), dict):
+            for sub, sub_spec in spec["fields"].items():
+                sub_type = sub_spec.get("type") if isinstance(sub_spec, dict) else None
+                fields[f"{name}.{sub}"] = {"type": sub_type, "searchable": True, "aggregatable": True}
+        else:
+            fields[name] = {"type": spec.get("type"), "searchable": True, "aggregatable": True}
+    return fields
+
+class _Context:
+    def __init__(self, fields: Dict[str, Any]):
+        self.fields = fields
+        self.fixes: List[str] = []
+        self.errors: List[str] = []
+        # > 0 while visiting must_not: dropping a clause there would widen results
+        self.negated = 0
+
+    # ---- field helpers ----
+
+    def _type(self, field: str) -> Optional[str]:
+        info = self.fields.get(field)
+        return info.get("type") if info else None
+
+    def _keyword_variant(self, field: str) -> Optional[str]:
+        candidate = f"{field}.keyword"
+        info = self.fields.get(candidate)
+        if info and info.get("aggregatable", True):
+            return candidate
+        return None
+
+    def _resolve_unknown(self, field: str, path: str) -> Optional[str]:
+        """Maps an unknown field to a known one, or returns None to drop it."""
+        if field.endswith(".keyword") and field[:-len(".keyword")] in self.fields:
+            base = field[:-len(".keyword")]
+            if self._type(base) not in TEXT_TYPES:
+                self.fixes.append(f"{path}: '{field}' does not exist, using '{base}'")
+                return base
+        if self.negated:
+            self.errors.append(f"{path}: exclusion on non-existent field '{field}'")
+            return field
+        self.fixes.append(f"{path}: removed clause on non-existent field '{field}'")
+        return None
+
+    def _check_field(self, field: str, path: str, need_exact: bool = False,
+                     need_agg: bool = False) -> Tuple[bool, str]:
+        """
+        Returns: (keep, field_to_use)
+        """
+        if not isinstance(field, str) or "*" in field or field.startswith("_"):
+            return True, field
+
+        if field not in self.fields:
+            resolved = self._resolve_unknown(field, path)
+            if resolved is None:
+                return False, field
+            if resolved not in self.fields:
+                # Reported as an error; left for the caller to fix
+                return True, resolved
+            field = resolved
+
+        info = self.fields[field]
+        ftype = info.get("type")
+
+        if (need_exact and ftype in TEXT_TYPES) or (need_agg and not info.get("aggregatable", True)):
+            keyword = self._keyword_variant(field)
+            if keyword:
+                self.fixes.append(f"{path}: text field '{field}' replaced by '{keyword}'")
+                return True, keyword
+            if need_agg:
+                self.errors.append(f"{path}: field '{field}' ({ftype}) is not aggregatable")
+        elif not need_agg and not info.get("searchable", True):
+            self.errors.append(f"{path}: field '{field}' is not searchable")
+
+        return True, field
+
+    # ---- queries ----
+
+    def visit_query(self, query: Any, path: str) -> Optional[Any]:
+        """Returns the (possibly rewritten) query, or None if it should be dropped."""
+        if not isinstance(query, dict):
+            return query
+
+        for clause in list(query.keys()):
+            body = query[clause]
+            clause_path = f"{path}.{clause}"
+
+            if clause == "bool" and isinstance(body, dict):
+                for occur in ("must", "filter", "should", "must_not"):
+                    if occur not in body:
+                        continue
+                    items = body[occur]
+                    if occur == "must_not":
+                        self.negated += 1
+                    if isinstance(items, list):
+                        kept = [q for q in (self.visit_query(q, f"{clause_path}.{occur}") for q in items) if q is not None]
+                        if kept:
+                            body[occur] = kept
+                        else:
+                            del body[occur]
+                    else:
+                        sub = self.visit_query(items, f"{clause_path}.{occur}")
+                        if sub is None:
+                            del body[occur]
+                        else:
+                            body[occur] = sub
+                    if occur == "must_not":
+                        self.negated -= 1
+
+            elif clause in ("constant_score", "nested", "has_child", "has_parent"):
+                key = "filter" if clause == "constant_score" else "query"
+                if isinstance(body, dict) and key in body:
+                    sub = self.visit_query(body[key], f"{clause_path}.{key}")
+                    if sub is None:
+                        return None
+                    body[key] = sub
+
+            elif clause == "function_score" and isinstance(body, dict) and "query" in body:
+                sub = self.visit_query(body["query"], f"{clause_path}.query")
+                body["query"] = sub if sub is not None else {"match_all": {}}
+
+            elif clause == "dis_max" and isinstance(body, dict):
+                queries = body.get("queries", [])
+                body["queries"] = [q for q in (self.visit_query(q, clause_path) for q in queries) if q is not None]
+                if not body["queries"]:
+                    return None
+
+            elif clause == "boosting" and isinstance(body, dict):
+                for key in ("positive", "negative"):
+                    if key in body:
+                        sub = self.visit_query(body[key], f"{clause_path}.{key}")
+                        if sub is None:
+                            return None
+                        body[key] = sub
+
+            elif clause == "exists" and isinstance(body, dict) and "field" in body:
+                keep, field = self._check_field(body["field"], clause_path)
+                if not keep:
+                    return None
+                body["field"] = field
+
+            elif clause == "multi_match" and isinstance(body, dict) and "fields" in body:
+                kept = []
+                for spec in body["fields"]:
+                    name, _, boost = str(spec).partition("^")
+                    keep, field = self._check_field(name, clause_path)
+                    if keep:
+                        kept.append(f"{field}^{boost}" if boost else field)
+                if not kept:
+                    return None
+                body["fields"] = kept
+
+            elif clause in FIELD_QUERIES and isinstance(body, dict):
+                for name in [k for k in body.keys() if k not in LEAF_PARAMS]:
+                    keep, field = self._check_field(name, clause_path, need_exact=clause in EXACT_QUERIES)
+                    if not keep:
+                        return None
+                    if field != name:
+                        body[field] = body.pop(name)
+
+        return query
+
+    # ---- aggregations ----
+
+    def visit_aggs(self, aggs: Any, path: str) -> Any:
+        if not isinstance(aggs, dict):
+            return aggs
+
+        for name in list(aggs.keys()):
+            agg = aggs[name]
+            if not isinstance(agg, dict):
+                continue
+            agg_path = f"{path}.{name}"
+            drop = False
+
+            for agg_type, body in list(agg.items()):
+                if agg_type in ("aggs", "aggregations"):
+                    agg[agg_type] = self.visit_aggs(body, f"{agg_path}.{agg_type}")
+                elif agg_type == "filter":
+                    sub = self.visit_query(body, f"{agg_path}.filter")
+                    agg[agg_type] = sub if sub is not None else {"match_all": {}}
+                elif agg_type == "filters" and isinstance(body, dict) and isinstance(body.get("filters"), dict):
+                    for key, sub in list(body["filters"].items()):
+                        sub = self.visit_query(sub, f"{agg_path}.filters.{key}")
+                        body["filters"][key] = sub if sub is not None else {"match_all": {}}
+                elif isinstance(body, dict) and isinstance(body.get("field"), str):
+                    if not self._visit_agg_field(agg_type, body, f"{agg_path}.{agg_type}"):
+                        drop = True
+
+            if drop:
+                del aggs[name]
+
+        return aggs
+
+    def _visit_agg_field(self, agg_type: str, body: Dict[str, Any], path: str) -> bool:
+        keep, field = self._check_field(body["field"], path, need_agg=True)
+        if not keep:
+            return False
+        body["field"] = field
+
+        ftype = self._type(field)
+        if ftype is None:
+            return True
+        if agg_type in NUMERIC_AGGS and ftype not in NUMERIC_TYPES:
+            self.errors.append(f"{path}: '{agg_type}' requires a numeric field, '{field}' is {ftype}")
+        elif agg_type in NUMERIC_OR_DATE_AGGS and ftype not in NUMERIC_TYPES | DATE_TYPES:
+            self.errors.append(f"{path}: '{agg_type}' requires a numeric or date field, '{field}' is {ftype}")
+        elif agg_type in DATE_AGGS and ftype not in DATE_TYPES:
+            self.errors.append(f"{path}: '{agg_type}' requires a date field, '{field}' is {ftype}")
+        return True
+
+    # ---- sort ----
+
+    def visit_sort(self, sort: Any) -> Any:
+        items = sort if isinstance(sort, list) else [sort]
+        kept = []
+        for item in items:
+            if isinstance(item, str):
+                name, spec = item, None
+            elif isinstance(item, dict) and len(item) == 1:
+                name, spec = next(iter(item.items()))
+            else:
+                kept.append(item)
+                continue
+
+            keep, field = self._check_field(name, "sort", need_agg=True)
+            if not keep:
+                continue
+            kept.append(field if spec is None else {field: spec})
+
+        return kept if isinstance(sort, list) else (kept[0] if kept else [])
+
+dsl_analyzer = DSLAnalyzer()
@@ -0,0 +1,167 @@
+import math
+from collections import OrderedDict
+from typing import Any, Dict
+
+from app.core.config import settings
+from app.core.risk import risk_analyzer, RiskAnalyzer, TIME_FILTER_SELECTIVITY
+
+SAMPLER_AGG = "approx_sample"
+# ES accepts random_sampler probabilities in (0, 0.5) or exactly 1
+MAX_PROBABILITY = 0.49
+Z_95 = 1.96
+
+# Aggs whose sampled result is not an estimate of the exact one (extremes,
+# distinct counts, individual docs) or that page (composite)
+UNSAMPLEABLE_AGGS = {
+    "cardinality", "min", "max", "top_hits", "top_metrics", "scripted_metric",
+    "composite", "rare_terms", "significant_terms", "random_sampler", "sampler",
+}
+
+def _agg_types(aggs: Any):
+    if not isinstance(aggs, dict):
+        return
+    for agg in aggs.values():
+        if not isinstance(agg, dict):
+            continue
+        for agg_type, body in agg.items():
+            if agg_type in ("aggs", "aggregations"):
+                yield from _agg_types(body)
+            elif agg_type != "meta":
+                yield agg_type
+
+def _annotate_buckets(node: Any, probability: float):
+    """Adds doc_count_error_95 (half-width of the 95% interval) next to every scaled doc_count."""
+    if isinstance(node, dict):
+        count = node.get("doc_count")
+        if isinstance(count, (int, float)):
+            node["doc_count_error_95"] = int(round(Z_95 * math.sqrt(count * (1 - probability) / probability)))
+        for value in node.values():
+            _annotate_buckets(value, probability)
+    elif isinstance(node, list):
+        for value in node:
+            _annotate_buckets(value, probability)
+
+class Approximator:
+    """
+    Decides whether (and how) a query may be answered approximately and
+    rewrites it accordingly. Aggregation requests go under a random_sampler
+    whose probability is picked so the predicted latency meets
+    APPROX_TARGET_MS; the latency model is a per-index ms-per-cost-unit
+    factor learned from observed `took`. Hit-count/existence questions use
+    terminate_after instead.
+    """
+    def __init__(self, analyzer: RiskAnalyzer = risk_analyzer):
+        self.analyzer = analyzer
+        # LRU: index strings come straight from clients
+        self._ms_per_cost: "OrderedDict[str, float]" = OrderedDict()
+
+    def ms_per_cost(self, index: str) -> float:
+        factor = self._ms_per_cost.get(index)
+        if factor is None:
+            return settings.APPROX_MS_PER_COST
+        self._ms_per_cost.move_to_end(index)
+        return factor
+
+    def observe(self, index: str, cost: float, took_ms: float):
+        """Feeds one executed query (its estimated cost as run, and ES took) into the latency model."""
+        if cost <= 0 or took_ms <= 0:
+            return
+        sample = took_ms / cost
+        current = self._ms_per_cost.get(index)
+        self._ms_per_cost[index] = sample if current is None else 0.8 * current + 0.2 * sample
+        self._ms_per_cost.move_to_end(index)
+        while len(self._ms_per_cost) > settings.APPROX_MODEL_MAX:
+            self._ms_per_cost.popitem(last=False)
+
+    def plan(self, dsl: Dict[str, Any], index: str, risk: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns {"method": "random_sampler" | "terminate_after" | "exact", ...} with a reason."""
+        features = self.analyzer.analyze(dsl, index)
+        if not features.agg_count:
+            if features.size <= 1 and "sort" not in dsl:
+                return {
+                    "method": "terminate_after",
+                    "terminate_after": settings.APPROX_TERMINATE_AFTER,
+                    "reason": "Count/existence question: stop after enough matches per shard",
+                }
+            return {"method": "exact", "reason": "Returns hits; only aggregations are sampled"}
+        if features.size != 0:
+            return {"method": "exact", "reason": "Hits requested (size > 0); only aggregation-only requests are sampled"}
+        blocked = sorted(set(_agg_types(dsl.get("aggs") or dsl.get("aggregations"))) & UNSAMPLEABLE_AGGS)
+        if blocked:
+            return {"method": "exact", "reason": f"Aggregations without a sampled estimate: {', '.join(blocked)}"}
+
+        cost = risk.get("estimated_cost", 0.0)
+        if cost < settings.RISK_MEDIUM_COST:
+            return {"method": "exact", "reason": "Cheap enough to run exactly"}
+
+        predicted_ms = cost * self.ms_per_cost(index)
+        probability = settings.APPROX_TARGET_MS / predicted_ms if predicted_ms > 0 else 1.0
+        # Never sample so thin that the counts are noise
+        docs = self.analyzer.index_stats(index).get("docs", settings.RISK_DEFAULT_DOC_COUNT)
+        candidates = docs * (TIME_FILTER_SELECTIVITY if features.has_time_filter else 1.0)
+        if candidates > 0:
+            probability = max(probability, settings.APPROX_MIN_SAMPLE_DOCS / candidates)
+        probability = max(probability, settings.APPROX_MIN_PROBABILITY)
+        if probability > MAX_PROBABILITY:
+            return {"method": "exact", "reason": f"Predicted {predicted_ms:.0f}ms is close to the target; sampling would not pay off"}
+
+        probability = float(f"{probability:.2g}")
+        return {
+            "method": "random_sampler",
+            "probability": probability,
+            "predicted_ms": round(predicted_ms * probability),
+            "estimated_cost": cost * probability,
+            "reason": f"Predicted {predicted_ms:.0f}ms exact; sampling for ~{settings.APPROX_TARGET_MS}ms",
+        }
+
+    @staticmethod
+    def rewrite(dsl: Dict[str, Any], plan: Dict[str, Any]) -> Dict[str, Any]:
+        if plan["method"] == "terminate_after":
+            return {**dsl, "terminate_after": plan["terminate_after"]}
+        if plan["method"] != "random_sampler":
+            return dsl
+        body = {k: v for k, v in dsl.items() if k not in ("aggs", "aggregations")}
+        body["aggs"] = {SAMPLER_AGG: {
+            "random_sampler": {"probability": plan["probability"], "seed": settings.APPROX_SEED},
+            "aggs": dsl.get("aggs") or dsl.get("aggregations"),
+        }}
+        return body
+
+    @staticmethod
+    def finish(resp: Dict[str, Any], plan: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Unwraps the sampler so aggregations keep their original shape and adds
+        resp["approximation"]: sampling rate and error bounds.
+        """
+        info: Dict[str, Any] = {"method": plan["method"]}
+        if plan["method"] == "terminate_after":
+            hits = resp.get("hits", {})
+            terminated = bool(resp.get("terminated_early", False))
+            info.update(terminate_after=plan["terminate_after"], terminated_early=terminated)
+            if terminated and isinstance(hits.get("total"), dict):
+                # Counting stopped early: the total is a lower bound
+                resp = {**resp, "hits": {**hits, "total": {**hits["total"], "relation": "gte"}}}
+            return {**resp, "approximation": info}
+        if plan["method"] != "random_sampler":
+            return resp
+
+        aggregations = resp.get("aggregations", {})
+        sample = aggregations.get(SAMPLER_AGG)
+        if sample is None:
+            return {**resp, "approximation": info}
+        p = plan["probability"]
+        unwrapped = {k: v for k, v in sample.items() if k not in ("doc_count", "seed", "probability")}
+        # Runs on the fresh ES response (before caching), so annotating in place is safe
+        _annotate_buckets(unwrapped, p)
+        # Bucket counts come back scaled by 1/p; the sampled count is what the error depends on
+        estimated = sample.get("doc_count", 0)
+        sampled = estimated * p
+        info.update(
+            probability=p,
+            sampled_docs=int(round(sampled)),
+            estimated_docs=estimated,
+            doc_count_rel_error_95=round(Z_95 * math.sqrt((1 - p) / sampled), 4) if sampled > 0 else None,
+        )
+        return {**resp, "aggregations": unwrapped, "approximation": info}
+
+approximator = Approximator()
@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import orjson
+
+from app.core.config import settings
+
+class Loaded:
+    """
+    A loader result with caching instructions; get_or_load hands callers `value`.
+    `size` is the value's byte size when the loader already knows it (e.g. the
+    raw response length), so the cache need not measure it again.
+    """
+    __slots__ = ("value", "store", "size")
+
+    def __init__(self, value: Any, store: bool = True, size: Optional[int] = None):
+        self.value = value
+        self.store = store
+        self.size = size
+
+def _unwrap(result: Any) -> Any:
+    return result.value if isinstance(result, Loaded) else result
+
+class TTLCache:
+    """
+    Bounded LRU cache with per-entry TTL and single-flight loading.
+    Concurrent misses on the same key share one in-flight computation.
+    With `maxbytes`, entries are also evicted by total `sizeof(value)`.
+    """
+    def __init__(self, maxsize: int, ttl: float, maxbytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any, int]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value, size = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.nbytes -= size
+            self._stats["expirations"] += 1
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, size: Optional[int] = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        if size is None:
+            size = self.sizeof(value) if self.sizeof else 0
+        if self.maxbytes is not None and size > self.maxbytes:
+            # Would evict everything else and still not fit
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[2]
+        self._data[key] = (time.monotonic() + ttl, value, size)
+        self.nbytes += size
+        while len(self._data) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+            _, (_, _, evicted_size) = self._data.popitem(last=False)
+            self.nbytes -= evicted_size
+            self._stats["evictions"] += 1
+
+    def discard(self, key: Hashable):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
+
+    def clear(self):
+        self._data.clear()
+        self.nbytes = 0
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                          ttl: Optional[float] = None) -> Tuple[Any, str]:
+        """
+        Returns: (value, status) where status is "hit", "coalesced" or "miss".
+        Loader exceptions propagate to every waiter and are not cached.
+        A ttl of 0 still coalesces concurrent loads but stores nothing, and so
+        does a loader returning Loaded(value, store=False).
+        """
+        value = self.get(key)
+        if value is not None:
+            self._stats["hits"] += 1
+            return value, "hit"
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats["coalesced"] += 1
+            # Shield so one cancelled waiter does not cancel the shared load
+            return _unwrap(await asyncio.shield(task)), "coalesced"
+
+        self._stats["misses"] += 1
+        task = asyncio.ensure_future(loader())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._on_loaded(key, t, ttl))
+        return _unwrap(await asyncio.shield(task)), "miss"
+
+    def _on_loaded(self, key: Hashable, task: asyncio.Task, ttl: Optional[float]):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if not isinstance(result, Loaded):
+            self.set(key, result, ttl)
+        elif result.store:
+            self.set(key, result.value, ttl, size=result.size)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["size"] = len(self._data)
+        stats["maxsize"] = self.maxsize
+        stats["bytes"] = self.nbytes
+        stats["inflight"] = len(self._inflight)
+        return stats
+
+def dsl_fingerprint(dsl: Dict[str, Any]) -> str:
+    """Stable hash of a DSL; key order and whitespace do not matter."""
+    canonical = json.dumps(dsl, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+# Date math such as "now", "now-7d", "now-1M/d", "now/h"
+_NOW_RE = re.compile(r"\bnow((?:[+-]\d+[yMwdhHms])*)(?:/([yMwdhHms]))?")
+_ROUNDING_SECONDS = {
+    "s": 1, "m": 60, "h": 3600, "H": 3600, "d": 86400,
+    "w": 7 * 86400, "M": 30 * 86400, "y": 365 * 86400
+}
+
+def _iter_strings(obj: Any):
+    if isinstance(obj, str):
+        yield obj
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            yield from _iter_strings(v)
+    elif isinstance(obj, list):
+        for v in obj:
+            yield from _iter_strings(v)
+
+def search_ttl(dsl: Dict[str, Any]) -> float:
+    """
+    Cache TTL implied by the query's time semantics. An unrounded `now` moves
+    every millisecond and is only coalesced; `now/d`-style rounding is stable
+    until the next rounding boundary (UTC); queries without `now` get the
+    maximum TTL.
+    """
+    ttl = settings.SEARCH_CACHE_MAX_TTL_S
+    wall = time.time()
+    for text in _iter_strings(dsl):
+        if "now" not in text:
+            continue
+        for m in _NOW_RE.finditer(text):
+            unit = m.group(2)
+            if unit is None:
+                return settings.SEARCH_CACHE_NOW_TTL_S
+            seconds = _ROUNDING_SECONDS[unit]
+            if seconds <= 86400:
+                seconds -= wall % seconds
+            ttl = min(ttl, seconds)
+    return ttl
+
+def _response_size(resp: Dict[str, Any]) -> int:
+    # Fallback for loaders that do not pass the raw body length
+    return len(orjson.dumps(resp, default=str))
+
+draft_cache = TTLCache(maxsize=settings.DRAFT_CACHE_SIZE, ttl=settings.DRAFT_CACHE_TTL_S)
+
+search_cache = TTLCache(
+    maxsize=settings.SEARCH_CACHE_MAX_ENTRIES,
+    ttl=settings.SEARCH_CACHE_MAX_TTL_S,
+    maxbytes=settings.SEARCH_CACHE_MAX_BYTES,
+    sizeof=_response_size
+)
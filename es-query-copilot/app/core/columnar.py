@@ -0,0 +1,194 @@
+import csv
+import io
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Bucket aggs with exactly one bucket: the response carries doc_count and
+# sub-aggs inline, with no key of its own
+SINGLE_BUCKET = {
+    "filter", "nested", "reverse_nested", "global", "missing", "sampler",
+    "diversified_sampler", "random_sampler", "children", "parent",
+}
+DATE_BUCKET = {"date_histogram", "auto_date_histogram"}
+
+MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "csv": "text/csv",
+}
+
+def _agg_kind(spec: Dict[str, Any]) -> str:
+    return next((k for k in spec if k not in ("aggs", "aggregations", "meta")), "")
+
+def _sub_aggs(spec: Dict[str, Any]) -> Dict[str, Any]:
+    return spec.get("aggs") or spec.get("aggregations") or {}
+
+def paginated_composite(aggs: Dict[str, Any]) -> Optional[str]:
+    """Name of the composite agg to page through; only when it is the sole top-level agg."""
+    if len(aggs) == 1:
+        name, spec = next(iter(aggs.items()))
+        if _agg_kind(spec) == "composite":
+            return name
+    return None
+
+class AggTable:
+    """
+    Nested aggregation results flattened to one row per leaf bucket. Columns
+    grow as lists while pages are appended and are converted once, to NumPy
+    or Arrow, on the way out. Bucket keys use the agg name (composite keys
+    the source names); doc counts and metrics are "<agg>.<field>".
+    """
+    def __init__(self):
+        self.columns: Dict[str, List[Any]] = {}
+        self.time_columns: Set[str] = set()
+        self.num_rows = 0
+
+    def _add_row(self, row: Dict[str, Any]):
+        for name, value in row.items():
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = [None] * self.num_rows
+            column.append(value)
+        self.num_rows += 1
+        for column in self.columns.values():
+            if len(column) < self.num_rows:
+                column.append(None)
+
+    def append(self, aggs: Dict[str, Any], aggregations: Dict[str, Any]):
+        """Flattens one response's `aggregations` (for request `aggs`) into the table."""
+        self._walk(aggs, aggregations, {})
+
+    def _walk(self, aggs: Dict[str, Any], result: Dict[str, Any], base: Dict[str, Any]):
+        row = dict(base)
+        branches = []
+        for name, spec in aggs.items():
+            res = result.get(name)
+            if not isinstance(res, dict):
+                continue
+            kind = _agg_kind(spec)
+            if "buckets" in res or kind in SINGLE_BUCKET:
+                branches.append((name, kind, spec, res))
+            else:
+                row.update(self._metric(name, res))
+
+        if not branches:
+            self._add_row(row)
+            return
+        # Sibling bucket aggs are independent groupings: their rows are stacked
+        for name, kind, spec, res in branches:
+            for keys, bucket in self._buckets(name, kind, spec, res):
+                self._walk(_sub_aggs(spec), bucket, {**row, **keys, f"{name}.doc_count": bucket.get("doc_count")})
+
+    def _buckets(self, name: str, kind: str, spec: Dict[str, Any], res: Dict[str, Any]):
+        if kind in SINGLE_BUCKET:
+            yield {}, res
+            return
+        buckets = res["buckets"]
+        if isinstance(buckets, dict):
+            # keyed responses and filters: the key is the dict key
+            for key, bucket in buckets.items():
+                yield {name: key}, bucket
+            return
+        if kind == "composite":
+            for source in spec["composite"].get("sources", []):
+                source_name, source_spec = next(iter(source.items()))
+                if "date_histogram" in source_spec:
+                    self.time_columns.add(source_name)
+        elif kind in DATE_BUCKET:
+            self.time_columns.add(name)
+        for bucket in buckets:
+            key = bucket.get("key")
+            if isinstance(key, dict):
+                yield dict(key), bucket
+            elif isinstance(key, list):
+                # multi_terms
+                yield {name: bucket.get("key_as_string", "|".join(map(str, key)))}, bucket
+            else:
+                yield {name: key}, bucket
+
+    @staticmethod
+    def _metric(name: str, res: Dict[str, Any]) -> Dict[str, Any]:
+        if "value" in res:
+            return {name: res["value"]}
+        values = res.get("values")
+        if isinstance(values, dict):
+            # percentiles / percentile_ranks
+            return {f"{name}.{k}": v for k, v in values.items() if not k.endswith("_as_string")}
+        if isinstance(values, list):
+            return {f"{name}.{v.get('key')}": v.get("value") for v in values}
+        # stats, extended_stats, ...; non-scalar parts (top_hits, bounds) are skipped
+        return {
+            f"{name}.{k}": v for k, v in res.items()
+            if k != "meta" and not k.endswith("_as_string")
+            and (v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)))
+        }
+
+    def to_numpy(self) -> Dict[str, np.ndarray]:
+        arrays = {}
+        for name, values in self.columns.items():
+            if name in self.time_columns:
+                arrays[name] = np.array(
+                    [np.datetime64("NaT") if v is None else np.datetime64(int(v), "ms") for v in values],
+                    dtype="datetime64[ms]"
+                )
+                continue
+            present = [v for v in values if v is not None]
+            numeric = bool(present) and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present)
+            if numeric and len(present) == len(values) and all(isinstance(v, int) for v in present):
+                arrays[name] = np.array(values, dtype=np.int64)
+            elif numeric:
+                arrays[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+            else:
+                arrays[name] = np.array(values, dtype=object)
+        return arrays
+
+    def to_arrow(self) -> pa.Table:
+        arrays = {}
+        for name, values in self.columns.items():
+            if name in self.time_columns:
+                arrays[name] = pa.array(values, type=pa.timestamp("ms", tz="UTC"))
+                continue
+            try:
+                arrays[name] = pa.array(values)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # Mixed key types (e.g. missing bucket next to strings)
+                arrays[name] = pa.array([None if v is None else str(v) for v in values], type=pa.string())
+        return pa.table(arrays)
+
+    def to_ipc(self) -> bytes:
+        table = self.to_arrow()
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def to_parquet(self) -> bytes:
+        sink = pa.BufferOutputStream()
+        pq.write_table(self.to_arrow(), sink)
+        return sink.getvalue().to_pybytes()
+
+    def to_csv(self) -> bytes:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        names = list(self.columns)
+        writer.writerow(names)
+        columns = []
+        for name in names:
+            values = self.columns[name]
+            if name in self.time_columns:
+                values = [None if v is None else datetime.fromtimestamp(v / 1000, tz=timezone.utc).isoformat()
+                          for v in values]
+            columns.append(values)
+        writer.writerows(zip(*columns))
+        return buf.getvalue().encode("utf-8")
+
+    def encode(self, format: str) -> bytes:
+        if format == "arrow":
+            return self.to_ipc()
+        if format == "parquet":
+            return self.to_parquet()
+        return self.to_csv()
@@ -1,4 +1,5 @@
 import os
+from typing import Any, Dict, List
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -13,13 +14,118 @@ class Settings(BaseSettings):
     LLM_PROVIDER: str = "openai"
     LLM_MODEL: str = "gpt-4o"
     LLM_API_KEY: str
+    LLM_BASE_URL: str = ""  # Required when LLM_PROVIDER is not "openai"
+    # Extra OpenAI-compatible backends, tried after the primary (JSON list of
+    # {"name", "base_url", "model", "api_key"}), e.g. a local model endpoint
+    LLM_FALLBACK_BACKENDS: List[Dict[str, Any]] = []
+    LLM_HEDGE_ENABLED: bool = True
+    LLM_HEDGE_PERCENTILE: float = 90.0
+    LLM_HEDGE_DEFAULT_DELAY_S: float = 3.0  # Until a backend has LLM_HEDGE_MIN_SAMPLES latencies
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    LLM_LATENCY_WINDOW: int = 200
+    LLM_BREAKER_FAILURES: int = 5
+    LLM_BREAKER_COOLDOWN_S: float = 30.0
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_CONNECTIONS: int = 10
+    LLM_HTTP2: bool = True
+    LLM_CONNECT_TIMEOUT_S: float = 5.0
+    LLM_TIMEOUT_S: float = 30.0
+
+    CATALOG_REFRESH_MODE: str = "file"  # off | file | es
+    CATALOG_REFRESH_INTERVAL_S: float = 60.0
+    CATALOG_FETCH_CONCURRENCY: int = 8
+
+    PROMPT_FIELD_TOP_K: int = 60
+    PROMPT_FIELD_TOKEN_BUDGET: int = 1500
+
+    DRAFT_CACHE_ENABLED: bool = True
+    DRAFT_CACHE_SIZE: int = 1024
+    DRAFT_CACHE_TTL_S: float = 600.0
+    # HMAC key for draft ids; set the same value on every worker (random per process when empty)
+    DRAFT_SIGNING_KEY: str = ""
+
+    # Learned NL->DSL templates answer known question shapes without the LLM
+    TEMPLATE_ENABLED: bool = True
+    TEMPLATE_MAX: int = 512
+    TEMPLATE_MIN_SUPPORT: int = 1
+    TEMPLATE_STORE_PATH: str = ""  # Persist learned templates across restarts when set
+
+    # Few-shot examples retrieved from validated drafts
+    EXAMPLES_ENABLED: bool = True
+    EXAMPLE_MAX: int = 1000
+    EXAMPLE_TOP_K: int = 3
+    EXAMPLE_TOKEN_BUDGET: int = 600
+    EXAMPLE_MIN_SCORE: float = 0.2
+    EXAMPLE_STORE_PATH: str = ""  # JSONL of {index, nl_query, dsl}; loaded at startup, saved at shutdown
+
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_MAX_ENTRIES: int = 2048
+    SEARCH_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    SEARCH_CACHE_MAX_TTL_S: float = 300.0
+    SEARCH_CACHE_NOW_TTL_S: float = 0.0  # unrounded "now": coalesce only
+
+    RISK_MEDIUM_COST: float = 1e6
+    RISK_HIGH_COST: float = 1e7
+    RISK_DEFAULT_DOC_COUNT: int = 10000000
+    RISK_CALIBRATION_ENABLED: bool = False
+    RISK_STATS_TTL_S: float = 300.0
+    RISK_STATS_MAX: int = 1024  # Indices whose calibrated stats are kept (LRU)
+    # Approximate /run mode (random_sampler / terminate_after)
+    APPROX_TARGET_MS: float = 300.0
+    APPROX_MS_PER_COST: float = 0.001  # Initial latency model; learned per index from `took`
+    APPROX_MODEL_MAX: int = 1024  # Indices with a learned latency factor (LRU)
+    APPROX_MIN_PROBABILITY: float = 0.001
+    APPROX_MIN_SAMPLE_DOCS: int = 10000
+    APPROX_TERMINATE_AFTER: int = 10000
+    APPROX_SEED: int = 42
+
+    # Comma list of rewrite rules run before /run; round_now and cap_track_total_hits are approximate
+    OPTIMIZER_RULES: str = "must_to_filter,wildcard_to_prefix"
+    # Required for rules that change results (agg_only_no_hits, cap_track_total_hits, round_now)
+    OPTIMIZER_ALLOW_INEXACT: bool = False
+    OPTIMIZER_TOTAL_HITS_CAP: int = 10000
 
     MAX_VALIDATE_RETRY: int = 2
+    # Repair candidates generated concurrently per round; 1 keeps the sequential behaviour
+    REPAIR_CANDIDATES: int = 1
+    REPAIR_TEMPERATURES: str = "0.0,0.4,0.8"
+    REPAIR_BUDGET_S: float = 0.0  # Wall-clock limit per repair round; 0 disables
     MAX_SIZE: int = 200
     MAX_FROM_SIZE: int = 10000
     DEFAULT_TIMEOUT_MS: int = 2000
+    MAX_BATCH_SIZE: int = 50
+    MAX_CURSORS: int = 1000
+    CURSOR_TTL_S: float = 120.0
+    MAX_JOBS: int = 200
+    JOB_TTL_S: float = 600.0  # Idle time before a job (and its ES async search) is dropped
+    JOB_MAX_WAIT_MS: int = 30000  # Upper bound for wait_ms on job submit / poll
+    EXPORT_PAGE_SIZE: int = 1000
+    EXPORT_MAX_DOCS: int = 1000000
+    EXPORT_MAX_SLICES: int = 8
+    EXPLAIN_MAX_DOCS: int = 200
+    EXPLAIN_CONCURRENCY: int = 8
+    COLUMNAR_MAX_PAGES: int = 100  # Composite after_key pages per columnar /run
+    COLUMNAR_MAX_ROWS: int = 1000000
     ALLOW_PROFILE: bool = False
 
+    # Admission control for /run searches
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_TENANT_HEADER: str = "X-Tenant-Id"
+    ADMISSION_INITIAL_LIMIT: float = 16.0  # Concurrent slots; a query takes 1-5 by risk score
+    ADMISSION_MIN_LIMIT: float = 2.0
+    ADMISSION_MAX_LIMIT: float = 64.0
+    ADMISSION_TARGET_TOOK_MS: float = 1000.0  # ES took above this shrinks the limit
+    ADMISSION_BACKOFF: float = 0.7
+    ADMISSION_DECREASE_INTERVAL_S: float = 1.0
+    ADMISSION_QUEUE_TIMEOUT_S: float = 1.0
+    ADMISSION_MAX_QUEUE: int = 100
+    ADMISSION_MAX_QUEUE_PER_TENANT: int = 20
+
+    METRICS_ENABLED: bool = True
+    # Requests sending "X-Debug-Trace: 1" get per-stage spans back in Server-Timing
+    DEBUG_TRACE_ENABLED: bool = False
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -0,0 +1,23 @@
+from typing import Any, Dict, List
+
+from app.core.config import settings
+from app.core.resource_store import ResourceStore
+from app.services.es_client import es_client
+
+class CursorStore(ResourceStore):
+    """
+    Opaque cursor tokens to PIT pagination state. Every entry owns one
+    point-in-time; it is closed when the entry expires, is evicted, or
+    pagination reaches the last page. Entries with a page in flight
+    (state["in_flight"] > 0) are never expired or evicted under it.
+    """
+    def _busy(self, state: Dict[str, Any]) -> bool:
+        return bool(state.get("in_flight"))
+
+    async def _close(self, states: List[Dict[str, Any]]):
+        for state in states:
+            # Requests waiting on the state's lock see this and stop
+            state["closed"] = True
+            await es_client.close_point_in_time(state["pit_id"])
+
+cursor_store = CursorStore(maxsize=settings.MAX_CURSORS, ttl=settings.CURSOR_TTL_S)
@@ -0,0 +1,31 @@
+import hashlib
+import hmac
+import secrets
+from typing import Any, Dict
+
+from app.core.config import settings
+from app.core.cache import dsl_fingerprint
+from app.core.templates import normalize_nl_query
+
+class DraftSigner:
+    """
+    Issues draft ids: an HMAC over (index, timezone, question, DSL) for every
+    DSL /draft returns. /validate learns templates and examples only from
+    pairs carrying a matching id, so a client cannot teach the shared fast
+    path a DSL the drafter never produced for that question.
+    """
+    def __init__(self, key: bytes):
+        self.key = key
+
+    def _digest(self, index: str, timezone: str, nl_query: str, dsl: Dict[str, Any]) -> str:
+        message = "\x00".join((index, timezone, normalize_nl_query(nl_query), dsl_fingerprint(dsl)))
+        return hmac.new(self.key, message.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def sign(self, index: str, timezone: str, nl_query: str, dsl: Dict[str, Any]) -> str:
+        return self._digest(index, timezone, nl_query, dsl)
+
+    def verify(self, draft_id: str, index: str, timezone: str, nl_query: str, dsl: Dict[str, Any]) -> bool:
+        return hmac.compare_digest(draft_id, self._digest(index, timezone, nl_query, dsl))
+
+# Without a configured key, ids are only valid within this process
+draft_signer = DraftSigner(settings.DRAFT_SIGNING_KEY.encode("utf-8") or secrets.token_bytes(32))
@@ -1,3 +1,14 @@
+from typing import Callable
+
+def in_cause_chain(exc: BaseException, predicate: Callable[[BaseException], bool]) -> bool:
+    """True if `exc` or any exception it was raised from satisfies `predicate`."""
+    # ESDriverError wraps the client error, so the interesting one is usually further down
+    while exc is not None:
+        if predicate(exc):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
 class AppError(Exception):
     """Base class for application errors."""
     pass
@@ -0,0 +1,137 @@
+import json
+import math
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.field_index import estimate_tokens
+from app.core.templates import normalize_nl_query
+
+NGRAM_SIZES = (2, 3)
+HASH_DIM = 4096
+
+def _ngram_counts(text: str) -> Dict[int, int]:
+    """Hashed char n-gram counts; crc32 keeps buckets stable across processes."""
+    padded = f" {normalize_nl_query(text)} "
+    counts: Dict[int, int] = {}
+    for n in NGRAM_SIZES:
+        for i in range(len(padded) - n + 1):
+            col = zlib.crc32(padded[i:i + n].encode("utf-8")) % HASH_DIM
+            counts[col] = counts.get(col, 0) + 1
+    return counts
+
+def _tf_vector(counts: Dict[int, int]) -> np.ndarray:
+    vec = np.zeros(HASH_DIM, dtype=np.float32)
+    for col, count in counts.items():
+        vec[col] = 1.0 + math.log(count)
+    return vec
+
+class ExampleStore:
+    """
+    Validated (nl_query, index, dsl) pairs with a char-ngram TF-IDF index.
+    The matrix is rebuilt lazily after writes; lookups are one mat-vec.
+    """
+    def __init__(self, maxsize: int = settings.EXAMPLE_MAX):
+        self.maxsize = maxsize
+        self.examples: List[Dict[str, Any]] = []
+        self._keys: Dict[Tuple[str, str], int] = {}
+        # Ring buffer of tf rows; once full the oldest example is overwritten
+        self._tf: Optional[np.ndarray] = None
+        self._next = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._idf: Optional[np.ndarray] = None
+        # Bumped per index on every write, so cached prompts built from older examples go stale
+        self._generations: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.examples)
+
+    def generation(self, index: str) -> int:
+        return self._generations.get(index, 0)
+
+    def add(self, index: str, nl_query: str, dsl: Dict[str, Any]):
+        key = (index, normalize_nl_query(nl_query))
+        example = {"index": index, "nl_query": nl_query, "dsl": dsl}
+        self._generations[index] = self._generations.get(index, 0) + 1
+        if key in self._keys:
+            # Same question again: keep the latest validated DSL
+            self.examples[self._keys[key]] = example
+            return
+        if self._tf is None:
+            self._tf = np.zeros((self.maxsize, HASH_DIM), dtype=np.float32)
+
+        if len(self.examples) < self.maxsize:
+            slot = len(self.examples)
+            self.examples.append(example)
+        else:
+            slot = self._next
+            old = self.examples[slot]
+            del self._keys[(old["index"], normalize_nl_query(old["nl_query"]))]
+            self._generations[old["index"]] = self._generations.get(old["index"], 0) + 1
+            self.examples[slot] = example
+            self._next = (slot + 1) % self.maxsize
+        self._keys[key] = slot
+        self._tf[slot] = _tf_vector(_ngram_counts(nl_query))
+        self._matrix = None
+
+    def _index(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._matrix is None:
+            n = len(self.examples)
+            tf = self._tf[:n]
+            df = np.count_nonzero(tf, axis=0)
+            self._idf = (np.log((1 + n) / (1 + df)) + 1.0).astype(np.float32)
+            matrix = tf * self._idf
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._matrix = matrix / np.maximum(norms, 1e-9)
+        return self._matrix, self._idf
+
+    def search(self, index: str, nl_query: str, top_k: int) -> List[Tuple[float, Dict[str, Any]]]:
+        """Returns up to top_k (cosine, example) for `index`, best first."""
+        if not self.examples or top_k <= 0:
+            return []
+        matrix, idf = self._index()
+        query = _tf_vector(_ngram_counts(nl_query)) * idf
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = matrix @ (query / norm)
+        mask = np.fromiter((e["index"] == index for e in self.examples), dtype=bool, count=len(self.examples))
+        scores = np.where(mask, scores, -1.0)
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(float(scores[i]), self.examples[i]) for i in best if scores[i] >= settings.EXAMPLE_MIN_SCORE]
+
+    def render(self, index: str, nl_query: str, top_k: int, token_budget: int) -> str:
+        """Nearest examples as prompt lines, stopping at the token budget."""
+        lines = []
+        used = 0
+        for _, example in self.search(index, nl_query, top_k):
+            text = f"Q: {example['nl_query']}\nDSL: {json.dumps(example['dsl'], ensure_ascii=False, separators=(',', ':'))}"
+            cost = estimate_tokens(text)
+            if used + cost > token_budget:
+                break
+            lines.append(text)
+            used += cost
+        return "\n\n".join(lines)
+
+    def load(self, path: str):
+        if not path or not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.add(entry["index"], entry["nl_query"], entry["dsl"])
+
+    def save(self, path: str):
+        if not path:
+            return
+        with open(path, "w", encoding="utf-8") as f:
+            for example in self.examples:
+                f.write(json.dumps(example, ensure_ascii=False) + "\n")
+
+example_store = ExampleStore()
@@ -1,31 +1,292 @@
+import asyncio
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.field_index import FieldIndex
+from app.services.es_client import es_client
 
 DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "../../data/field_catalog.json")
 
+COMPACT_FORMAT = "field_catalog/compact-1"
+
+def fields_from_field_caps(caps: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Flattens an ES field_caps response into catalog field entries. A field
+    mapped with different types across indices keeps the type used by most
+    indices, plus "conflicts": {type: [concrete indices]}.
+    """
+    fields = {}
+    for field, info in caps.get("fields", {}).items():
+        # Skip metadata fields
+        if field.startswith("_"):
+            continue
+        # info is like: {"keyword": {"type": "keyword", "searchable": true, ...}}
+        if len(info) == 1:
+            details = next(iter(info.values()))
+        else:
+            # ES only lists "indices" per type when the types conflict
+            chosen = max(info, key=lambda t: (t != "unmapped", len(info[t].get("indices") or []), t))
+            details = info[chosen]
+        entry = {
+            "type": details.get("type", "unknown"),
+            "searchable": details.get("searchable", False),
+            "aggregatable": details.get("aggregatable", False)
+        }
+        if len(info) > 1:
+            entry["conflicts"] = {t: sorted(d.get("indices") or []) for t, d in sorted(info.items())}
+        fields[field] = entry
+    return fields
+
+async def fetch_catalog(patterns: List[str], concurrency: int) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    field_caps for every pattern, at most `concurrency` requests in flight.
+    Returns: (catalog for the patterns that succeeded, {pattern: error})
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def fetch(pattern: str):
+        async with semaphore:
+            caps = await es_client.get_field_caps(index=pattern, fields="*")
+            return fields_from_field_caps(caps)
+
+    results = await asyncio.gather(*(fetch(p) for p in patterns), return_exceptions=True)
+    catalog, errors = {}, {}
+    for pattern, result in zip(patterns, results):
+        if isinstance(result, BaseException):
+            errors[pattern] = str(result)
+        else:
+            catalog[pattern] = result
+    return catalog, errors
+
+def diff_catalogs(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Dict[str, List[str]]]:
+    """Per-pattern {"added", "removed", "changed"} field names; unchanged patterns are omitted."""
+    diff = {}
+    for pattern in sorted(set(old) | set(new)):
+        before, after = old.get(pattern, {}), new.get(pattern, {})
+        if before == after:
+            continue
+        diff[pattern] = {
+            "added": sorted(set(after) - set(before)),
+            "removed": sorted(set(before) - set(after)),
+            "changed": sorted(f for f in set(before) & set(after) if before[f] != after[f]),
+        }
+    return diff
+
+def compact_path(path: str) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.compact{ext or '.json'}"
+
+def to_compact(catalog: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Columnar form: each distinct field entry is stored once and fields refer
+    to it by position, so loading builds a few hundred dicts instead of one
+    per field per pattern.
+    """
+    entries: List[Dict[str, Any]] = []
+    positions: Dict[str, int] = {}
+    patterns = {}
+    for pattern, fields in catalog.items():
+        codes = []
+        for entry in fields.values():
+            key = json.dumps(entry, sort_keys=True)
+            if key not in positions:
+                positions[key] = len(entries)
+                entries.append(entry)
+            codes.append(positions[key])
+        patterns[pattern] = {"names": list(fields.keys()), "entries": codes}
+    return {"format": COMPACT_FORMAT, "entries": entries, "patterns": patterns}
+
+def from_compact(data: Dict[str, Any]) -> Dict[str, Any]:
+    if data.get("format") != COMPACT_FORMAT:
+        raise ValueError(f"Unsupported catalog format: {data.get('format')}")
+    entries = data["entries"]
+    # Entries are shared between fields and must be treated as read-only
+    return {
+        pattern: dict(zip(cols["names"], map(entries.__getitem__, cols["entries"])))
+        for pattern, cols in data["patterns"].items()
+    }
+
+def write_catalog(path: str, catalog: Dict[str, Any]):
+    """Writes the human-readable JSON and its compact sibling, each atomically."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    for target, data, kwargs in (
+        (path, catalog, {"indent": 2, "ensure_ascii": False}),
+        (compact_path(path), to_compact(catalog), {"separators": (",", ":"), "ensure_ascii": False}),
+    ):
+        tmp = f"{target}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, **kwargs)
+        os.replace(tmp, target)
+
+def read_catalog(path: str) -> Dict[str, Any]:
+    """Loads the compact sibling when it is at least as new as the JSON."""
+    compact = compact_path(path)
+    if os.path.exists(compact) and (not os.path.exists(path) or os.path.getmtime(compact) >= os.path.getmtime(path)):
+        with open(compact, "r", encoding="utf-8") as f:
+            return from_compact(json.load(f))
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+class _TrieNode:
+    __slots__ = ("children", "any", "star", "loop", "rank")
+
+    def __init__(self, loop: bool = False):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.any: Optional["_TrieNode"] = None  # "?"
+        self.star: Optional["_TrieNode"] = None  # "*": a node that loops on any character
+        self.loop = loop
+        self.rank: Optional[int] = None  # Set where a pattern ends; lower is more specific
+
+class PatternMatcher:
+    """
+    Resolves concrete index names (or narrower patterns) to catalog keys.
+    Wildcard keys share one trie over their literal characters, with `*`
+    and `?` as extra edges. Matching walks the name once, carrying the set
+    of live trie states instead of backtracking: O(len(name) x live states),
+    where the live states are the patterns still in play at that position,
+    and shared literal prefixes are walked only once. When several patterns
+    match, the most specific wins.
+    """
+    def __init__(self, keys: List[str]):
+        patterns = [k for k in keys if "*" in k or "?" in k]
+        # More literal characters = more specific ("orders-eu-*" before "orders-*")
+        patterns.sort(key=lambda k: (-len(k.replace("*", "").replace("?", "")), k))
+        self._keys = patterns
+        self._root = _TrieNode()
+        for rank, pattern in enumerate(patterns):
+            node = self._root
+            for char in pattern:
+                if char == "*":
+                    node.star = node.star or _TrieNode(loop=True)
+                    node = node.star
+                elif char == "?":
+                    node.any = node.any or _TrieNode()
+                    node = node.any
+                else:
+                    node = node.children.setdefault(char, _TrieNode())
+            if node.rank is None:
+                node.rank = rank
+
+    @staticmethod
+    def _closure(nodes: List[_TrieNode]) -> List[_TrieNode]:
+        # "*" also matches the empty string
+        out, seen = [], set()
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            out.append(node)
+            if node.star is not None:
+                stack.append(node.star)
+        return out
+
+    def match(self, name: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        states = self._closure([self._root])
+        for char in name:
+            step = []
+            for node in states:
+                if node.loop:
+                    step.append(node)
+                child = node.children.get(char)
+                if child is not None:
+                    step.append(child)
+                if node.any is not None:
+                    step.append(node.any)
+            if not step:
+                return None
+            states = self._closure(step)
+        ranks = [node.rank for node in states if node.rank is not None]
+        return self._keys[min(ranks)] if ranks else None
+
 class FieldCatalog:
     def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
         self.catalog = {}
+        # Bumped on every swap to new content so caches can key on it
+        self.version = 0
+        self._mtime = None
+        self._matcher = PatternMatcher([])
+        self._matcher_source = self.catalog
+        # Resolved index name -> catalog key, reset on swap
+        self._resolved: Dict[str, Optional[str]] = {}
+        # Per-key FieldIndex, rebuilt when the underlying fields dict changes
+        self._field_indexes: Dict[str, Any] = {}
+        self._refresher: Optional[asyncio.Task] = None
         self.load(path)
 
     def load(self, path: str):
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                self.catalog = json.load(f)
+        if os.path.exists(path) or os.path.exists(compact_path(path)):
+            mtime = self._source_mtime()
+            self.swap(read_catalog(path))
+            self._mtime = mtime
         else:
             # Fallback for dev/first run
             print(f"Warning: Field catalog not found at {path}")
 
-    def get_index_fields(self, index: str) -> Dict[str, Any]:
-        # Exact match
-        if index in self.catalog:
-            return self.catalog[index]
+    def swap(self, catalog: Dict[str, Any]) -> bool:
+        """
+        Atomically replaces the catalog. Returns False if content is unchanged,
+        in which case the version is kept so downstream caches stay warm.
+        """
+        if catalog == self.catalog and self.version > 0:
+            return False
+        matcher = PatternMatcher(list(catalog.keys()))
+        # No await between these assignments, so readers never see a mix
+        self.catalog = catalog
+        self._matcher = matcher
+        self._matcher_source = catalog
+        self._resolved = {}
+        self._field_indexes = {}
+        self.version += 1
+        return True
+
+    def _resolve_key(self, index: str) -> Optional[str]:
+        catalog = self.catalog
+        if catalog is not self._matcher_source:
+            # Catalog was replaced without swap() (e.g. in tests)
+            self._matcher = PatternMatcher(list(catalog.keys()))
+            self._matcher_source = catalog
+            self._resolved = {}
+
+        if index in self._resolved:
+            return self._resolved[index]
+
+        key = None
+        # Exact match first, then each comma-separated target in turn
+        if index in catalog:
+            key = index
+        else:
+            for part in index.split(","):
+                part = part.strip()
+                if not part or part.startswith("-"):
+                    continue
+                if part in catalog:
+                    key = part
+                else:
+                    key = self._matcher.match(part)
+                if key is not None:
+                    break
         # Or return first key if only one exists (simple MVP logic)
-        if len(self.catalog) == 1:
-            return list(self.catalog.values())[0]
-        return {}
-    
+        if key is None and len(catalog) == 1:
+            key = next(iter(catalog))
+
+        if len(self._resolved) >= 4096:
+            self._resolved = {}
+        self._resolved[index] = key
+        return key
+
+    def get_index_fields(self, index: str) -> Dict[str, Any]:
+        key = self._resolve_key(index)
+        if key is None:
+            return {}
+        return self.catalog[key]
+
     def validate_field(self, index: str, field: str) -> bool:
         fields = self.get_index_fields(index)
         return field in fields
@@ -36,4 +297,78 @@ class FieldCatalog:
             return fields[field]["type"]
         return None
 
+    def get_field_index(self, index: str) -> FieldIndex:
+        key = self._resolve_key(index)
+        fields = self.catalog[key] if key is not None else {}
+        cached = self._field_indexes.get(key)
+        if cached is None or cached[0] is not fields:
+            cached = (fields, FieldIndex(fields))
+            self._field_indexes[key] = cached
+        return cached[1]
+
+    def select_fields(self, index: str, nl_query: str, top_k: int, token_budget: int) -> List[str]:
+        """Top-K fields most relevant to nl_query that fit in token_budget."""
+        return self.get_field_index(index).select(nl_query, top_k, token_budget)
+
+    def render_for_prompt(self, index: str, nl_query: str, top_k: int, token_budget: int) -> str:
+        field_index = self.get_field_index(index)
+        return field_index.render(field_index.select(nl_query, top_k, token_budget))
+
+    # ---- background refresh ----
+
+    def _source_mtime(self) -> Optional[tuple]:
+        mtimes = tuple(os.path.getmtime(p) if os.path.exists(p) else None
+                       for p in (self.path, compact_path(self.path)))
+        return mtimes if any(m is not None for m in mtimes) else None
+
+    async def refresh_from_file(self) -> bool:
+        mtime = self._source_mtime()
+        if mtime is None or mtime == self._mtime:
+            return False
+
+        # Parse off the event loop; only the swap itself happens here
+        catalog = await asyncio.to_thread(read_catalog, self.path)
+        self._mtime = mtime
+        return self.swap(catalog)
+
+    async def refresh_from_es(self) -> bool:
+        patterns = list(self.catalog.keys()) or [settings.ES_DEFAULT_INDEX]
+        catalog, errors = await fetch_catalog(patterns, settings.CATALOG_FETCH_CONCURRENCY)
+        # A failed pattern keeps its last good fields
+        for pattern in errors:
+            if pattern in self.catalog:
+                catalog[pattern] = self.catalog[pattern]
+        return self.swap(catalog)
+
+    async def _refresh_loop(self, mode: str, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if mode == "es":
+                    changed = await self.refresh_from_es()
+                else:
+                    changed = await self.refresh_from_file()
+                if changed:
+                    print(f"Field catalog refreshed from {mode}, version {self.version}")
+            except Exception as e:
+                # Keep serving the last good catalog
+                print(f"Warning: Field catalog refresh failed: {e}")
+
+    def start_refresher(self):
+        mode = settings.CATALOG_REFRESH_MODE
+        if mode == "off" or self._refresher is not None:
+            return
+        self._refresher = asyncio.create_task(
+            self._refresh_loop(mode, settings.CATALOG_REFRESH_INTERVAL_S)
+        )
+
+    async def stop_refresher(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
 field_catalog = FieldCatalog()
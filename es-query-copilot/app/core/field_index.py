@@ -0,0 +1,164 @@
+import heapq
+import math
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Set
+
+TEXT_TYPES = {"text", "match_only_text"}
+NUMERIC_TYPES = {
+    "long", "integer", "short", "byte", "double", "float",
+    "half_float", "scaled_float", "unsigned_long"
+}
+DATE_TYPES = {"date", "date_nanos"}
+
+# NL terms (English and Chinese) -> field-name tokens or type tags they hint at
+SYNONYMS: Dict[str, List[str]] = {
+    # time
+    "time": ["type:date", "time", "timestamp"],
+    "date": ["type:date", "date"],
+    "day": ["type:date"], "days": ["type:date"], "week": ["type:date"], "month": ["type:date"],
+    "hour": ["type:date"], "last": ["type:date"], "recent": ["type:date"],
+    "created": ["created", "create", "type:date"], "updated": ["updated", "update", "type:date"],
+    "时间": ["type:date", "time", "timestamp"], "日期": ["type:date", "date"],
+    "最近": ["type:date"], "天": ["type:date"], "周": ["type:date"], "月": ["type:date"],
+    "小时": ["type:date"], "每天": ["type:date"], "创建": ["created", "create", "type:date"],
+    "更新": ["updated", "update", "type:date"],
+    # status
+    "failed": ["status", "state"], "failure": ["status", "state"], "success": ["status", "state"],
+    "status": ["status", "state"], "失败": ["status", "state"], "成功": ["status", "state"],
+    "状态": ["status", "state"],
+    # geography
+    "country": ["country", "region"], "city": ["city"], "region": ["region", "country"],
+    "国家": ["country", "region"], "城市": ["city"], "地区": ["region", "country"],
+    # money / numbers
+    "amount": ["amount", "price", "total", "type:numeric"], "price": ["price", "amount", "type:numeric"],
+    "revenue": ["amount", "revenue", "total", "type:numeric"], "sales": ["amount", "sales", "type:numeric"],
+    "金额": ["amount", "price", "total", "type:numeric"], "价格": ["price", "amount", "type:numeric"],
+    "销售": ["amount", "sales", "type:numeric"], "总额": ["amount", "total", "type:numeric"],
+    "大于": ["type:numeric"], "小于": ["type:numeric"], "超过": ["type:numeric"],
+    "数量": ["count", "quantity", "qty", "type:numeric"],
+    # entities
+    "order": ["order"], "orders": ["order"], "订单": ["order"],
+    "user": ["user", "customer"], "customer": ["customer", "user"],
+    "用户": ["user", "customer"], "客户": ["customer", "user"],
+    "product": ["product", "item", "sku"], "商品": ["product", "item", "sku"],
+    "产品": ["product", "item", "sku"],
+    "category": ["category"], "类别": ["category"], "分类": ["category"],
+    "name": ["name", "title"], "名称": ["name", "title"], "标题": ["title", "name"],
+}
+
+_SPLIT_RE = re.compile(r"[^0-9a-zA-Z]+")
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_WORD_RE = re.compile(r"[0-9a-zA-Z]+")
+# Longest keys first so "每天" wins over "天" when scanning CJK text
+_CJK_KEYS = sorted((k for k in SYNONYMS if not k.isascii()), key=len, reverse=True)
+
+def _type_tag(ftype: str) -> str:
+    if ftype in DATE_TYPES:
+        return "type:date"
+    if ftype in NUMERIC_TYPES:
+        return "type:numeric"
+    if ftype in TEXT_TYPES:
+        return "type:text"
+    return f"type:{ftype}"
+
+def _field_tokens(name: str, ftype: str) -> Set[str]:
+    tokens = {_type_tag(ftype)}
+    for part in _SPLIT_RE.split(_CAMEL_RE.sub(" ", name)):
+        if part:
+            tokens.add(part.lower())
+            # Cheap plural folding: "orders" -> "order"
+            if len(part) > 3 and part.lower().endswith("s"):
+                tokens.add(part.lower()[:-1])
+    return tokens
+
+def _query_tokens(nl_query: str) -> Dict[str, float]:
+    weights: Dict[str, float] = defaultdict(float)
+    text = nl_query.lower()
+    for word in _WORD_RE.findall(text):
+        if word.isdigit():
+            # Numbers are slot values ("last 7 days"), not field names
+            continue
+        weights[word] += 1.0
+        for syn in SYNONYMS.get(word, ()):
+            weights[syn] += 0.8
+    for key in _CJK_KEYS:
+        if key in text:
+            for syn in SYNONYMS[key]:
+                weights[syn] += 0.8
+    return weights
+
+class FieldIndex:
+    """
+    Inverted index from field-name tokens and type tags to fields, built
+    once per catalog entry. Each field's prompt line is precomputed.
+    """
+    def __init__(self, fields: Dict[str, Any]):
+        self.order: List[str] = list(fields.keys())
+        self.position: Dict[str, int] = {name: i for i, name in enumerate(self.order)}
+        self.lines: Dict[str, str] = {}
+        self.costs: Dict[str, int] = {}
+        self.postings: Dict[str, List[str]] = defaultdict(list)
+        self.date_fields: List[str] = []
+
+        for name, info in fields.items():
+            ftype = info.get("type", "unknown")
+            line = f"{name}: {ftype}"
+            if not info.get("aggregatable", True):
+                line += " [no-agg]"
+            if not info.get("searchable", True):
+                line += " [no-search]"
+            self.lines[name] = line
+            self.costs[name] = estimate_tokens(line)
+            for token in _field_tokens(name, ftype):
+                self.postings[token].append(name)
+            if ftype in DATE_TYPES:
+                self.date_fields.append(name)
+
+        n = max(len(self.order), 1)
+        self.idf = {t: math.log(1 + n / len(names)) for t, names in self.postings.items()}
+
+    def rank(self, nl_query: str) -> Iterator[str]:
+        """
+        Fields best first. Lazy: only the fields the caller consumes are
+        popped from the heap, so a prompt-sized selection costs
+        O(matched + k log matched), not a sort of every matched field.
+        """
+        scores: Dict[str, float] = defaultdict(float)
+        for token, weight in _query_tokens(nl_query).items():
+            for name in self.postings.get(token, ()):
+                scores[name] += weight * self.idf[token]
+
+        # Time filters are added by default (see SYSTEM_PROMPT), so always offer a date field
+        for name in self.date_fields[:1]:
+            scores[name] += 0.5
+
+        heap = [(-score, self.position[name], name) for name, score in scores.items()]
+        heapq.heapify(heap)
+        while heap:
+            yield heapq.heappop(heap)[2]
+        # Unmatched fields follow in catalog order, so small indices still show everything
+        for name in self.order:
+            if name not in scores:
+                yield name
+
+    def select(self, nl_query: str, top_k: int, token_budget: int) -> List[str]:
+        selected = []
+        used = 0
+        for name in self.rank(nl_query):
+            if len(selected) >= top_k or used >= token_budget:
+                break
+            cost = self.costs[name]
+            if used + cost > token_budget:
+                continue
+            selected.append(name)
+            used += cost
+        return selected
+
+    def render(self, names: List[str]) -> str:
+        return "\n".join(self.lines[name] for name in names)
+
+def estimate_tokens(text: str) -> int:
+    # ~4 chars per token for ASCII; CJK is roughly one token per char
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
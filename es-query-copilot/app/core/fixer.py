@@ -1,55 +1,104 @@
+import asyncio
 from app.services.es_client import es_client
 from app.services.llm_client import llm_client
-from app.core.prompt import REPAIR_PROMPT
+from app.core.analyzer import dsl_analyzer
+from app.core.prompt import REPAIR_PROMPT, REPAIR_PROMPT_MINIMAL
 from app.core.config import settings
-from typing import Tuple, List, Dict, Any
+from app.core.metrics import stage, REPAIR_ROUNDS
+from typing import Tuple, List, Dict, Any, Optional
+
+# (is_valid, dsl, errors, local_fixes)
+Checked = Tuple[bool, Dict[str, Any], List[str], List[str]]
 
 class DSLFixer:
-    async def validate_and_fix(self, index: str, dsl: Dict[str, Any]) -> Tuple[bool, Dict[str, Any], List[str], bool]:
+    async def validate_and_fix(self, index: str, dsl: Dict[str, Any]) -> Tuple[bool, Dict[str, Any], List[str], bool, List[str]]:
+        """
+        Returns: (is_valid, final_dsl, error_list, was_fixed, warnings)
+        """
+        is_valid, current_dsl, last_errors, fixes = await self._check(index, dsl)
+        was_fixed = bool(fixes)
+        warnings = list(fixes)
+
+        rounds = 0
+        for _ in range(settings.MAX_VALIDATE_RETRY):
+            if is_valid:
+                break
+            # LLM repair; with REPAIR_CANDIDATES > 1 several candidates race
+            rounds += 1
+            with stage("repair"):
+                result = await self._repair(index, current_dsl, "; ".join(last_errors))
+            if result is None:
+                # If fixing fails (LLM error), abort fixing and return failure
+                break
+            is_valid, current_dsl, last_errors, fixes = result
+            was_fixed = True
+            warnings.extend(fixes)
+        REPAIR_ROUNDS.observe(rounds)
+
+        if is_valid:
+            return True, current_dsl, [], was_fixed, warnings
+        return False, current_dsl, last_errors, was_fixed, warnings
+
+    async def _check(self, index: str, dsl: Dict[str, Any]) -> Checked:
+        # 1. Local Validation against the field catalog
+        # Mechanical errors are rewritten here without an ES or LLM round trip
+        dsl, fixes, local_errors = dsl_analyzer.analyze(index, dsl)
+        if local_errors:
+            # Known-bad DSL: skip ES validate and go straight to repair
+            return False, dsl, local_errors, fixes
+
+        # 2. ES Validate
+        validation_result = await es_client.validate_query(index, dsl)
+        if validation_result.get("valid", False):
+            return True, dsl, [], fixes
+        return False, dsl, [validation_result.get("error", "Unknown error")], fixes
+
+    async def _repair_candidate(self, index: str, dsl: Dict[str, Any], error_msg: str, variant: int) -> Checked:
+        prompts = (REPAIR_PROMPT, REPAIR_PROMPT_MINIMAL)
+        temperatures = [float(t) for t in settings.REPAIR_TEMPERATURES.split(",") if t.strip()] or [0.0]
+        # Candidate 0 is exactly the sequential repair; later ones vary prompt and temperature
+        prompt = prompts[variant % len(prompts)].format(error=error_msg, dsl=str(dsl))
+        fixed_result = await llm_client.generate_json(
+            system_prompt="You are a JSON fixer.",
+            user_prompt=prompt,
+            temperature=temperatures[(variant // len(prompts)) % len(temperatures)]
+        )
+        # Support both direct JSON or wrapped in "dsl" key
+        candidate = fixed_result["dsl"] if "dsl" in fixed_result else fixed_result
+        return await self._check(index, candidate)
+
+    async def _repair(self, index: str, dsl: Dict[str, Any], error_msg: str) -> Optional[Checked]:
         """
-        Returns: (is_valid, final_dsl, error_list, was_fixed)
+        Runs REPAIR_CANDIDATES repairs concurrently and returns the first valid
+        one, cancelling the rest. Without a valid candidate (or once
+        REPAIR_BUDGET_S runs out) returns the first invalid one so the next
+        round can build on it; None when every candidate errored.
         """
-        current_dsl = dsl
-        was_fixed = False
-        last_errors = []
-
-        for attempt in range(settings.MAX_VALIDATE_RETRY + 1):
-            # 1. Local Validation (TODO: JSON Schema or simple checks)
-            # For MVP, rely on ES validate API mainly
-
-            # 2. ES Validate
-            validation_result = await es_client.validate_query(index, current_dsl)
-            
-            if validation_result.get("valid", False):
-                return True, current_dsl, [], was_fixed
-            
-            # Validation failed
-            error_msg = validation_result.get("error", "Unknown error")
-            last_errors = [error_msg] # In reality might be list
-            
-            # If we have retries left, try to fix
-            if attempt < settings.MAX_VALIDATE_RETRY:
-                try:
-                    prompt = REPAIR_PROMPT.format(error=error_msg, dsl=str(current_dsl))
-                    # Reuse LLM generating JSON, but prompt is different
-                    # We might need a separate method if we want just pure JSON back without wrappers
-                    # But generate_json handles it fine if LLM adheres to instruction
-                    fixed_result = await llm_client.generate_json(
-                        system_prompt="You are a JSON fixer.",
-                        user_prompt=prompt,
-                        temperature=0.0
-                    )
-                    # Support both direct JSON or wrapped in "dsl" key
-                    if "dsl" in fixed_result:
-                        current_dsl = fixed_result["dsl"]
-                    else:
-                        current_dsl = fixed_result
-                    
-                    was_fixed = True
-                except Exception:
-                    # If fixing fails (LLM error), abort fixing and return failure
+        count = max(1, settings.REPAIR_CANDIDATES)
+        budget = settings.REPAIR_BUDGET_S if settings.REPAIR_BUDGET_S > 0 else None
+        tasks = [asyncio.create_task(self._repair_candidate(index, dsl, error_msg, i)) for i in range(count)]
+        fallback: Optional[Checked] = None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + budget if budget else None
+        pending = set(tasks)
+        try:
+            while pending:
+                timeout = max(0.0, deadline - loop.time()) if deadline else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
                     break
-        
-        return False, current_dsl, last_errors, was_fixed
+                # Prefer lower-variant candidates when several finish together
+                for task in sorted(done, key=tasks.index):
+                    if task.exception() is not None:
+                        continue
+                    result = task.result()
+                    if result[0]:
+                        return result
+                    fallback = fallback or result
+            return fallback
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
 
 dsl_fixer = DSLFixer()
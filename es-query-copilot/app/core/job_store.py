@@ -0,0 +1,23 @@
+from typing import Any, Dict, List
+
+from app.core.config import settings
+from app.core.resource_store import ResourceStore
+from app.services.es_client import es_client
+
+class JobStore(ResourceStore):
+    """
+    Opaque job ids to ES async searches. Every entry owns one async search;
+    it is deleted in ES (cancelling it if still running) when the entry
+    expires, is evicted, or the job is cancelled. The ES keep_alive matches
+    the TTL, so ES drops orphaned searches too. Only touch an entry on get
+    when the ES keep_alive is extended with it.
+    """
+    @property
+    def keep_alive(self) -> str:
+        return f"{int(self.ttl)}s"
+
+    async def _close(self, jobs: List[Dict[str, Any]]):
+        for job in jobs:
+            await es_client.delete_async_search(job["es_id"])
+
+job_store = JobStore(maxsize=settings.MAX_JOBS, ttl=settings.JOB_TTL_S)
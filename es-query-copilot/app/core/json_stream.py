@@ -0,0 +1,139 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+class JSONObjectStreamParser:
+    """
+    Incremental scanner for a single top-level JSON object arriving in chunks.
+
+    feed() returns events as soon as they can be decided:
+      ("field", key, value)            a top-level member has fully closed
+      ("string_delta", key, i, text)   new decoded text of the i-th string in
+                                       a top-level array listed in `stream_arrays`
+    """
+    def __init__(self, stream_arrays: Tuple[str, ...] = ("explanation",)):
+        self.stream_arrays = stream_arrays
+        self.buf = ""
+        self.pos = 0
+        self.depth = 0
+        self.done = False
+
+        self.in_string = False
+        self.escape_remaining = 0
+        self.escape_unicode = False
+        # Top-level member state
+        self.phase = "key"  # key | value
+        self.key: Optional[str] = None
+        self.key_start = 0
+        self.value_start: Optional[int] = None
+        self.value_done = False
+
+        # Streamed array element state
+        self.elem_index = -1
+        self.elem_emit_pos = 0
+        self.elem_safe_pos = 0
+
+    def _streaming_elem(self) -> bool:
+        return self.depth == 2 and self.key in self.stream_arrays and self.value_start is not None
+
+    def _finish_value(self, end: int, events: List[tuple]):
+        if self.value_start is None or self.value_done:
+            return
+        raw = self.buf[self.value_start:end]
+        events.append(("field", self.key, json.loads(raw)))
+        self.value_done = True
+
+    def _flush_elem(self, events: List[tuple]):
+        if self.elem_safe_pos > self.elem_emit_pos:
+            raw = self.buf[self.elem_emit_pos:self.elem_safe_pos]
+            events.append(("string_delta", self.key, self.elem_index, json.loads(f'"{raw}"')))
+            self.elem_emit_pos = self.elem_safe_pos
+
+    def feed(self, chunk: str) -> List[tuple]:
+        events: List[tuple] = []
+        if self.done:
+            return events
+        self.buf += chunk
+        buf = self.buf
+
+        while self.pos < len(buf):
+            i = self.pos
+            c = buf[i]
+            self.pos += 1
+
+            if self.in_string:
+                streaming = self._streaming_elem()
+                if self.escape_remaining:
+                    if self.escape_remaining == -1:
+                        # First char after the backslash; \u needs 4 more hex digits
+                        self.escape_unicode = c == "u"
+                        self.escape_remaining = 4 if self.escape_unicode else 0
+                    else:
+                        self.escape_remaining -= 1
+                    if streaming and not self.escape_remaining:
+                        # Hold back a high surrogate until its pair arrives
+                        if not (self.escape_unicode and 0xD800 <= int(buf[i - 3:i + 1], 16) <= 0xDBFF):
+                            self.elem_safe_pos = i + 1
+                elif c == "\\":
+                    self.escape_remaining = -1
+                elif c == '"':
+                    self.in_string = False
+                    if streaming:
+                        self._flush_elem(events)
+                    elif self.depth == 1 and self.phase == "key":
+                        self.key = json.loads(buf[self.key_start:i + 1])
+                    elif self.depth == 1 and self.phase == "value":
+                        self._finish_value(i + 1, events)
+                elif streaming:
+                    self.elem_safe_pos = i + 1
+                continue
+
+            if c.isspace():
+                continue
+
+            if self.depth == 0:
+                if c == "{":
+                    self.depth = 1
+                    self.phase = "key"
+                continue
+
+            if c == '"':
+                self.in_string = True
+                if self.depth == 1 and self.phase == "key":
+                    self.key_start = i
+                elif self.depth == 1 and self.phase == "value" and self.value_start is None:
+                    self.value_start = i
+                elif self._streaming_elem():
+                    self.elem_index += 1
+                    self.elem_emit_pos = self.elem_safe_pos = i + 1
+            elif c in "{[":
+                if self.depth == 1 and self.value_start is None:
+                    self.value_start = i
+                self.depth += 1
+            elif c in "}]":
+                self.depth -= 1
+                if self.depth == 1:
+                    self._finish_value(i + 1, events)
+                elif self.depth == 0:
+                    # Pending scalar (number/true/false/null) ends at the closing brace
+                    self._finish_value(i, events)
+                    self.done = True
+                    break
+            elif self.depth == 1:
+                if c == ":":
+                    self.phase = "value"
+                    self.value_start = None
+                    self.value_done = False
+                elif c == ",":
+                    self._finish_value(i, events)
+                    self.phase = "key"
+                    self.key = None
+                elif self.phase == "value" and self.value_start is None:
+                    self.value_start = i
+
+        if self.in_string and self._streaming_elem():
+            self._flush_elem(events)
+        return events
+
+    def result(self) -> Any:
+        """Full parsed object once the stream is complete."""
+        return json.JSONDecoder().raw_decode(self.buf, self.buf.index("{"))[0]
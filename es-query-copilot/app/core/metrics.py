@@ -0,0 +1,161 @@
+import bisect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+_INF = 'le="+Inf"'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Spans of the current request, set by the trace middleware when a debug trace is asked for
+_trace: ContextVar[Optional[List[Tuple[str, float, float]]]] = ContextVar("trace", default=None)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _fmt_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.labelnames), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            entry[0][i] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(tuple(str(labels.get(n, "")) for n in self.labelnames))
+        return entry[2] if entry else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_fmt_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, _INF)} {count}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {repr(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {count}")
+        return lines
+
+class Registry:
+    """
+    Metric families rendered in Prometheus text format. Collectors are
+    callables returning (name, type, help, [(labels, value)]) for values that
+    live elsewhere (cache stats, client stats) and are read at scrape time.
+    """
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_fmt_labels(list(labels), list(labels.values()))} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+HTTP_SECONDS = registry.histogram(
+    "copilot_http_request_seconds", "Wall time per HTTP request.", ("method", "route", "status"))
+STAGE_SECONDS = registry.histogram(
+    "copilot_stage_seconds", "Wall time per pipeline stage.", ("stage",))
+ES_TOOK_SECONDS = registry.histogram(
+    "copilot_es_took_seconds", "Server-side `took` reported by Elasticsearch.", ("op",))
+REPAIR_ROUNDS = registry.histogram(
+    "copilot_repair_rounds", "LLM repair rounds per validate_and_fix call.", (), buckets=(0, 1, 2, 3, 5))
+LLM_TOKENS = registry.counter(
+    "copilot_llm_tokens_total", "Tokens reported in LLM usage blocks.", ("backend", "kind"))
+LLM_REQUESTS = registry.counter(
+    "copilot_llm_requests_total", "LLM attempts by backend and outcome.", ("backend", "outcome"))
+DRAFT_SOURCE = registry.counter(
+    "copilot_draft_source_total", "Where /draft answers came from.", ("source",))
+SEARCH_CACHE = registry.counter(
+    "copilot_search_cache_total", "/run result cache lookups by status.", ("status",))
+
+@contextmanager
+def stage(name: str):
+    """Times a block into copilot_stage_seconds and, when tracing, the request's spans."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        spans = _trace.get()
+        if spans is not None:
+            spans.append((name, start, elapsed))
+
+def start_trace() -> List[Tuple[str, float, float]]:
+    spans: List[Tuple[str, float, float]] = []
+    _trace.set(spans)
+    return spans
+
+def server_timing(spans: List[Tuple[str, float, float]], origin: float) -> str:
+    """Spans as a Server-Timing header value; desc carries the start offset in ms."""
+    return ", ".join(
+        f'{name};dur={elapsed * 1000:.1f};desc="+{(start - origin) * 1000:.0f}ms"'
+        for name, start, elapsed in spans
+    )
@@ -0,0 +1,214 @@
+import copy
+import re
+from typing import Any, Container, Dict, List, Tuple
+
+from app.core.config import settings
+
+class RewriteRule:
+    """
+    One performance rewrite. apply() mutates the DSL in place and returns a
+    message per change. `exact` rules never change what the query returns;
+    the others trade a little precision for speed and are opt-in.
+    """
+    name = ""
+    exact = True
+
+    def apply(self, dsl: Dict[str, Any]) -> List[str]:
+        raise NotImplementedError
+
+# Queries that compute or test their own scores (min_score, boosts, script
+# reading _score); the bools inside them must keep scoring
+SCORING_WRAPPERS = {"function_score", "script_score", "dis_max", "constant_score"}
+
+# Where a clause holds further queries; anything else (intervals rules,
+# span_* bodies, field params) is not a query position and is never rewritten
+_SUB_QUERIES = {
+    "constant_score": ("filter",),
+    "nested": ("query",),
+    "has_child": ("query",),
+    "has_parent": ("query",),
+    "function_score": ("query",),
+    "script_score": ("query",),
+    "boosting": ("positive", "negative"),
+    "dis_max": ("queries",),
+    "bool": ("must", "filter", "should", "must_not"),
+}
+
+def _iter_queries(node: Any, skip: Container[str] = ()):
+    """Yields every query object reachable from `node` through real query positions."""
+    if isinstance(node, list):
+        for value in node:
+            yield from _iter_queries(value, skip)
+        return
+    if not isinstance(node, dict):
+        return
+    yield node
+    for clause, body in node.items():
+        if clause in skip or clause not in _SUB_QUERIES or not isinstance(body, dict):
+            continue
+        for key in _SUB_QUERIES[clause]:
+            if key in body:
+                yield from _iter_queries(body[key], skip)
+
+def _iter_bools(node: Any):
+    for query in _iter_queries(node, SCORING_WRAPPERS):
+        if isinstance(query.get("bool"), dict):
+            yield query["bool"]
+
+def _iter_clauses(node: Any, clause: str):
+    """Yields every (parent, body) where parent[clause] == body at a query position."""
+    for query in _iter_queries(node):
+        if clause in query:
+            yield query, query[clause]
+
+def _sorts_by_score(sort: Any) -> bool:
+    items = sort if isinstance(sort, list) else [sort]
+    return any(s == "_score" or (isinstance(s, dict) and "_score" in s) for s in items)
+
+def _aggs_read_scores(aggs: Any) -> bool:
+    # top_hits ranks by score unless sorted on something else; scripts may read _score
+    if not isinstance(aggs, dict):
+        return False
+    for agg in aggs.values():
+        if not isinstance(agg, dict):
+            continue
+        for agg_type, body in agg.items():
+            if agg_type in ("aggs", "aggregations"):
+                if _aggs_read_scores(body):
+                    return True
+            elif agg_type == "top_hits" and isinstance(body, dict):
+                if body.get("track_scores") or "sort" not in body or _sorts_by_score(body["sort"]):
+                    return True
+            elif "_score" in str(body.get("script", "") if isinstance(body, dict) else ""):
+                return True
+    return False
+
+def _scores_unused(dsl: Dict[str, Any]) -> bool:
+    if "min_score" in dsl or "rescore" in dsl or "collapse" in dsl or dsl.get("track_scores"):
+        return False
+    if _aggs_read_scores(dsl.get("aggs") or dsl.get("aggregations")):
+        return False
+    if dsl.get("size", 10) == 0:
+        return True
+    sort = dsl.get("sort")
+    if not sort:
+        return False
+    return not _sorts_by_score(sort)
+
+class MustToFilter(RewriteRule):
+    name = "must_to_filter"
+
+    def apply(self, dsl: Dict[str, Any]) -> List[str]:
+        # Only when nothing reads the score: filter context skips scoring and is cacheable
+        if "query" not in dsl or not _scores_unused(dsl):
+            return []
+        moved = 0
+        for bool_body in _iter_bools(dsl["query"]):
+            if "must" not in bool_body:
+                continue
+            must = bool_body.pop("must")
+            must = must if isinstance(must, list) else [must]
+            existing = bool_body.get("filter", [])
+            existing = existing if isinstance(existing, list) else [existing]
+            bool_body["filter"] = existing + must
+            moved += len(must)
+        return [f"{self.name}: moved {moved} scoring must clause(s) to filter (scores unused)"] if moved else []
+
+class WildcardToPrefix(RewriteRule):
+    name = "wildcard_to_prefix"
+    _PLAIN_PREFIX = re.compile(r"^[^*?\\]+\*$")
+
+    def apply(self, dsl: Dict[str, Any]) -> List[str]:
+        messages = []
+        for parent, body in list(_iter_clauses(dsl.get("query", {}), "wildcard")):
+            if not isinstance(body, dict) or len(body) != 1:
+                continue
+            field, spec = next(iter(body.items()))
+            params = dict(spec) if isinstance(spec, dict) else {"value": spec}
+            value = params.pop("value", params.pop("wildcard", None))
+            if not isinstance(value, str) or not self._PLAIN_PREFIX.match(value):
+                continue
+            params["value"] = value[:-1]
+            del parent["wildcard"]
+            parent["prefix"] = {field: params}
+            messages.append(f"{self.name}: wildcard '{value}' on '{field}' rewritten as prefix")
+        return messages
+
+class AggOnlyNoHits(RewriteRule):
+    name = "agg_only_no_hits"
+    # An omitted size means 10 hits; dropping them changes the response
+    exact = False
+    # Relies on the draft contract (SYSTEM_PROMPT rule 6): size is omitted only when aggregating
+
+    def apply(self, dsl: Dict[str, Any]) -> List[str]:
+        has_aggs = bool(dsl.get("aggs") or dsl.get("aggregations"))
+        if not has_aggs or any(k in dsl for k in ("size", "from", "sort", "_source")):
+            return []
+        dsl["size"] = 0
+        return [f"{self.name}: aggregation-only request, hits skipped (size=0)"]
+
+class CapTrackTotalHits(RewriteRule):
+    name = "cap_track_total_hits"
+    exact = False
+
+    def apply(self, dsl: Dict[str, Any]) -> List[str]:
+        if dsl.get("track_total_hits") is not True:
+            return []
+        dsl["track_total_hits"] = settings.OPTIMIZER_TOTAL_HITS_CAP
+        return [f"{self.name}: exact hit count capped at {settings.OPTIMIZER_TOTAL_HITS_CAP} (total becomes a lower bound)"]
+
+class RoundNow(RewriteRule):
+    name = "round_now"
+    exact = False
+    _UNROUNDED_NOW = re.compile(r"^now(?:[+-]\d+[yMwdhHms])*$")
+
+    def apply(self, dsl: Dict[str, Any]) -> List[str]:
+        # ES only request-caches size=0 searches, and never ones using a raw `now`
+        if dsl.get("size", 10) != 0:
+            return []
+        rounded = 0
+        for _, body in list(_iter_clauses(dsl.get("query", {}), "range")):
+            if not isinstance(body, dict):
+                continue
+            for bounds in body.values():
+                if not isinstance(bounds, dict):
+                    continue
+                for key in ("gt", "gte", "lt", "lte", "from", "to"):
+                    value = bounds.get(key)
+                    if isinstance(value, str) and self._UNROUNDED_NOW.match(value):
+                        bounds[key] = f"{value}/m"
+                        rounded += 1
+        return [f"{self.name}: rounded {rounded} 'now' bound(s) to the minute for the request cache"] if rounded else []
+
+RULES = {rule.name: rule for rule in (
+    MustToFilter(), WildcardToPrefix(), AggOnlyNoHits(), CapTrackTotalHits(), RoundNow()
+)}
+
+class DSLOptimizer:
+    def __init__(self, rules: List[RewriteRule], allow_inexact: bool = False):
+        inexact = [rule.name for rule in rules if not rule.exact]
+        if inexact and not allow_inexact:
+            raise ValueError(f"Optimizer rules {inexact} change results; enable OPTIMIZER_ALLOW_INEXACT to use them")
+        self.rules = rules
+
+    def optimize(self, dsl: Dict[str, Any], dry_run: bool = False) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Returns: (dsl_to_execute, applied_rewrite_messages)
+        In dry-run mode the original DSL is returned and messages say what would change.
+        """
+        out = copy.deepcopy(dsl)
+        applied = []
+        for rule in self.rules:
+            applied.extend(rule.apply(out))
+        if dry_run:
+            return dsl, [f"[dry-run] {m}" for m in applied]
+        return out, applied
+
+def _rules_from_settings() -> List[RewriteRule]:
+    names = [n.strip() for n in settings.OPTIMIZER_RULES.split(",") if n.strip()]
+    unknown = [n for n in names if n not in RULES]
+    if unknown:
+        raise ValueError(f"Unknown optimizer rules: {unknown}")
+    return [RULES[n] for n in names]
+
+dsl_optimizer = DSLOptimizer(_rules_from_settings(), allow_inexact=settings.OPTIMIZER_ALLOW_INEXACT)
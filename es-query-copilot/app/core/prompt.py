@@ -1,3 +1,6 @@
+# Bump whenever SYSTEM_PROMPT changes so cached drafts are invalidated
+PROMPT_VERSION = "3"
+
 SYSTEM_PROMPT = """
 You are an Elasticsearch Query DSL expert. Convert the user's natural language query into executable Elasticsearch DSL.
 
@@ -13,17 +16,24 @@ Strict Rules:
 9) Avoid `query_string` or `script` unless absolutely necessary (high risk).
 
 Output Format:
-{
-  "dsl": {...},
+{{
+  "dsl": {{...}},
   "explanation": ["Step 1...", "Step 2..."],
   "confidence": 0.0 to 1.0,
-  "risk": {"level": "low/medium/high", "reasons": []}
-}
+  "risk": {{"level": "low/medium/high", "reasons": []}}
+}}
 
 Context:
 Index: {index}
 User Timezone: {timezone}
-Field Catalog: {catalog}
+Field Catalog (name: type):
+{catalog}
+{examples}"""
+
+# Appended to SYSTEM_PROMPT when similar validated queries exist
+EXAMPLES_SECTION = """
+Validated examples for this index (follow their conventions):
+{examples}
 """
 
 REPAIR_PROMPT = """
@@ -41,3 +51,16 @@ Common fixes:
 
 Output only the fixed JSON DSL.
 """
+
+# Alternative wording for speculative repair candidates; diversity beats temperature alone
+REPAIR_PROMPT_MINIMAL = """
+You are a DSL Repair Assistant.
+Elasticsearch rejected this DSL.
+Error: {error}
+DSL: {dsl}
+
+Make the smallest change that resolves the error and keep the query's intent.
+If a clause cannot be repaired, remove it rather than guessing.
+
+Output only the fixed JSON DSL.
+"""
@@ -0,0 +1,73 @@
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+class ResourceStore:
+    """
+    Bounded, TTL-evicted map of opaque tokens to entries that each own an
+    external resource. Subclasses release the resource in `_close`, which
+    runs when an entry expires, is evicted, or is released. Entries for
+    which `_busy` is true are never expired or evicted under their user.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    async def _close(self, entries: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def _busy(self, entry: Dict[str, Any]) -> bool:
+        return False
+
+    async def _sweep(self):
+        now = time.monotonic()
+        expired = []
+        # Entries are kept in last-access order, so expired ones sit at the front
+        for token, entry in list(self._data.items()):
+            if entry["expires_at"] > now:
+                break
+            if not self._busy(entry):
+                expired.append(self._data.pop(token))
+        await self._close(expired)
+
+    async def create(self, entry: Dict[str, Any]) -> str:
+        await self._sweep()
+        token = secrets.token_urlsafe(24)
+        entry["expires_at"] = time.monotonic() + self.ttl
+        self._data[token] = entry
+        evicted = []
+        # Oldest idle entries go first; never the one just created
+        for old in list(self._data)[:-1]:
+            if len(self._data) <= self.maxsize:
+                break
+            if not self._busy(self._data[old]):
+                evicted.append(self._data.pop(old))
+        await self._close(evicted)
+        return token
+
+    async def get(self, token: str, touch: bool = True) -> Optional[Dict[str, Any]]:
+        """touch=True extends the TTL and marks the entry most recently used."""
+        await self._sweep()
+        entry = self._data.get(token)
+        if entry is None or not touch:
+            return entry
+        entry["expires_at"] = time.monotonic() + self.ttl
+        self._data.move_to_end(token)
+        return entry
+
+    async def release(self, token: str) -> bool:
+        entry = self._data.pop(token, None)
+        if entry is None:
+            return False
+        await self._close([entry])
+        return True
+
+    async def close_all(self):
+        entries = list(self._data.values())
+        self._data.clear()
+        await self._close(entries)
@@ -1,60 +1,334 @@
-from typing import Dict, Any, List
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 
-class RiskAnalyzer:
-    def evaluate(self, dsl: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        Returns: {"level": "low/medium/high", "score": int, "reasons": []}
-        """
-        score = 0
+from app.core.config import settings
+from app.core.field_catalog import field_catalog, FieldCatalog
+from app.core.field_index import TEXT_TYPES, DATE_TYPES
+from app.services.es_client import es_client
+from app.core.metrics import stage
+
+# Per-candidate-doc cost of evaluating a clause, relative to a plain term lookup
+CLAUSE_COST = {
+    "wildcard": 0.5,
+    "leading_wildcard": 5.0,
+    "regexp": 0.5,
+    "leading_regexp": 5.0,
+    "query_script": 5.0,
+    "query_string": 0.2,
+    "fuzzy": 0.3,
+    "prefix": 0.05,
+    "match": 0.05,
+    "term": 0.01,
+}
+# Share of candidates each further clause leaves for the next one to check;
+# Lucene intersects conjunctions, so clause costs do not simply add up
+CLAUSE_SELECTIVITY = 0.5
+FETCH_COST_PER_HIT = 100.0
+AGG_COST_PER_DOC = 0.02
+AGG_SCRIPT_COST_PER_DOC = 2.0
+# Sort scripts, script_fields and runtime_mappings run per candidate doc too
+DOC_SCRIPT_COST_PER_DOC = 2.0
+BUCKET_COST = 10.0
+FIELDDATA_PENALTY = 50.0
+# Assumed share of the index a time filter keeps when nothing better is known
+TIME_FILTER_SELECTIVITY = 0.1
+# Buckets assumed for aggs whose bucket count is not given by a size
+DEFAULT_AGG_BUCKETS = {"date_histogram": 30, "histogram": 20, "range": 5, "date_range": 5, "filters": 5}
+
+class QueryFeatures:
+    """Everything the cost model needs, collected in one pass over the DSL."""
+    def __init__(self):
+        self.clauses: Dict[str, int] = {}
+        self.has_script = False
+        self.query_scripts = 0
+        self.agg_scripts = 0
+        self.doc_scripts = 0
+        self.agg_depth = 0
+        self.agg_count = 0
+        self.bucket_product = 1
+        self.fielddata_fields: List[str] = []
+        self.has_time_filter = False
+        self.has_date_fields = False
+        self.range_fields: List[str] = []
+        self.size = 10
+        self.from_ = 0
+
+    def add(self, clause: str):
+        self.clauses[clause] = self.clauses.get(clause, 0) + 1
+
+class _FeatureVisitor:
+    def __init__(self, fields: Dict[str, Any], has_date_fields: bool = False):
+        self.fields = fields
+        self.has_date_fields = has_date_fields
+        self.f = QueryFeatures()
+
+    def _field_type(self, field: Any) -> Optional[str]:
+        info = self.fields.get(field) if isinstance(field, str) else None
+        return info.get("type") if info else None
+
+    def visit(self, dsl: Dict[str, Any]) -> QueryFeatures:
+        f = self.f
+        f.has_date_fields = self.has_date_fields
+        f.size = dsl.get("size", 10) if isinstance(dsl.get("size", 10), int) else 10
+        f.from_ = dsl.get("from", 0) if isinstance(dsl.get("from", 0), int) else 0
+        for key, value in dsl.items():
+            if key in ("query", "post_filter"):
+                self._query(value)
+            elif key in ("aggs", "aggregations"):
+                self._aggs(value, 1, 1)
+            else:
+                # script_fields, sort scripts, runtime_mappings: per-hit or per-doc scripts
+                self._scan_scripts(value)
+        return f
+
+    def _scan_scripts(self, node: Any):
+        if isinstance(node, dict):
+            if "script" in node:
+                self.f.has_script = True
+                self.f.doc_scripts += 1
+            for v in node.values():
+                self._scan_scripts(v)
+        elif isinstance(node, list):
+            for v in node:
+                self._scan_scripts(v)
+
+    def _leaf_value(self, body: Any) -> Tuple[Optional[str], Any]:
+        if isinstance(body, dict):
+            for field, value in body.items():
+                if field in ("boost", "_name", "rewrite", "case_insensitive"):
+                    continue
+                if isinstance(value, dict):
+                    value = value.get("value", value.get("wildcard", value.get("query")))
+                return field, value
+        return None, None
+
+    def _query(self, node: Any):
+        f = self.f
+        if isinstance(node, list):
+            for v in node:
+                self._query(v)
+            return
+        if not isinstance(node, dict):
+            return
+
+        for clause, body in node.items():
+            if clause == "wildcard":
+                field, value = self._leaf_value(body)
+                leading = isinstance(value, str) and value[:1] in ("*", "?")
+                f.add("leading_wildcard" if leading else "wildcard")
+            elif clause == "regexp":
+                field, value = self._leaf_value(body)
+                leading = isinstance(value, str) and value[:2] in (".*", ".+", ".?")
+                f.add("leading_regexp" if leading else "regexp")
+            elif clause in ("query_string", "simple_query_string"):
+                query = body.get("query", "") if isinstance(body, dict) else ""
+                f.add("query_string")
+                if isinstance(query, str) and (query.startswith("*") or " *" in query or ":*" in query):
+                    f.add("leading_wildcard")
+            elif clause == "script":
+                f.has_script = True
+                f.query_scripts += 1
+            elif clause == "script_score":
+                f.has_script = True
+                f.query_scripts += 1
+                if isinstance(body, dict):
+                    self._query(body.get("query"))
+            elif clause in ("fuzzy", "prefix"):
+                f.add(clause)
+            elif clause in ("match", "match_phrase", "multi_match", "match_phrase_prefix"):
+                f.add("match")
+            elif clause in ("term", "terms", "exists", "ids"):
+                f.add("term")
+            elif clause == "range":
+                f.add("term")
+                field, value = self._leaf_value(body)
+                if field:
+                    f.range_fields.append(field)
+                    ftype = self._field_type(field)
+                    if ftype in DATE_TYPES or (ftype is None and self._looks_like_time(body.get(field))):
+                        f.has_time_filter = True
+            elif isinstance(body, (dict, list)):
+                # bool, constant_score, nested, function_score, dis_max, ...
+                if isinstance(body, dict) and "script" in body and clause == "function_score":
+                    f.has_script = True
+                    f.query_scripts += 1
+                self._query(body)
+
+    @staticmethod
+    def _looks_like_time(bounds: Any) -> bool:
+        if not isinstance(bounds, dict):
+            return False
+        for key in ("gt", "gte", "lt", "lte", "from", "to"):
+            value = bounds.get(key)
+            if isinstance(value, str) and ("now" in value or value[:4].isdigit() and "-" in value):
+                return True
+        return "format" in bounds or "time_zone" in bounds
+
+    def _aggs(self, aggs: Any, depth: int, buckets_above: int):
+        f = self.f
+        if not isinstance(aggs, dict):
+            return
+        f.agg_depth = max(f.agg_depth, depth)
+        for agg in aggs.values():
+            if not isinstance(agg, dict):
+                continue
+            f.agg_count += 1
+            buckets = 1
+            for agg_type, body in agg.items():
+                if agg_type in ("aggs", "aggregations"):
+                    continue
+                if not isinstance(body, dict):
+                    continue
+                if "script" in body:
+                    f.has_script = True
+                    f.agg_scripts += 1
+                if agg_type == "filter":
+                    self._query(body)
+                    continue
+                if agg_type in ("terms", "multi_terms", "composite", "significant_terms", "rare_terms"):
+                    buckets = body.get("size", 10) if isinstance(body.get("size", 10), int) else 10
+                    field = body.get("field")
+                    if self._field_type(field) in TEXT_TYPES:
+                        f.fielddata_fields.append(field)
+                elif agg_type in DEFAULT_AGG_BUCKETS:
+                    buckets = DEFAULT_AGG_BUCKETS[agg_type]
+
+            level_buckets = buckets_above * buckets
+            f.bucket_product = max(f.bucket_product, level_buckets)
+            for key in ("aggs", "aggregations"):
+                if key in agg:
+                    self._aggs(agg[key], depth + 1, level_buckets)
+
+class CostModel:
+    """
+    Turns QueryFeatures into (estimated_cost, reasons). Cost is in abstract
+    "doc-operation" units; subclass and pass to RiskAnalyzer to plug in another.
+    """
+    def estimate(self, features: QueryFeatures, stats: Dict[str, Any]) -> Tuple[float, List[str]]:
+        raise NotImplementedError
+
+class HeuristicCostModel(CostModel):
+    def estimate(self, features: QueryFeatures, stats: Dict[str, Any]) -> Tuple[float, List[str]]:
         reasons = []
-        
-        # 1. Size check
-        size = dsl.get("size", 10)
-        from_ = dsl.get("from", 0)
-        if size > 200:
-            score += 20
-            reasons.append("Size > 200")
-        if size + from_ > 10000:
-            # This is hard limit usually, but here we treat as risk if not using search_after
-            score += 30
-            reasons.append("Deep pagination (from+size > 10000)")
-
-        # 2. Wildcard check
-        # Simplified recursive check for "wildcard" or "regexp" keys
-        if self._has_key(dsl, "wildcard"):
-            score += 40
+        f = features
+        docs = stats.get("docs", settings.RISK_DEFAULT_DOC_COUNT)
+        shards = stats.get("shards", 1)
+
+        # 1. Candidate docs after the time filter (if any)
+        candidates = docs * (TIME_FILTER_SELECTIVITY if f.has_time_filter else 1.0)
+        if not f.has_time_filter and f.has_date_fields:
+            reasons.append("No time filter")
+
+        # 2. Query clauses, most expensive first, each over a narrower candidate set
+        costs = [CLAUSE_COST[c] for c, n in f.clauses.items() for _ in range(n)]
+        costs += [CLAUSE_COST["query_script"]] * f.query_scripts
+        costs.sort(reverse=True)
+        per_doc = sum(c * CLAUSE_SELECTIVITY ** i for i, c in enumerate(costs)) or CLAUSE_COST["term"]
+        per_doc += DOC_SCRIPT_COST_PER_DOC * f.doc_scripts
+        cost = candidates * per_doc
+
+        if f.clauses.get("leading_wildcard"):
             reasons.append("Wildcard query used")
-        if self._has_key(dsl, "regexp"):
-            score += 40
+            reasons.append("Leading wildcard pattern")
+        elif f.clauses.get("wildcard"):
+            reasons.append("Wildcard query used")
+        if f.clauses.get("regexp") or f.clauses.get("leading_regexp"):
             reasons.append("Regexp query used")
-            
-        # 3. Script check
-        if self._has_key(dsl, "script"):
-            score += 40
+        if f.has_script:
             reasons.append("Scripting used")
-            
-        # 4. Aggregation depth (simple check)
-        # TODO: checking nested aggs depth
-        
+
+        # 3. Fetch phase; every shard sorts from+size entries
+        window = f.size + f.from_
+        cost += window * FETCH_COST_PER_HIT + window * max(shards - 1, 0)
+        if f.size > settings.MAX_SIZE:
+            reasons.append(f"Size > {settings.MAX_SIZE}")
+        if window > settings.MAX_FROM_SIZE:
+            reasons.append(f"Deep pagination (from+size > {settings.MAX_FROM_SIZE})")
+
+        # 4. Aggregations
+        if f.agg_count:
+            agg_per_doc = AGG_COST_PER_DOC * f.agg_count + AGG_SCRIPT_COST_PER_DOC * f.agg_scripts
+            cost += candidates * agg_per_doc + f.bucket_product * BUCKET_COST * shards
+            if f.agg_depth > 3:
+                reasons.append(f"Aggregation depth {f.agg_depth}")
+            if f.bucket_product > 10000:
+                reasons.append(f"Up to {f.bucket_product} buckets across agg levels")
+            if f.fielddata_fields:
+                cost *= FIELDDATA_PENALTY
+                reasons.append(f"Aggregation on text fields: {', '.join(f.fielddata_fields)}")
+
+        return cost, reasons
+
+class RiskAnalyzer:
+    def __init__(self, cost_model: Optional[CostModel] = None, catalog: FieldCatalog = field_catalog):
+        self.cost_model = cost_model or HeuristicCostModel()
+        self.catalog = catalog
+        # index -> (fetched_at, {"docs": int, "shards": int}); LRU, index strings come from clients
+        self._stats: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def analyze(self, dsl: Dict[str, Any], index: Optional[str] = None) -> QueryFeatures:
+        if not index:
+            return _FeatureVisitor({}).visit(dsl)
+        # The field index is built once per catalog version; it already knows the date fields
+        has_date_fields = bool(self.catalog.get_field_index(index).date_fields)
+        return _FeatureVisitor(self.catalog.get_index_fields(index), has_date_fields).visit(dsl)
+
+    def evaluate(self, dsl: Dict[str, Any], index: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Returns: {"level": "low/medium/high", "score": int, "reasons": [], "estimated_cost": float}
+        """
+        with stage("risk"):
+            features = self.analyze(dsl, index)
+            stats = self._cached_stats(index) if index else {}
+            cost, reasons = self.cost_model.estimate(features, stats)
+
+        # Score is the cost on a log scale: medium threshold -> 30, high threshold -> 60
+        medium, high = settings.RISK_MEDIUM_COST, settings.RISK_HIGH_COST
+        score = 30 + 30 * math.log10(max(cost, 1.0) / medium) / math.log10(high / medium)
+        score = int(max(0, min(100, round(score))))
+
         level = "low"
-        if score >= 60:
+        if cost >= high:
             level = "high"
-        elif score >= 30:
+        elif cost >= medium:
             level = "medium"
-            
+
         return {
             "level": level,
             "score": score,
-            "reasons": reasons
+            "reasons": reasons,
+            "estimated_cost": cost
         }
 
-    def _has_key(self, obj: Any, key: str) -> bool:
-        if isinstance(obj, dict):
-            if key in obj:
-                return True
-            return any(self._has_key(v, key) for v in obj.values())
-        if isinstance(obj, list):
-            return any(self._has_key(v, key) for v in obj)
-        return False
+    def _cached_stats(self, index: str) -> Dict[str, Any]:
+        entry = self._stats.get(index)
+        if entry is None:
+            return {}
+        self._stats.move_to_end(index)
+        return entry[1]
+
+    def index_stats(self, index: str) -> Dict[str, Any]:
+        """Last calibrated {"docs", "shards"} for index; empty until calibrate() ran."""
+        return dict(self._cached_stats(index))
+
+    async def calibrate(self, index: str):
+        """Refreshes cached doc count and shard count for index (via _count) when stale."""
+        entry = self._stats.get(index)
+        if entry and time.monotonic() - entry[0] < settings.RISK_STATS_TTL_S:
+            return
+        try:
+            resp = await es_client.count(index=index)
+        except Exception:
+            # Keep the defaults; calibration is best-effort
+            return
+        self._stats[index] = (time.monotonic(), {
+            "docs": resp.get("count", settings.RISK_DEFAULT_DOC_COUNT),
+            "shards": resp.get("_shards", {}).get("total", 1)
+        })
+        self._stats.move_to_end(index)
+        while len(self._stats) > settings.RISK_STATS_MAX:
+            self._stats.popitem(last=False)
 
 risk_analyzer = RiskAnalyzer()
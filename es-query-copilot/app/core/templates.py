@@ -0,0 +1,251 @@
+import copy
+import json
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+# The N in date math such as "now-7d" or "now-30d/d"
+_DATE_MATH_NUM_RE = re.compile(r"(?<=now[+-])(\d+)(?=[yMwdhHms])")
+# Only values of these clauses may become slots; field names, formats etc. never do
+_VALUE_CLAUSES = {"term", "terms", "match", "match_phrase"}
+_ASCII_VALUE_RE = re.compile(r"^[a-z0-9_.@\-]+$")
+
+def normalize_nl_query(nl_query: str) -> str:
+    # NFKC folds full-width characters, so "ＴＯＰ１０" and "top10" share an entry
+    text = unicodedata.normalize("NFKC", nl_query).casefold()
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+def _iter_leaves(node: Any, path: Tuple = ()):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _iter_leaves(value, path + (key,))
+    elif isinstance(node, list):
+        for i, value in enumerate(node):
+            yield from _iter_leaves(value, path + (i,))
+    else:
+        yield path, node
+
+def _set_path(node: Any, path: List, value: Any):
+    for key in path[:-1]:
+        node = node[key]
+    node[path[-1]] = value
+
+class Template:
+    """
+    A validated DSL whose slots are bound to spans of the question.
+    Each slot: {"kind": "number" | "value", "bindings": [{"path": [...], "format": str | None, "upper": bool}]}
+    """
+    def __init__(self, pattern: str, dsl: Dict[str, Any], slots: List[Dict[str, Any]], source: str,
+                 support: int = 1, hits: int = 0):
+        self.pattern = pattern
+        self.dsl = dsl
+        self.slots = slots
+        self.source = source
+        self.support = support
+        self.hits = hits
+
+    def fill(self, values: List[str]) -> Dict[str, Any]:
+        dsl = copy.deepcopy(self.dsl)
+        for slot, raw in zip(self.slots, values):
+            for binding in slot["bindings"]:
+                if binding["format"] is not None:
+                    value: Any = binding["format"].format(raw)
+                elif slot["kind"] == "number":
+                    value = float(raw) if "." in raw else int(raw)
+                else:
+                    value = raw.upper() if binding["upper"] else raw
+                _set_path(dsl, binding["path"], value)
+        return dsl
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pattern": self.pattern, "dsl": self.dsl, "slots": self.slots,
+            "source": self.source, "support": self.support, "hits": self.hits
+        }
+
+def compile_template(nl_query: str, dsl: Dict[str, Any]) -> Optional[Template]:
+    """
+    Turns a (question, validated DSL) pair into a Template. Numbers in the
+    question that appear in the DSL (as a numeric leaf or inside `now-Nd`
+    date math) become number slots; term/match values that appear verbatim
+    become value slots. Returns None when a binding would be ambiguous.
+    """
+    text = normalize_nl_query(nl_query)
+    leaves = list(_iter_leaves(dsl))
+    spans: List[Tuple[int, int, Dict[str, Any]]] = []
+
+    numbers = [m for m in _NUMBER_RE.finditer(text)]
+    counts: Dict[str, int] = {}
+    for m in numbers:
+        counts[m.group()] = counts.get(m.group(), 0) + 1
+
+    for m in numbers:
+        token = m.group()
+        date_bindings, leaf_bindings = [], []
+        for path, leaf in leaves:
+            if isinstance(leaf, str):
+                for dm in _DATE_MATH_NUM_RE.finditer(leaf):
+                    if dm.group() == token:
+                        fmt = leaf[:dm.start()].replace("{", "{{").replace("}", "}}") + "{}" + \
+                              leaf[dm.end():].replace("{", "{{").replace("}", "}}")
+                        date_bindings.append({"path": list(path), "format": fmt, "upper": False})
+            elif isinstance(leaf, (int, float)) and not isinstance(leaf, bool):
+                if _NUMBER_RE.fullmatch(token) and float(token) == leaf:
+                    leaf_bindings.append({"path": list(path), "format": None, "upper": False})
+        # Time ranges win over a coincidental equal number elsewhere in the DSL
+        bindings = date_bindings or leaf_bindings
+        if not bindings:
+            continue
+        if counts[token] > 1:
+            # "top 7 in the last 7 days": cannot tell which 7 is which
+            return None
+        spans.append((m.start(), m.end(), {"kind": "number", "bindings": bindings}))
+
+    for path, leaf in leaves:
+        if not isinstance(leaf, str) or len(leaf) < 2 or leaf.isdigit() or leaf.startswith("now"):
+            continue
+        if not any(key in _VALUE_CLAUSES for key in path if isinstance(key, str)):
+            continue
+        folded = normalize_nl_query(leaf)
+        hits = [m for m in re.finditer(rf"(?<!\w){re.escape(folded)}(?!\w)", text)]
+        if len(hits) != 1:
+            continue
+        start, end = hits[0].span()
+        binding = {"path": list(path), "format": None, "upper": leaf.isupper()}
+        existing = next((s for s in spans if s[0] == start and s[1] == end and s[2]["kind"] == "value"), None)
+        if existing:
+            existing[2]["bindings"].append(binding)
+        elif not any(s[0] < end and start < s[1] for s in spans):
+            spans.append((start, end, {"kind": "value", "bindings": [binding], "ascii": bool(_ASCII_VALUE_RE.match(folded))}))
+
+    if not spans:
+        return None
+
+    spans.sort(key=lambda s: s[0])
+    parts, slots, pos = [], [], 0
+    for start, end, slot in spans:
+        parts.append(re.escape(text[pos:start]))
+        if slot["kind"] == "number":
+            # Date math takes whole units only: "now-7.5d" is not valid ES
+            date_math = any(b["format"] is not None for b in slot["bindings"])
+            parts.append(r"(\d+)" if date_math else r"(\d+(?:\.\d+)?)")
+        else:
+            parts.append(r"([a-z0-9_.@\-]+)" if slot.pop("ascii") else r"(\S+?)")
+        slots.append(slot)
+        pos = end
+    parts.append(re.escape(text[pos:]))
+    return Template("".join(parts), copy.deepcopy(dsl), slots, nl_query)
+
+class TemplateStore:
+    """
+    Learned templates per (index, timezone), matched with one combined regex
+    per scope. Bounded LRU across all scopes; a template answers only once it
+    has been learned TEMPLATE_MIN_SUPPORT times.
+    """
+    def __init__(self, maxsize: int = settings.TEMPLATE_MAX):
+        self.maxsize = maxsize
+        self._templates: Dict[Tuple[str, str], "OrderedDict[str, Template]"] = {}
+        self._compiled: Dict[Tuple[str, str], Tuple[re.Pattern, List[Template]]] = {}
+        # (scope, pattern) in last learned/used order, oldest first
+        self._lru: "OrderedDict[Tuple[Tuple[str, str], str], None]" = OrderedDict()
+        self._stats = {"learned": 0, "rejected": 0, "hits": 0, "misses": 0}
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def _touch(self, scope: Tuple[str, str], pattern: str):
+        self._lru[(scope, pattern)] = None
+        self._lru.move_to_end((scope, pattern))
+
+    def _evict(self):
+        while len(self._lru) > self.maxsize:
+            scope, pattern = self._lru.popitem(last=False)[0]
+            templates = self._templates[scope]
+            del templates[pattern]
+            if not templates:
+                del self._templates[scope]
+            self._compiled.pop(scope, None)
+
+    def learn(self, index: str, timezone: str, nl_query: str, dsl: Dict[str, Any]) -> bool:
+        template = compile_template(nl_query, dsl)
+        if template is None:
+            self._stats["rejected"] += 1
+            return False
+        scope = (index, timezone)
+        templates = self._templates.setdefault(scope, OrderedDict())
+        previous = templates.pop(template.pattern, None)
+        if previous is not None:
+            template.support = previous.support + 1
+            template.hits = previous.hits
+        templates[template.pattern] = template
+        self._touch(scope, template.pattern)
+        self._compiled.pop(scope, None)
+        self._evict()
+        self._stats["learned"] += 1
+        return True
+
+    def _matcher(self, scope: Tuple[str, str]) -> Optional[Tuple[re.Pattern, List[Template]]]:
+        if scope not in self._compiled:
+            ready = [t for t in self._templates.get(scope, {}).values() if t.support >= settings.TEMPLATE_MIN_SUPPORT]
+            if not ready:
+                return None
+            # One alternation per scope: the outer group of the alternative that matched
+            # is m.lastgroup, so a single fullmatch finds the template and its slots
+            alternatives = [f"(?P<t{i}>{t.pattern})" for i, t in enumerate(ready)]
+            self._compiled[scope] = (re.compile("|".join(alternatives)), ready)
+        return self._compiled[scope]
+
+    def match(self, index: str, timezone: str, nl_query: str) -> Optional[Tuple[Dict[str, Any], Template]]:
+        """Returns (filled_dsl, template) or None."""
+        matcher = self._matcher((index, timezone))
+        m = matcher[0].fullmatch(normalize_nl_query(nl_query)) if matcher else None
+        if m is None:
+            self._stats["misses"] += 1
+            return None
+        template = matcher[1][int(m.lastgroup[1:])]
+        # Slot groups directly follow the matched alternative's outer group
+        first = m.re.groupindex[m.lastgroup] + 1
+        values = [m.group(i) for i in range(first, first + len(template.slots))]
+        template.hits += 1
+        self._stats["hits"] += 1
+        self._templates[(index, timezone)].move_to_end(template.pattern)
+        self._touch((index, timezone), template.pattern)
+        return template.fill(values), template
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["size"] = len(self)
+        return stats
+
+    def load(self, path: str):
+        if not path or not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for entry in data:
+            scope = (entry["index"], entry["timezone"])
+            templates = self._templates.setdefault(scope, OrderedDict())
+            template = Template(**{k: v for k, v in entry.items() if k not in ("index", "timezone")})
+            templates[template.pattern] = template
+            self._touch(scope, template.pattern)
+        self._evict()
+        self._compiled.clear()
+
+    def save(self, path: str):
+        if not path:
+            return
+        # Oldest first, so load() restores the LRU order
+        data = [
+            {"index": index, "timezone": tz, **self._templates[(index, tz)][pattern].to_dict()}
+            for (index, tz), pattern in self._lru
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+template_store = TemplateStore()
@@ -1,17 +1,35 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
 from contextlib import asynccontextmanager
 
 from app.core.config import settings
 from app.services.es_client import es_client
-from app.api import draft, validate, run, explain, health
+from app.services.llm_client import llm_client
+from app.core.field_catalog import field_catalog
+from app.core.cursor_store import cursor_store
+from app.core.job_store import job_store
+from app.core.templates import template_store
+from app.core.examples import example_store
+from app.core.metrics import HTTP_SECONDS, start_trace, server_timing
+from app.api import draft, validate, run, jobs, export, explain, health, metrics
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting ES Query Copilot...")
+    await llm_client.start()
+    field_catalog.start_refresher()
+    template_store.load(settings.TEMPLATE_STORE_PATH)
+    example_store.load(settings.EXAMPLE_STORE_PATH)
     yield
     # Shutdown
     print("Shutting down...")
+    await field_catalog.stop_refresher()
+    template_store.save(settings.TEMPLATE_STORE_PATH)
+    example_store.save(settings.EXAMPLE_STORE_PATH)
+    await cursor_store.close_all()
+    await job_store.close_all()
+    await llm_client.close()
     await es_client.close()
 
 app = FastAPI(
@@ -20,12 +38,36 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    start = time.perf_counter()
+    spans = None
+    if settings.DEBUG_TRACE_ENABLED and request.headers.get("x-debug-trace") == "1":
+        # Stages below append to this list through a context variable
+        spans = start_trace()
+    response = await call_next(request)
+    # Route template, not the raw path, keeps label cardinality bounded
+    route = request.scope.get("route")
+    HTTP_SECONDS.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=response.status_code
+    )
+    if spans:
+        response.headers["Server-Timing"] = server_timing(spans, start)
+    return response
+
 # Register Routers
 app.include_router(draft.router, tags=["Draft"])
 app.include_router(validate.router, tags=["Validate"])
 app.include_router(run.router, tags=["Run"])
+app.include_router(jobs.router, tags=["Jobs"])
+app.include_router(export.router, tags=["Export"])
 app.include_router(explain.router, tags=["Explain"])
 app.include_router(health.router, tags=["Health"])
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router, tags=["Metrics"])
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,21 +1,29 @@
 from typing import Literal, List, Dict, Any, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 class DraftRequest(BaseModel):
     index: str
     nl_query: str
-    mode: Literal["preview", "execute"] = "preview"
+    mode: Literal["preview", "execute", "approximate"] = "preview"  # approximate: also plan sampling
     user_context: Dict[str, Any] = Field(default_factory=dict)
+    stream: bool = False  # Server-Sent Events instead of a single JSON body
 
 class DraftResponse(BaseModel):
     dsl: Dict[str, Any]
     explanation: List[str]
     risk: Dict[str, Any]
     confidence: float
+    approximation: Optional[Dict[str, Any]] = None  # How /run mode=approximate would answer this DSL
+    draft_id: Optional[str] = None  # Pass to /validate with this DSL and question to let it be learned
 
 class ValidateRequest(BaseModel):
     index: str
     dsl: Dict[str, Any]
+    # Question the DSL was drafted from, and the draft_id /draft returned with it;
+    # a valid result is learned as a template only when both match
+    nl_query: Optional[str] = None
+    draft_id: Optional[str] = None
+    user_context: Dict[str, Any] = Field(default_factory=dict)
 
 class ValidateResponse(BaseModel):
     valid: bool
@@ -26,8 +34,26 @@ class ValidateResponse(BaseModel):
 
 class RunRequest(BaseModel):
     index: str
-    dsl: Dict[str, Any]
+    dsl: Dict[str, Any] = Field(default_factory=dict)
     timeout_ms: int = 2000
+    paginate: bool = False  # Return a cursor for PIT + search_after paging
+    cursor: Optional[str] = None  # Continue a previous paginated run; dsl is ignored
+    optimize: Literal["apply", "dry_run", "off"] = "apply"  # Performance rewrites before execution
+    fields: Optional[List[str]] = None  # _source includes for returned hits
+    # Relay the (filter_path-trimmed) ES body as-is instead of a RunResponse
+    passthrough: bool = False
+    # Aggregations flattened to one row per leaf bucket, as Arrow IPC / Parquet / CSV
+    format: Literal["json", "arrow", "parquet", "csv"] = "json"
+    # approximate: sampled aggregations / early-terminated counts, with error bounds
+    mode: Literal["exact", "approximate"] = "exact"
+
+    @model_validator(mode="before")
+    @classmethod
+    def _dsl_unless_cursor(cls, data: Any) -> Any:
+        # A missing dsl must not silently become a match_all
+        if isinstance(data, dict) and not data.get("cursor") and "dsl" not in data:
+            raise ValueError("dsl is required unless a cursor is given")
+        return data
 
 class RunResponse(BaseModel):
     took: int
@@ -35,6 +61,45 @@ class RunResponse(BaseModel):
     hits: Dict[str, Any]
     aggs: Dict[str, Any] = Field(default_factory=dict)
     warnings: List[str] = []
+    cursor: Optional[str] = None  # Present while more pages remain
+    approximation: Optional[Dict[str, Any]] = None  # Sampling rate and error bounds (mode=approximate)
+
+class BatchRunRequest(BaseModel):
+    requests: List[RunRequest]
+
+class BatchRunItem(BaseModel):
+    status: int  # HTTP-style status of this item: 200, 403 (blocked), 4xx/5xx from ES
+    result: Optional[RunResponse] = None
+    error: Optional[str] = None
+
+class BatchRunResponse(BaseModel):
+    took: int
+    results: List[BatchRunItem]
+
+class JobSubmitRequest(BaseModel):
+    index: str
+    dsl: Dict[str, Any]
+    wait_ms: int = 1000  # Return inline if the search finishes within this long
+    optimize: Literal["apply", "dry_run", "off"] = "apply"
+
+class JobResponse(BaseModel):
+    job_id: str
+    state: Literal["running", "completed", "failed"]
+    is_partial: bool  # Results so far only (still running, or some shards failed)
+    took: Optional[int] = None
+    hits: Dict[str, Any] = Field(default_factory=dict)
+    aggs: Dict[str, Any] = Field(default_factory=dict)
+    shards: Dict[str, Any] = Field(default_factory=dict)  # total / successful / failed so far
+    warnings: List[str] = []
+    error: Optional[str] = None
+
+class ExportRequest(BaseModel):
+    index: str
+    dsl: Dict[str, Any]
+    format: Literal["ndjson", "csv"] = "ndjson"
+    fields: Optional[List[str]] = None  # _source includes; also the CSV columns
+    slices: int = 1  # >1 reads PIT slices in parallel
+    max_docs: Optional[int] = None
 
 class ExplainRequest(BaseModel):
     index: str
@@ -44,3 +109,18 @@ class ExplainRequest(BaseModel):
 class ExplainResponse(BaseModel):
     matched: bool
     explanation: Dict[str, Any]
+
+class BatchExplainRequest(BaseModel):
+    index: str
+    doc_ids: List[str]
+    dsl: Dict[str, Any]
+    explain_misses: bool = False  # Per-doc _explain for docs that exist but did not match
+
+class BatchExplainItem(ExplainResponse):
+    doc_id: str
+    found: bool  # False when the id does not exist in the index
+    index: Optional[str] = None  # Concrete index the doc lives in
+    error: Optional[str] = None
+
+class BatchExplainResponse(BaseModel):
+    results: List[BatchExplainItem]
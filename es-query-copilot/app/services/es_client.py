@@ -1,6 +1,25 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import quote
+import httpx
+import orjson
 from elasticsearch import AsyncElasticsearch
 from app.core.config import settings
 from app.core.errors import ESDriverError
+from app.core.metrics import stage, ES_TOOK_SECONDS
+
+def _record_took(op: str, resp: Any):
+    # ES `took` versus the surrounding stage wall time shows network/queueing overhead
+    took = resp.get("took") if hasattr(resp, "get") else None
+    if isinstance(took, (int, float)):
+        ES_TOOK_SECONDS.observe(took / 1000, op=op)
+
+def with_shard_doc_tiebreaker(sort: Any) -> list:
+    # search_after needs a total order; _shard_doc is the cheap PIT tiebreaker
+    sort = [] if sort is None else (sort if isinstance(sort, list) else [sort])
+    has_tiebreaker = any(
+        s == "_shard_doc" or (isinstance(s, dict) and "_shard_doc" in s) for s in sort
+    )
+    return sort if has_tiebreaker else sort + [{"_shard_doc": "asc"}]
 
 class ESClient:
     def __init__(self):
@@ -10,9 +29,25 @@ class ESClient:
             verify_certs=False,  # For local dev/test with self-signed certs
             request_timeout=settings.DEFAULT_TIMEOUT_MS / 1000
         )
+        # Plain HTTP client for responses relayed without parsing (search_raw)
+        self.http: Optional[httpx.AsyncClient] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self.http is None:
+            self.http = httpx.AsyncClient(
+                base_url=settings.ES_URL,
+                auth=(settings.ES_USER, settings.ES_PASSWORD),
+                verify=False,
+                timeout=settings.DEFAULT_TIMEOUT_MS / 1000,
+                headers={"Content-Type": "application/json"}
+            )
+        return self.http
 
     async def close(self):
         await self.client.close()
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
 
     async def get_mapping(self, index: str) -> dict:
         try:
@@ -26,29 +61,129 @@ class ESClient:
         except Exception as e:
             raise ESDriverError(f"Failed to get field caps for {index}: {str(e)}")
 
+    async def count(self, index: str, body: Optional[dict] = None) -> dict:
+        try:
+            with stage("es_count"):
+                return await self.client.count(index=index, body=body)
+        except Exception as e:
+            raise ESDriverError(f"Count failed for {index}: {str(e)}")
+
     async def validate_query(self, index: str, query: dict) -> dict:
         try:
-            return await self.client.indices.validate_query(
-                index=index,
-                body=query,
-                explain=True
-            )
+            with stage("es_validate"):
+                return await self.client.indices.validate_query(
+                    index=index,
+                    body=query,
+                    explain=True
+                )
         except Exception as e:
             # We don't raise error here because validate failure is expected logic
             return {"valid": False, "error": str(e)}
 
-    async def search(self, index: str, body: dict, **kwargs) -> dict:
+    async def search(self, index: Optional[str], body: dict, **kwargs) -> dict:
+        # index is None for PIT searches, where the PIT id selects the indices
         try:
-            return await self.client.search(index=index, body=body, **kwargs)
+            with stage("es_search"):
+                resp = await self.client.search(index=index, body=body, **kwargs)
+            _record_took("search", resp)
+            return resp
         except Exception as e:
             raise ESDriverError(f"Search failed: {str(e)}")
     
+    async def search_raw(self, index: str, body: dict, **params) -> httpx.Response:
+        """
+        _search with the response body left unparsed: returns the streaming
+        httpx response so its bytes can be relayed as-is. The caller closes it.
+        """
+        client = self._http()
+        request = client.build_request(
+            "POST", f"/{quote(index, safe=',*')}/_search", params=params, content=orjson.dumps(body)
+        )
+        try:
+            with stage("es_search"):
+                resp = await client.send(request, stream=True)
+        except Exception as e:
+            raise ESDriverError(f"Search failed: {str(e)}")
+        if resp.status_code >= 400:
+            detail = (await resp.aread()).decode("utf-8", "replace")
+            await resp.aclose()
+            raise ESDriverError(f"Search failed: {resp.status_code} {detail}")
+        return resp
+
+    async def msearch(self, searches: List[Tuple[str, dict]]) -> dict:
+        """
+        Runs (index, body) pairs in one _msearch round trip.
+        Per-search failures come back inline in "responses", not as exceptions.
+        """
+        lines = []
+        for index, body in searches:
+            lines.append({"index": index})
+            lines.append(body)
+        try:
+            with stage("es_msearch"):
+                resp = await self.client.msearch(searches=lines)
+            _record_took("msearch", resp)
+            return resp
+        except Exception as e:
+            raise ESDriverError(f"Multi-search failed: {str(e)}")
+
+    async def submit_async_search(self, index: str, body: dict, wait_for_completion_timeout: str,
+                                  keep_alive: str) -> dict:
+        """
+        Starts an _async_search. Returns the search's id plus whatever results
+        exist after wait_for_completion_timeout (everything, if it finished).
+        """
+        try:
+            with stage("es_async_submit"):
+                return await self.client.async_search.submit(
+                    index=index,
+                    body=body,
+                    wait_for_completion_timeout=wait_for_completion_timeout,
+                    keep_alive=keep_alive,
+                    keep_on_completion=True
+                )
+        except Exception as e:
+            raise ESDriverError(f"Async search submit failed: {str(e)}")
+
+    async def get_async_search(self, id: str, wait_for_completion_timeout: Optional[str] = None,
+                               keep_alive: Optional[str] = None) -> dict:
+        """Current (possibly partial) results of an async search; keep_alive extends its expiry."""
+        try:
+            with stage("es_async_get"):
+                return await self.client.async_search.get(
+                    id=id,
+                    wait_for_completion_timeout=wait_for_completion_timeout,
+                    keep_alive=keep_alive
+                )
+        except Exception as e:
+            raise ESDriverError(f"Async search get failed: {str(e)}")
+
+    async def async_search_status(self, id: str) -> dict:
+        """Progress only (running, partial, shard counts), without the results."""
+        try:
+            return await self.client.async_search.status(id=id)
+        except Exception as e:
+            raise ESDriverError(f"Async search status failed: {str(e)}")
+
+    async def delete_async_search(self, id: str):
+        # Cancels a running search and frees stored results; already gone is fine
+        try:
+            await self.client.async_search.delete(id=id)
+        except Exception:
+            pass
+
     async def get_document(self, index: str, id: str):
         try:
             return await self.client.get(index=index, id=id)
         except Exception as e:
             raise ESDriverError(f"Get document failed: {str(e)}")
             
+    async def mget(self, index: str, ids: List[str], **kwargs) -> dict:
+        try:
+            return await self.client.mget(index=index, ids=ids, **kwargs)
+        except Exception as e:
+            raise ESDriverError(f"Multi-get failed: {str(e)}")
+
     async def explain(self, index: str, id: str, body: dict):
         try:
             return await self.client.explain(index=index, id=id, body=body)
@@ -62,6 +197,35 @@ class ESClient:
         except Exception as e:
             raise ESDriverError(f"Failed to open PIT: {str(e)}")
 
+    async def iter_pit_pages(self, pit_id: str, body: dict, page_size: int, keep_alive: str = "1m",
+                             slice_id: Optional[int] = None, slice_max: Optional[int] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yields pages of hits for body over an already opened PIT using search_after.
+        Only one page is held at a time; the caller owns (and closes) the PIT.
+        """
+        body = {k: v for k, v in body.items() if k not in ("from", "aggs", "aggregations")}
+        body["size"] = page_size
+        body["sort"] = with_shard_doc_tiebreaker(body.get("sort"))
+        if slice_max is not None and slice_max > 1:
+            body["slice"] = {"id": slice_id, "max": slice_max}
+
+        search_after = None
+        while True:
+            page = dict(body)
+            page["pit"] = {"id": pit_id, "keep_alive": keep_alive}
+            if search_after is not None:
+                page["search_after"] = search_after
+
+            resp = await self.search(index=None, body=page)
+            pit_id = resp.get("pit_id", pit_id)
+            hits = resp.get("hits", {}).get("hits", [])
+            if not hits:
+                return
+            yield hits
+            if len(hits) < page_size:
+                return
+            search_after = hits[-1]["sort"]
+
     async def close_point_in_time(self, id: str):
          try:
             await self.client.close_point_in_time(body={"id": id})
@@ -1,27 +1,152 @@
+import asyncio
 import json
+import time
+from collections import deque
 import httpx
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, AsyncIterator
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
 from app.core.config import settings
 from app.core.errors import LLMGenerationError
+from app.core.metrics import stage, LLM_TOKENS, LLM_REQUESTS
+
+class LLMBackend:
+    """One OpenAI-compatible endpoint with its latency window and circuit breaker."""
+    def __init__(self, name: str, base_url: str, model: str, api_key: str = ""):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.latencies: deque = deque(maxlen=settings.LLM_LATENCY_WINDOW)
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def available(self) -> bool:
+        if self.opened_at is None:
+            return True
+        # Half-open: once the cooldown has passed, let a single probe through
+        return not self._probing and time.monotonic() - self.opened_at >= settings.LLM_BREAKER_COOLDOWN_S
+
+    def on_start(self):
+        if self.opened_at is not None:
+            self._probing = True
+
+    def on_cancel(self):
+        self._probing = False
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        # A failed probe re-opens the breaker for another cooldown
+        if self.opened_at is not None or self.failures >= settings.LLM_BREAKER_FAILURES:
+            self.opened_at = time.monotonic()
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.latencies) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": "closed" if self.opened_at is None else ("half_open" if self.available() else "open"),
+            "consecutive_failures": self.failures,
+            "samples": len(self.latencies),
+            "p50_s": self.percentile(50),
+            "p90_s": self.percentile(90),
+            "p99_s": self.percentile(99),
+        }
+
+def _backends_from_settings() -> List[LLMBackend]:
+    # Currently only implementing OpenAI-compatible interface
+    base_url = "https://api.openai.com/v1" if settings.LLM_PROVIDER == "openai" else settings.LLM_BASE_URL
+    backends = [LLMBackend(settings.LLM_PROVIDER, base_url, settings.LLM_MODEL, settings.LLM_API_KEY)]
+    for i, spec in enumerate(settings.LLM_FALLBACK_BACKENDS):
+        backends.append(LLMBackend(
+            name=spec.get("name", f"fallback-{i + 1}"),
+            base_url=spec["base_url"],
+            model=spec.get("model", settings.LLM_MODEL),
+            api_key=spec.get("api_key", "")
+        ))
+    return backends
 
 class LLMClient:
-    def __init__(self):
-        self.api_key = settings.LLM_API_KEY
-        self.model = settings.LLM_MODEL
-        self.provider = settings.LLM_PROVIDER
-        # Currently only implementing OpenAI-compatible interface
-        self.base_url = "https://api.openai.com/v1" if self.provider == "openai" else os.getenv("LLM_BASE_URL")
+    def __init__(self, backends: Optional[List[LLMBackend]] = None):
+        # Tried in order; the first is the primary, the rest are hedge/failover targets
+        self.backends = backends or _backends_from_settings()
 
-    @retry(
-        retry=retry_if_exception_type((httpx.RequestError, httpx.HTTPStatusError)),
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10)
-    )
-    async def generate_json(self, system_prompt: str, user_prompt: str, temperature: float = 0.1) -> Dict[str, Any]:
-        params = {
-            "model": self.model,
+        # Long-lived pooled client, created in app lifespan (or lazily on first call)
+        self.client: Optional[httpx.AsyncClient] = None
+        self.timeout = httpx.Timeout(settings.LLM_TIMEOUT_S, connect=settings.LLM_CONNECT_TIMEOUT_S)
+        # Caps concurrent provider calls; excess callers queue here
+        self._semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        self._stats = {
+            "calls": 0,
+            "in_flight": 0,
+            "waiting": 0,
+            "queue_wait_total_s": 0.0,
+            "queue_wait_max_s": 0.0,
+            "hedged": 0,
+            "failovers": 0,
+        }
+
+    async def start(self):
+        if self.client is None:
+            # Shared across backends; Authorization is set per request
+            self.client = httpx.AsyncClient(
+                http2=settings.LLM_HTTP2,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_KEEPALIVE_CONNECTIONS
+                ),
+                headers={"Content-Type": "application/json"}
+            )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of concurrency, queue-wait and per-backend routing counters."""
+        stats = dict(self._stats)
+        calls = stats["calls"]
+        stats["queue_wait_avg_s"] = stats["queue_wait_total_s"] / calls if calls else 0.0
+        stats["max_concurrency"] = settings.LLM_MAX_CONCURRENCY
+        stats["backends"] = {b.name: b.stats() for b in self.backends}
+        return stats
+
+    async def _acquire_slot(self):
+        self._stats["waiting"] += 1
+        start = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._stats["waiting"] -= 1
+        waited = time.perf_counter() - start
+        self._stats["calls"] += 1
+        self._stats["in_flight"] += 1
+        self._stats["queue_wait_total_s"] += waited
+        self._stats["queue_wait_max_s"] = max(self._stats["queue_wait_max_s"], waited)
+
+    def _release_slot(self):
+        self._stats["in_flight"] -= 1
+        self._semaphore.release()
+
+    def _build_params(self, system_prompt: str, user_prompt: str, temperature: float) -> Dict[str, Any]:
+        return {
             "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
@@ -30,28 +155,151 @@ class LLMClient:
             "response_format": {"type": "json_object"}
         }
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+    def _hedge_delay(self, backend: LLMBackend) -> float:
+        observed = backend.percentile(settings.LLM_HEDGE_PERCENTILE)
+        return observed if observed is not None else settings.LLM_HEDGE_DEFAULT_DELAY_S
+
+    async def _attempt(self, backend: LLMBackend, params: Dict[str, Any]) -> Dict[str, Any]:
+        # Slot is held per attempt only, so retry backoff does not block other callers
+        await self._acquire_slot()
+        backend.on_start()
+        start = time.perf_counter()
+        try:
+            url = f"{backend.base_url}/chat/completions"
+            with stage("llm"):
+                response = await self.client.post(url, json={**params, "model": backend.model}, headers=backend.headers)
+            response.raise_for_status()
+
+            data = response.json()
+            content = data["choices"][0]["message"]["content"]
+        except asyncio.CancelledError:
+            # Lost a hedge race; says nothing about the backend's health
+            backend.on_cancel()
+            LLM_REQUESTS.inc(backend=backend.name, outcome="cancelled")
+            raise
+        except Exception as e:
+            backend.record_failure()
+            LLM_REQUESTS.inc(backend=backend.name, outcome="error")
+            # Let tenacity retry on network errors, but re-raise others
+            if isinstance(e, (httpx.RequestError, httpx.HTTPStatusError)):
+                raise e
+            raise LLMGenerationError(f"LLM call failed: {str(e)}")
+        finally:
+            self._release_slot()
+
+        backend.record_success(time.perf_counter() - start)
+        LLM_REQUESTS.inc(backend=backend.name, outcome="ok")
+        usage = data.get("usage") or {}
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if isinstance(usage.get(kind), int):
+                LLM_TOKENS.inc(usage[kind], backend=backend.name, kind=kind.split("_")[0])
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError as e:
+            raise LLMGenerationError(f"LLM returned invalid JSON: {str(e)}")
+
+    @retry(
+        retry=retry_if_exception_type((httpx.RequestError, httpx.HTTPStatusError)),
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=10)
+    )
+    async def generate_json(self, system_prompt: str, user_prompt: str, temperature: float = 0.1) -> Dict[str, Any]:
+        """
+        Sends the request to the first healthy backend. If it is still running
+        past that backend's observed P90, a hedged copy goes to the next one and
+        the first success wins. Failures move on to the next backend at once;
+        the tenacity backoff only applies once every backend has failed.
+        """
+        params = self._build_params(system_prompt, user_prompt, temperature)
+
+        if self.client is None:
+            await self.start()
+
+        candidates = [b for b in self.backends if b.available()]
+        if not candidates:
+            raise LLMGenerationError("No healthy LLM backend (all circuit breakers open)")
+
+        running: Dict[asyncio.Task, LLMBackend] = {}
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def launch() -> LLMBackend:
+            backend = candidates.pop(0)
+            running[asyncio.create_task(self._attempt(backend, params))] = backend
+            return backend
+
+        current = launch()
+        try:
+            while running:
+                can_hedge = settings.LLM_HEDGE_ENABLED and candidates and not hedged
+                timeout = self._hedge_delay(current) if can_hedge else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than usual for this backend: race the next one
+                    hedged = True
+                    self._stats["hedged"] += 1
+                    current = launch()
+                    continue
+                for task in done:
+                    running.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                if not running and candidates:
+                    self._stats["failovers"] += 1
+                    current = launch()
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+        raise last_error
+
+    async def stream_json(self, system_prompt: str, user_prompt: str, temperature: float = 0.1) -> AsyncIterator[str]:
+        """
+        Yields raw content deltas of a streamed JSON completion from the first
+        healthy backend. Not retried or hedged: a partially consumed stream
+        cannot be replayed.
+        """
+        params = self._build_params(system_prompt, user_prompt, temperature)
+        params["stream"] = True
+
+        if self.client is None:
+            await self.start()
+
+        backend = next((b for b in self.backends if b.available()), None)
+        if backend is None:
+            raise LLMGenerationError("No healthy LLM backend (all circuit breakers open)")
+        params["model"] = backend.model
 
-        async with httpx.AsyncClient() as client:
-            try:
-                # Provide a dummy URL if base_url is faulty in dev, but generally should be correct
-                url = f"{self.base_url}/chat/completions"
-                response = await client.post(url, json=params, headers=headers, timeout=30.0)
-                response.raise_for_status()
-                
-                data = response.json()
-                content = data["choices"][0]["message"]["content"]
-                
-                return json.loads(content)
-            except json.JSONDecodeError as e:
-                raise LLMGenerationError(f"LLM returned invalid JSON: {str(e)}")
-            except Exception as e:
-                # Let tenacity retry on network errors, but re-raise others
-                if isinstance(e, (httpx.RequestError, httpx.HTTPStatusError)):
-                    raise e
-                raise LLMGenerationError(f"LLM call failed: {str(e)}")
+        await self._acquire_slot()
+        backend.on_start()
+        start = time.perf_counter()
+        try:
+            url = f"{backend.base_url}/chat/completions"
+            with stage("llm_stream"):
+                async with self.client.stream("POST", url, json=params, headers=backend.headers) as response:
+                    response.raise_for_status()
+                    # OpenAI-compatible SSE: "data: {chunk}" lines, terminated by "data: [DONE]"
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                        if delta:
+                            yield delta
+            backend.record_success(time.perf_counter() - start)
+            LLM_REQUESTS.inc(backend=backend.name, outcome="ok")
+        except (asyncio.CancelledError, GeneratorExit):
+            backend.on_cancel()
+            LLM_REQUESTS.inc(backend=backend.name, outcome="cancelled")
+            raise
+        except Exception as e:
+            backend.record_failure()
+            LLM_REQUESTS.inc(backend=backend.name, outcome="error")
+            raise LLMGenerationError(f"LLM stream failed: {str(e)}")
+        finally:
+            self._release_slot()
 
 llm_client = LLMClient()
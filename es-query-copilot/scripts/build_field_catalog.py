@@ -7,63 +7,65 @@ import sys
 # Add project root to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from app.services.es_client import ESClient
+from app.services.es_client import es_client
 from app.core.config import settings
+from app.core.field_catalog import fetch_catalog, diff_catalogs, write_catalog, compact_path
 
-async def build_catalog(index_pattern: str, output_path: str):
+def read_patterns(indexes, index_file):
+    patterns = []
+    for value in indexes or []:
+        patterns.extend(p.strip() for p in value.split(",") if p.strip())
+    if index_file:
+        with open(index_file, "r", encoding="utf-8") as f:
+            patterns.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    # Keep order, drop duplicates
+    return list(dict.fromkeys(patterns)) or ["orders-*"]
+
+async def build_catalog(patterns, output_path: str, concurrency: int, full: bool):
     print(f"Connecting to ES at {settings.ES_URL}...")
-    es = ESClient()
-    
-    try:
-        # 1. Get Mapping
-        print(f"Fetching mapping for {index_pattern}...")
-        mapping = await es.get_mapping(index=index_pattern)
-        if not mapping:
-            print("No index found matching pattern.")
-            return
+    previous = {}
+    if os.path.exists(output_path) and not full:
+        with open(output_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
 
-        # Flatten mapping to get field types
-        # This is a simplified flattening; production might need full recursion
-        # Here we rely on field_caps which is more accurate for "searchable/aggregatable"
-        
-        # 2. Get Field Capabilities
-        print(f"Fetching field capabilities...")
-        caps = await es.get_field_caps(index=index_pattern, fields="*")
-        
-        catalog = {}
-        for field, info in caps.get("fields", {}).items():
-            # Skip metadata fields
-            if field.startswith("_"):
-                continue
-                
-            # info is like: {"keyword": {"type": "keyword", "searchable": true, ...}}
-            # We explicitly look for the type valid in this index
-            
-            # Simple heuristic: pick the first type (usually unique in one index)
-            field_type_key = list(info.keys())[0]
-            details = info[field_type_key]
-            
-            catalog[field] = {
-                "type": details.get("type", "unknown"),
-                "searchable": details.get("searchable", False),
-                "aggregatable": details.get("aggregatable", False)
-            }
-            
-        final_data = {index_pattern: catalog}
-        
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(final_data, f, indent=2)
-            
-        print(f"Success! Catalog saved to {output_path} with {len(catalog)} fields.")
-        
+    try:
+        print(f"Fetching field capabilities for {len(patterns)} pattern(s), {concurrency} at a time...")
+        fetched, errors = await fetch_catalog(patterns, concurrency)
     finally:
-        await es.close()
+        await es_client.close()
+
+    for pattern, error in errors.items():
+        print(f"  ! {pattern}: {error} (keeping previous fields)" if pattern in previous else f"  ! {pattern}: {error}")
+
+    # Patterns not asked for this run are carried over untouched
+    catalog = dict(previous)
+    catalog.update(fetched)
+
+    diff = diff_catalogs(previous, catalog)
+    for pattern, changes in diff.items():
+        print(f"  {pattern}: +{len(changes['added'])} -{len(changes['removed'])} ~{len(changes['changed'])}")
+    for pattern in fetched:
+        conflicts = [f for f, entry in fetched[pattern].items() if "conflicts" in entry]
+        if conflicts:
+            print(f"  {pattern}: type conflicts in {', '.join(sorted(conflicts))}")
+
+    if not diff and os.path.exists(output_path) and os.path.exists(compact_path(output_path)):
+        # Leave the files (and their mtimes) alone so workers skip the reload
+        print("No changes; catalog left untouched.")
+    else:
+        write_catalog(output_path, catalog)
+        print(f"Success! Catalog saved to {output_path} with {len(catalog)} pattern(s).")
+    return 1 if errors and not fetched else 0
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--index", default="orders-*", help="Index pattern to scan")
+    parser.add_argument("--index", action="append", help="Index pattern to scan (repeatable, or comma separated)")
+    parser.add_argument("--index-file", help="File with one index pattern per line")
     parser.add_argument("--out", default="data/field_catalog.json", help="Output path")
+    parser.add_argument("--concurrency", type=int, default=settings.CATALOG_FETCH_CONCURRENCY,
+                        help="Concurrent field_caps requests")
+    parser.add_argument("--full", action="store_true", help="Rebuild from scratch instead of merging into --out")
     args = parser.parse_args()
-    
-    asyncio.run(build_catalog(args.index, args.out))
+
+    patterns = read_patterns(args.index, args.index_file)
+    sys.exit(asyncio.run(build_catalog(patterns, args.out, args.concurrency, args.full)))
@@ -0,0 +1,350 @@
+import asyncio
+import argparse
+import ast
+import json
+import os
+import random
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.main import app
+from app.core.config import settings
+from app.core.field_catalog import field_catalog
+from app.services.es_client import es_client
+from app.services.llm_client import llm_client
+
+# Used when the real catalog has no entry for an eval index
+DEMO_FIELDS = {
+    "created_at": {"type": "date", "searchable": True, "aggregatable": True},
+    "status": {"type": "text", "searchable": True, "aggregatable": False},
+    "status.keyword": {"type": "keyword", "searchable": True, "aggregatable": True},
+    "country": {"type": "text", "searchable": True, "aggregatable": False},
+    "country.keyword": {"type": "keyword", "searchable": True, "aggregatable": True},
+    "amount": {"type": "double", "searchable": True, "aggregatable": True},
+}
+
+KNOWN_QUERIES = {
+    "bool", "match", "match_all", "match_phrase", "multi_match", "term", "terms", "range", "exists",
+    "prefix", "wildcard", "regexp", "fuzzy", "ids", "nested", "constant_score", "function_score",
+    "query_string", "simple_query_string", "script", "script_score", "dis_max",
+}
+
+class Latency:
+    """Log-normal delay around a median, so stand-ins have realistic tails."""
+    def __init__(self, median_ms: float, sigma: float, rng: random.Random):
+        self.median_s = median_ms / 1000
+        self.sigma = sigma
+        self.rng = rng
+
+    async def sleep(self) -> float:
+        if self.median_s <= 0:
+            return 0.0
+        delay = self.median_s * self.rng.lognormvariate(0, self.sigma)
+        await asyncio.sleep(delay)
+        return delay
+
+# --- Fake LLM -------------------------------------------------------------
+
+_FIELD_WORDS = {"国家": "country.keyword", "country": "country.keyword", "状态": "status.keyword", "status": "status.keyword"}
+_STATUS_WORDS = {"失败": "failed", "failed": "failed", "成功": "paid", "paid": "paid", "退款": "refunded", "refunded": "refunded"}
+
+def synthesize_draft(nl_query: str) -> Dict[str, Any]:
+    """Deterministic rule-based stand-in for the drafting model."""
+    text = nl_query.casefold()
+    filters: List[Dict[str, Any]] = []
+    dsl: Dict[str, Any] = {"size": 20}
+
+    m = re.search(r"(?:最近|last\s*)(\d+)\s*(?:天|days?)", text)
+    if m:
+        filters.append({"range": {"created_at": {"gte": f"now-{m.group(1)}d/d"}}})
+    for word, value in _STATUS_WORDS.items():
+        if word in text:
+            filters.append({"term": {"status.keyword": value}})
+            break
+    m = re.search(r"(?:金额|amount)\s*(?:大于|>|over)\s*(\d+(?:\.\d+)?)", text)
+    if m:
+        filters.append({"range": {"amount": {"gt": float(m.group(1)) if "." in m.group(1) else int(m.group(1))}}})
+    dsl["query"] = {"bool": {"filter": filters}} if filters else {"match_all": {}}
+
+    m = re.search(r"(?:按|by\s*)(\S+?)(?:前|top|$|\s)", text)
+    group_field = next((f for w, f in _FIELD_WORDS.items() if m and w in m.group(1)), None)
+    if group_field:
+        top = re.search(r"(?:前|top\s*)(\d+)", text)
+        dsl = {"size": 0, "query": dsl["query"],
+               "aggs": {"by_group": {"terms": {"field": group_field, "size": int(top.group(1)) if top else 10}}}}
+
+    return {"dsl": dsl, "explanation": ["Synthesized by the eval harness"], "confidence": 0.9,
+            "risk": {"level": "low", "reasons": []}}
+
+class FakeLLM:
+    """
+    OpenAI-compatible chat endpoint served through httpx.MockTransport.
+    Drafts come from a replay file (nl_query -> draft JSON) when given,
+    otherwise from synthesize_draft; repairs echo the DSL back.
+    """
+    def __init__(self, latency: Latency, replay: Optional[Dict[str, Any]] = None):
+        self.latency = latency
+        self.replay = replay or {}
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        system, user = body["messages"][0]["content"], body["messages"][1]["content"]
+        await self.latency.sleep()
+        if system == "You are a JSON fixer.":
+            m = re.search(r"(?:Original DSL|DSL): (\{.*\})", user, re.S)
+            content = ast.literal_eval(m.group(1)) if m else {}
+        else:
+            content = self.replay.get(user) or synthesize_draft(user)
+        text = json.dumps(content, ensure_ascii=False)
+        usage = {"prompt_tokens": (len(system) + len(user)) // 4, "completion_tokens": len(text) // 4}
+        return httpx.Response(200, json={"choices": [{"message": {"content": text}}], "usage": usage})
+
+# --- Fake ES --------------------------------------------------------------
+
+class _FakeIndices:
+    def __init__(self, es: "FakeES"):
+        self.es = es
+
+    async def validate_query(self, index: str, body: dict, **kwargs) -> dict:
+        await self.es.latency.sleep()
+        if self.es.rng.random() < self.es.invalid_rate:
+            return {"valid": False, "error": "injected validation failure"}
+        unknown = self.es.unknown_clauses(body.get("query", {}))
+        if unknown:
+            return {"valid": False, "error": f"unknown query [{unknown[0]}]"}
+        return {"valid": True}
+
+class FakeES:
+    """Just enough of AsyncElasticsearch for the copilot pipeline, with injected latency."""
+    def __init__(self, latency: Latency, rng: random.Random, invalid_rate: float = 0.0):
+        self.latency = latency
+        self.rng = rng
+        self.invalid_rate = invalid_rate
+        self.indices = _FakeIndices(self)
+
+    def unknown_clauses(self, node: Any) -> List[str]:
+        unknown = []
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key in ("must", "filter", "should", "must_not"):
+                    for clause in value if isinstance(value, list) else [value]:
+                        unknown += self.unknown_clauses(clause)
+                elif key == "bool":
+                    unknown += self.unknown_clauses(value)
+                elif key not in KNOWN_QUERIES and key not in ("minimum_should_match", "boost"):
+                    unknown.append(key)
+        return unknown
+
+    def _result(self, body: dict, took_ms: float) -> dict:
+        size = body.get("size", 10)
+        hits = [{"_id": str(i), "_source": {}, "sort": [i]} for i in range(min(size, 3))]
+        aggs = {name: {"buckets": []} for name in body.get("aggs", body.get("aggregations", {}))}
+        return {"took": int(took_ms), "timed_out": False, "hits": {"total": {"value": len(hits), "relation": "eq"},
+                "hits": hits}, "aggregations": aggs}
+
+    async def search(self, index: Optional[str] = None, body: Optional[dict] = None, **kwargs) -> dict:
+        delay = await self.latency.sleep()
+        return self._result(body or {}, delay * 1000 * 0.8)
+
+    async def msearch(self, searches: List[dict], **kwargs) -> dict:
+        delay = await self.latency.sleep()
+        return {"took": int(delay * 1000), "responses": [self._result(b, delay * 800) for b in searches[1::2]]}
+
+    async def count(self, index: str, body: Optional[dict] = None, **kwargs) -> dict:
+        await self.latency.sleep()
+        return {"count": 1_000_000, "_shards": {"total": 3}}
+
+    async def open_point_in_time(self, index: str, keep_alive: str) -> dict:
+        return {"id": "fake-pit"}
+
+    async def close_point_in_time(self, body: dict) -> dict:
+        return {"succeeded": True}
+
+    async def ping(self) -> bool:
+        return True
+
+    async def close(self):
+        pass
+
+# --- Harness --------------------------------------------------------------
+
+def _server_timing(header: str) -> List[tuple]:
+    spans = []
+    for entry in filter(None, (e.strip() for e in header.split(","))):
+        m = re.match(r"([^;]+);dur=([\d.]+)", entry)
+        if m:
+            spans.append((m.group(1), float(m.group(2)) / 1000))
+    return spans
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+    return {"count": len(ordered), "p50_ms": pick(50) * 1000, "p95_ms": pick(95) * 1000, "p99_ms": pick(99) * 1000}
+
+async def run_case(ac: httpx.AsyncClient, case: Dict[str, Any], samples: Dict[str, List[float]]) -> Dict[str, Any]:
+    headers = {"X-Debug-Trace": "1"}
+    outcome: Dict[str, Any] = {"nl_query": case["nl_query"], "passed": False, "repair_rounds": 0}
+    t0 = time.perf_counter()
+
+    def record(endpoint: str, resp: httpx.Response, start: float):
+        samples.setdefault(endpoint, []).append(time.perf_counter() - start)
+        for name, seconds in _server_timing(resp.headers.get("server-timing", "")):
+            samples.setdefault(name, []).append(seconds)
+
+    start = time.perf_counter()
+    draft = await ac.post("/draft", json={"index": case["index"], "nl_query": case["nl_query"]}, headers=headers)
+    record("/draft", draft, start)
+    if draft.status_code != 200:
+        outcome["error"] = f"/draft {draft.status_code}"
+        return outcome
+    dsl = draft.json()["dsl"]
+
+    start = time.perf_counter()
+    validate = await ac.post("/validate", json={"index": case["index"], "dsl": dsl, "nl_query": case["nl_query"]},
+                             headers=headers)
+    record("/validate", validate, start)
+    checked = validate.json()
+    outcome["repair_rounds"] = sum(1 for name, _ in _server_timing(validate.headers.get("server-timing", ""))
+                                   if name == "repair")
+    dsl = checked.get("fixed_dsl") or dsl
+    if not checked.get("valid"):
+        outcome["error"] = f"invalid: {checked.get('errors')}"
+        return outcome
+
+    start = time.perf_counter()
+    run = await ac.post("/run", json={"index": case["index"], "dsl": dsl}, headers=headers)
+    record("/run", run, start)
+    samples.setdefault("pipeline", []).append(time.perf_counter() - t0)
+
+    text = json.dumps(dsl, ensure_ascii=False)
+    missing = [s for s in case.get("must_contain", []) if s not in text]
+    forbidden = [s for s in case.get("must_not_contain", []) if s in text]
+    outcome["passed"] = run.status_code == 200 and not missing and not forbidden
+    if not outcome["passed"]:
+        outcome["error"] = f"/run {run.status_code}, missing={missing}, forbidden={forbidden}"
+    return outcome
+
+async def run_eval(cases: List[Dict[str, Any]], concurrency: int, repeat: int) -> Dict[str, Any]:
+    samples: Dict[str, List[float]] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(ac, case):
+        async with semaphore:
+            return await run_case(ac, case, samples)
+
+    transport = httpx.ASGITransport(app=app)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://eval", timeout=60) as ac:
+        outcomes = await asyncio.gather(*[bounded(ac, c) for _ in range(repeat) for c in cases])
+    wall = time.perf_counter() - started
+
+    rounds: Dict[str, int] = {}
+    for o in outcomes:
+        rounds[str(o["repair_rounds"])] = rounds.get(str(o["repair_rounds"]), 0) + 1
+    return {
+        "runs": len(outcomes),
+        "pass_rate": sum(o["passed"] for o in outcomes) / len(outcomes) if outcomes else 0.0,
+        "throughput_qps": len(outcomes) / wall if wall else 0.0,
+        "wall_s": wall,
+        "repair_rounds": dict(sorted(rounds.items())),
+        "stages": {name: _percentiles(values) for name, values in sorted(samples.items())},
+        "failures": sorted({(o["nl_query"], o.get("error", "")) for o in outcomes if not o["passed"]}),
+    }
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float, max_pass_drop: float) -> List[str]:
+    """Returns human-readable regressions of report against baseline."""
+    problems = []
+    if report["pass_rate"] < baseline["pass_rate"] - max_pass_drop:
+        problems.append(f"pass_rate {report['pass_rate']:.2%} < baseline {baseline['pass_rate']:.2%}")
+    for name, stats in report["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base or base["p95_ms"] <= 0:
+            continue
+        if stats["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            problems.append(f"{name} p95 {stats['p95_ms']:.1f}ms > baseline {base['p95_ms']:.1f}ms "
+                            f"(+{stats['p95_ms'] / base['p95_ms'] - 1:.0%})")
+    return problems
+
+def print_report(report: Dict[str, Any]):
+    print(f"runs={report['runs']} pass_rate={report['pass_rate']:.2%} "
+          f"throughput={report['throughput_qps']:.1f} q/s wall={report['wall_s']:.2f}s")
+    print(f"repair rounds: {report['repair_rounds']}")
+    print(f"{'stage':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, s in report["stages"].items():
+        print(f"{name:<16}{s['count']:>8}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}")
+    for nl_query, error in report["failures"]:
+        print(f"FAIL {nl_query}: {error}")
+
+def install_stand_ins(args, rng: random.Random):
+    if not args.real_llm:
+        replay = None
+        if args.llm_replay:
+            with open(args.llm_replay, "r", encoding="utf-8") as f:
+                replay = json.load(f)
+        fake_llm = FakeLLM(Latency(args.llm_latency_ms, args.jitter, rng), replay)
+        llm_client.client = httpx.AsyncClient(transport=httpx.MockTransport(fake_llm.handler))
+    if not args.real_es:
+        es_client.client = FakeES(Latency(args.es_latency_ms, args.jitter, rng), rng, args.es_invalid_rate)
+
+async def main(args) -> int:
+    rng = random.Random(args.seed)
+    with open(args.eval, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+
+    settings.DEBUG_TRACE_ENABLED = True
+    if args.no_cache:
+        settings.DRAFT_CACHE_ENABLED = False
+        settings.SEARCH_CACHE_ENABLED = False
+        settings.TEMPLATE_ENABLED = False
+    if not args.real_es:
+        missing = {c["index"] for c in cases if not field_catalog.get_index_fields(c["index"])}
+        if missing:
+            field_catalog.swap({**field_catalog.catalog, **{index: DEMO_FIELDS for index in missing}})
+    install_stand_ins(args, rng)
+
+    report = await run_eval(cases, args.concurrency, args.repeat)
+    print_report(report)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.max_regression, args.max_pass_drop)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        if problems:
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the eval set through /draft -> /validate -> /run")
+    parser.add_argument("--eval", default="data/eval_queries.json", help="Eval cases")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=10, help="Passes over the eval set")
+    parser.add_argument("--no-cache", action="store_true", help="Disable draft/search caches and templates")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--jitter", type=float, default=0.5, help="Log-normal sigma of injected latency")
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-replay", help="JSON object of nl_query -> recorded draft")
+    parser.add_argument("--real-llm", action="store_true", help="Use the configured LLM backends")
+    parser.add_argument("--es-latency-ms", type=float, default=20)
+    parser.add_argument("--es-invalid-rate", type=float, default=0.0, help="Injected validate failures (0-1)")
+    parser.add_argument("--real-es", action="store_true", help="Use the configured Elasticsearch")
+    parser.add_argument("--out", help="Write the JSON report here (use as a future --baseline)")
+    parser.add_argument("--baseline", help="Compare against a saved report; exit 1 on regression")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p95 growth per stage")
+    parser.add_argument("--max-pass-drop", type=float, default=0.0, help="Allowed pass-rate drop")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main(args)))
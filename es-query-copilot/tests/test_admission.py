@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from app.core.admission import AdmissionController, AdmissionRejected
+from app.core.config import settings
+
+@pytest.mark.asyncio
+async def test_tenants_are_served_round_robin_and_deadlines_reject():
+    with patch.object(settings, "ADMISSION_INITIAL_LIMIT", 2.0), \
+         patch.object(settings, "ADMISSION_QUEUE_TIMEOUT_S", 0.2):
+        controller = AdmissionController()
+        held = [await controller.acquire("a", 1.0), await controller.acquire("a", 1.0)]
+        order = []
+
+        async def run(tenant, i):
+            ticket = await controller.acquire(tenant, 1.0)
+            order.append(f"{tenant}{i}")
+            return ticket
+
+        # Tenant a floods the queue before b asks once
+        tasks = [asyncio.create_task(run("a", i)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(run("b", 0)))
+        await asyncio.sleep(0)
+
+        for ticket in held:
+            controller.release(ticket)
+        await asyncio.sleep(0.01)
+        assert order == ["a0", "b0"]
+
+        # Nothing releases again: the rest hit the queue deadline
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert sum(isinstance(r, AdmissionRejected) for r in results) == 2
+        assert controller.stats()["rejected_deadline"] == 2
+
+@pytest.mark.asyncio
+async def test_limit_backs_off_on_slow_es_and_queue_full_is_fast():
+    with patch.object(settings, "ADMISSION_INITIAL_LIMIT", 10.0), \
+         patch.object(settings, "ADMISSION_MAX_QUEUE", 0):
+        controller = AdmissionController()
+        ticket = await controller.acquire("a", 1.0)
+        ticket.took_ms = 100
+        controller.release(ticket)
+        assert controller.limit == pytest.approx(10.1)
+
+        ticket = await controller.acquire("a", 1.0)
+        ticket.took_ms = settings.ADMISSION_TARGET_TOOK_MS * 5
+        controller.release(ticket)
+        assert controller.limit == pytest.approx(10.1 * settings.ADMISSION_BACKOFF)
+
+        # Heavier than the whole limit: still runs, but alone
+        heavy = await controller.acquire("a", 50.0)
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("b", 1.0)
+        controller.release(heavy)
+
+@pytest.mark.asyncio
+async def test_giving_up_at_the_head_lets_the_queue_move():
+    with patch.object(settings, "ADMISSION_INITIAL_LIMIT", 2.0):
+        controller = AdmissionController()
+        held = await controller.acquire("a", 1.5)
+        heavy = asyncio.create_task(controller.acquire("a", 2.0))
+        await asyncio.sleep(0)
+        light = asyncio.create_task(controller.acquire("b", 0.5))
+        await asyncio.sleep(0.01)
+        assert not light.done()
+
+        # The heavy head goes away; the light one fits and must not wait for a release
+        heavy.cancel()
+        await asyncio.sleep(0.01)
+        assert light.done() and light.result().weight == 0.5
+        assert controller.in_use == 2.0
+        controller.release(held)
@@ -0,0 +1,76 @@
+from app.core.analyzer import DSLAnalyzer
+from app.core.field_catalog import FieldCatalog
+
+CATALOG = {
+    "orders-*": {
+        "status": {"type": "text", "searchable": True, "aggregatable": False},
+        "status.keyword": {"type": "keyword", "searchable": True, "aggregatable": True},
+        "country": {"type": "keyword", "searchable": True, "aggregatable": True},
+        "amount": {"type": "double", "searchable": True, "aggregatable": True},
+        "@timestamp": {"type": "date", "searchable": True, "aggregatable": True},
+    }
+}
+
+def _analyzer():
+    catalog = FieldCatalog(path="/nonexistent")
+    catalog.catalog = CATALOG
+    return DSLAnalyzer(catalog)
+
+def test_text_field_rewritten_to_keyword():
+    dsl = {
+        "query": {"bool": {"filter": [{"term": {"status": "failed"}}]}},
+        "aggs": {"by_status": {"terms": {"field": "status"}}},
+        "sort": [{"status": "asc"}]
+    }
+    out, fixes, errors = _analyzer().analyze("orders-*", dsl)
+
+    assert errors == []
+    assert out["query"]["bool"]["filter"] == [{"term": {"status.keyword": "failed"}}]
+    assert out["aggs"]["by_status"]["terms"]["field"] == "status.keyword"
+    assert out["sort"] == [{"status.keyword": "asc"}]
+    assert len(fixes) == 3
+    # Input is left untouched
+    assert dsl["query"]["bool"]["filter"] == [{"term": {"status": "failed"}}]
+
+def test_unknown_fields_dropped_or_mapped():
+    dsl = {
+        "query": {"bool": {"filter": [
+            {"term": {"country.keyword": "CN"}},
+            {"range": {"created_at": {"gte": "now-7d"}}}
+        ]}},
+        "aggs": {"bogus": {"terms": {"field": "nope"}}}
+    }
+    out, fixes, errors = _analyzer().analyze("orders-*", dsl)
+
+    assert errors == []
+    assert out["query"]["bool"]["filter"] == [{"term": {"country": "CN"}}]
+    assert out["aggs"] == {}
+    assert len(fixes) == 3
+
+def test_unfixable_type_errors_reported():
+    dsl = {"aggs": {
+        "avg_country": {"avg": {"field": "country"}},
+        "per_day": {"date_histogram": {"field": "amount", "calendar_interval": "day"}}
+    }}
+    _, fixes, errors = _analyzer().analyze("orders-*", dsl)
+
+    assert fixes == []
+    assert len(errors) == 2
+
+def test_runtime_fields_are_known_and_exclusions_are_not_dropped():
+    dsl = {
+        "runtime_mappings": {"weekday": {"type": "keyword", "script": "emit(doc['@timestamp'].value.dayOfWeekEnum.toString())"}},
+        "query": {"bool": {
+            "filter": [{"term": {"weekday": "MONDAY"}}],
+            "must_not": [{"term": {"reason": "test"}}]
+        }},
+        "aggs": {"by_day": {"terms": {"field": "weekday"}}}
+    }
+    out, fixes, errors = _analyzer().analyze("orders-*", dsl)
+
+    assert fixes == []
+    assert out["query"]["bool"]["filter"] == [{"term": {"weekday": "MONDAY"}}]
+    assert out["aggs"]["by_day"]["terms"]["field"] == "weekday"
+    # Removing the exclusion would widen the results: report it instead
+    assert out["query"]["bool"]["must_not"] == [{"term": {"reason": "test"}}]
+    assert errors == ["query.bool.must_not.term: exclusion on non-existent field 'reason'"]
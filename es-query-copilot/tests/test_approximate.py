@@ -0,0 +1,73 @@
+from collections import OrderedDict
+import pytest
+from httpx import AsyncClient
+from unittest.mock import patch, AsyncMock
+from app.main import app
+from app.core.approximate import Approximator, SAMPLER_AGG
+from app.core.config import settings
+
+AGG_DSL = {"size": 0, "aggs": {"by_country": {"terms": {"field": "country"}, "aggs": {"spend": {"sum": {"field": "amount"}}}}}}
+
+def test_sampler_probability_targets_latency_and_reports_bounds():
+    approximator = Approximator()
+    plan = approximator.plan(AGG_DSL, "orders-*", {"estimated_cost": 1e8})
+
+    # 1e8 cost units * 0.001 ms = 100s exact; 300ms target -> p = 0.003
+    assert plan["method"] == "random_sampler"
+    assert plan["probability"] == 0.003
+
+    body = approximator.rewrite(AGG_DSL, plan)
+    assert body["aggs"][SAMPLER_AGG]["random_sampler"]["probability"] == 0.003
+    assert body["aggs"][SAMPLER_AGG]["aggs"] == AGG_DSL["aggs"]
+
+    resp = approximator.finish({"took": 250, "aggregations": {SAMPLER_AGG: {
+        "doc_count": 1000000, "seed": 42, "probability": 0.003,
+        "by_country": {"buckets": [{"key": "DE", "doc_count": 600000, "spend": {"value": 1.0}}]}
+    }}}, plan)
+    bucket = resp["aggregations"]["by_country"]["buckets"][0]
+    assert bucket["doc_count_error_95"] > 0
+    assert resp["approximation"]["sampled_docs"] == 3000
+    assert 0 < resp["approximation"]["doc_count_rel_error_95"] < 0.05
+
+    # Slower than modelled: the next plan samples thinner
+    approximator.observe("orders-*", plan["estimated_cost"], 600)
+    assert approximator.plan(AGG_DSL, "orders-*", {"estimated_cost": 1e8})["probability"] < 0.003
+
+def test_count_questions_use_terminate_after_and_cheap_aggs_stay_exact():
+    approximator = Approximator()
+    plan = approximator.plan({"size": 0, "query": {"term": {"status": "failed"}}}, "orders-*", {"estimated_cost": 1e5})
+    assert plan["method"] == "terminate_after"
+
+    resp = approximator.finish({"terminated_early": True, "hits": {"total": {"value": 10000, "relation": "eq"}}}, plan)
+    assert resp["hits"]["total"]["relation"] == "gte"
+    assert resp["approximation"]["terminated_early"] is True
+
+    assert approximator.plan(AGG_DSL, "orders-*", {"estimated_cost": 10})["method"] == "exact"
+    distinct = {"size": 0, "aggs": {"users": {"cardinality": {"field": "user"}}}}
+    assert approximator.plan(distinct, "orders-*", {"estimated_cost": 1e8})["method"] == "exact"
+
+@pytest.mark.asyncio
+async def test_terminate_after_runs_do_not_train_the_latency_model():
+    from app.core.approximate import approximator
+
+    with patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search, \
+         patch.object(approximator, "_ms_per_cost", OrderedDict()):
+        mock_search.return_value = {"took": 5, "terminated_early": True,
+                                    "hits": {"total": {"value": 10000, "relation": "eq"}, "hits": []}}
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/run", json={
+                "index": "orders-*", "mode": "approximate",
+                "dsl": {"size": 0, "query": {"term": {"status": "failed"}}}
+            }, headers={"Cache-Control": "no-cache"})
+
+        assert response.status_code == 200
+        assert mock_search.call_args.kwargs["body"]["terminate_after"] > 0
+        assert "orders-*" not in approximator._ms_per_cost
+
+def test_latency_model_is_bounded():
+    approximator = Approximator()
+    with patch.object(settings, "APPROX_MODEL_MAX", 2):
+        for index in ("a", "b", "c"):
+            approximator.observe(index, 1000, 10)
+    assert approximator.ms_per_cost("a") == settings.APPROX_MS_PER_COST
+    assert approximator.ms_per_cost("c") == 0.01
@@ -0,0 +1,49 @@
+import pyarrow as pa
+from app.core.columnar import AggTable
+
+AGGS = {
+    "by_country": {
+        "terms": {"field": "country"},
+        "aggs": {
+            "per_day": {
+                "date_histogram": {"field": "ts", "calendar_interval": "day"},
+                "aggs": {"revenue": {"sum": {"field": "amount"}}, "lat": {"percentiles": {"field": "ms"}}}
+            }
+        }
+    },
+    "total": {"sum": {"field": "amount"}}
+}
+
+RESULT = {
+    "total": {"value": 60.0},
+    "by_country": {"buckets": [
+        {"key": "DE", "doc_count": 3, "per_day": {"buckets": [
+            {"key": 1700000000000, "key_as_string": "2023-11-14", "doc_count": 2,
+             "revenue": {"value": 20.0}, "lat": {"values": {"50.0": 5.0, "99.0": 9.0}}},
+            {"key": 1700086400000, "key_as_string": "2023-11-15", "doc_count": 1,
+             "revenue": {"value": 10.0}, "lat": {"values": {"50.0": 4.0, "99.0": 4.0}}},
+        ]}},
+        {"key": "FR", "doc_count": 1, "per_day": {"buckets": [
+            {"key": 1700000000000, "doc_count": 1, "revenue": {"value": 30.0}, "lat": {"values": {"50.0": 1.0}}},
+        ]}},
+    ]}
+}
+
+def test_flatten_one_row_per_leaf_bucket():
+    table = AggTable()
+    table.append(AGGS, RESULT)
+
+    assert table.num_rows == 3
+    assert table.columns["by_country"] == ["DE", "DE", "FR"]
+    assert table.columns["per_day.doc_count"] == [2, 1, 1]
+    assert table.columns["total"] == [60.0, 60.0, 60.0]
+    assert table.columns["lat.99.0"] == [9.0, 4.0, None]
+
+    arrays = table.to_numpy()
+    assert arrays["by_country.doc_count"].dtype.kind == "i"
+    assert arrays["per_day"].dtype == "datetime64[ms]"
+    assert arrays["lat.99.0"][2] != arrays["lat.99.0"][2]  # NaN
+
+    arrow = pa.ipc.open_stream(table.to_ipc()).read_all()
+    assert arrow.schema.field("per_day").type == pa.timestamp("ms", tz="UTC")
+    assert arrow.column("revenue").to_pylist() == [20.0, 10.0, 30.0]
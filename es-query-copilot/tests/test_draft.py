@@ -1,3 +1,5 @@
+import json
+import asyncio
 import pytest
 from httpx import AsyncClient
 from app.main import app
@@ -25,3 +27,82 @@ async def test_draft_endpoint():
         data = response.json()
         assert "dsl" in data
         assert data["confidence"] == 0.9
+
+@pytest.mark.asyncio
+async def test_draft_cache_coalesces_and_hits():
+    from app.core.cache import draft_cache
+    draft_cache.clear()
+
+    mock_llm_response = {
+        "dsl": {"query": {"term": {"status.keyword": "failed"}}},
+        "explanation": ["cached"],
+        "risk": {"level": "low", "reasons": []},
+        "confidence": 0.8
+    }
+
+    async def slow_llm(**kwargs):
+        await asyncio.sleep(0.05)
+        return mock_llm_response
+
+    with patch("app.services.llm_client.llm_client.generate_json", new_callable=AsyncMock) as mock_llm:
+        mock_llm.side_effect = slow_llm
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            payload = {"index": "orders-*", "nl_query": "Failed  orders"}
+            responses = await asyncio.gather(*[ac.post("/draft", json=payload) for _ in range(5)])
+            # Normalized query (case/whitespace) hits the same entry
+            repeat = await ac.post("/draft", json={"index": "orders-*", "nl_query": "failed orders "})
+            other_tz = await ac.post("/draft", json={
+                "index": "orders-*",
+                "nl_query": "failed orders",
+                "user_context": {"timezone": "Asia/Shanghai"}
+            })
+
+    assert all(r.status_code == 200 for r in responses)
+    assert repeat.json()["explanation"] == ["cached"]
+    assert other_tz.status_code == 200
+    # One call for the coalesced burst + repeat, one for the other timezone
+    assert mock_llm.call_count == 2
+    stats = draft_cache.stats()
+    assert stats["coalesced"] == 4
+    assert stats["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_draft_streams_sse_events():
+    from app.core.cache import draft_cache
+    draft_cache.clear()
+
+    body = json.dumps({
+        "dsl": {"query": {"match_all": {}}},
+        "explanation": ["Match every \"order\"", "Step two"],
+        "confidence": 0.7,
+        "risk": {"level": "low", "reasons": []}
+    })
+
+    async def fake_stream(**kwargs):
+        for i in range(0, len(body), 5):
+            yield body[i:i + 5]
+
+    with patch("app.services.llm_client.llm_client.stream_json", new=fake_stream):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/draft", json={
+                "index": "orders-*",
+                "nl_query": "stream me",
+                "stream": True
+            })
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = block.split("\n")
+        events.append((lines[0][len("event: "):], json.loads(lines[1][len("data: "):])))
+
+    names = [name for name, _ in events]
+    assert names[0] == "dsl"
+    assert names[-1] == "done"
+    assert events[0][1] == {"query": {"match_all": {}}}
+    first_step = "".join(d["delta"] for n, d in events if n == "explanation" and d["index"] == 0)
+    assert first_step == "Match every \"order\""
+    assert events[-1][1]["confidence"] == 0.7
@@ -0,0 +1,65 @@
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from unittest.mock import patch, AsyncMock
+from app.core.examples import ExampleStore
+from app.core.config import settings
+
+def test_nearest_examples_per_index_within_budget():
+    store = ExampleStore(maxsize=3)
+    store.add("orders-*", "最近7天失败订单按国家前10", {"size": 0, "aggs": {"c": {"terms": {"field": "country.keyword"}}}})
+    store.add("orders-*", "查找金额大于100的订单", {"query": {"range": {"amount": {"gt": 100}}}})
+    store.add("logs-*", "最近7天失败请求按国家统计", {"size": 0})
+
+    hits = store.search("orders-*", "最近30天失败订单按国家前5", top_k=5)
+    assert [e["nl_query"] for _, e in hits][0] == "最近7天失败订单按国家前10"
+    assert all(e["index"] == "orders-*" for _, e in hits)
+
+    rendered = store.render("orders-*", "最近30天失败订单按国家前5", top_k=2, token_budget=1000)
+    assert rendered.startswith("Q: 最近7天失败订单按国家前10\nDSL: {")
+    assert store.render("orders-*", "最近30天失败订单按国家前5", top_k=2, token_budget=5) == ""
+
+    # Full ring buffer overwrites the oldest example
+    store.add("orders-*", "amount over 500 orders", {"query": {"range": {"amount": {"gt": 500}}}})
+    assert len(store) == 3
+    assert "最近7天失败订单按国家前10" not in [e["nl_query"] for e in store.examples]
+
+def test_draft_prompt_includes_examples():
+    from app.api import draft
+    from app.models.dto import DraftRequest
+
+    # A fresh store, so the shared one does not leak examples into other tests
+    store = ExampleStore()
+    store.add("orders-*", "refunded orders by country", {"query": {"term": {"status.keyword": "refunded"}}})
+    with patch.object(draft, "example_store", store):
+        prompt = draft._build_system_prompt(DraftRequest(index="orders-*", nl_query="failed orders by country"))
+        assert "Validated examples" in prompt
+        assert "Q: refunded orders by country" in prompt
+
+        with patch.object(settings, "EXAMPLES_ENABLED", False):
+            prompt = draft._build_system_prompt(DraftRequest(index="orders-*", nl_query="failed orders by country"))
+        assert "Validated examples" not in prompt
+
+@pytest.mark.asyncio
+async def test_only_drafted_pairs_become_examples_and_stale_drafts_expire():
+    from app.api import draft, validate
+    from app.models.dto import DraftRequest
+
+    store = ExampleStore()
+    request = DraftRequest(index="orders-*", nl_query="refunded orders by country")
+    dsl = {"query": {"term": {"status.keyword": "refunded"}}}
+    with patch.object(draft, "example_store", store), patch.object(validate, "example_store", store), \
+         patch("app.services.es_client.es_client.validate_query", new_callable=AsyncMock) as mock_es:
+        mock_es.return_value = {"valid": True}
+        key = draft._draft_cache_key(request)
+        draft_id = draft._to_response({"dsl": dsl}, request).draft_id
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            await ac.post("/validate", json={"index": "orders-*", "dsl": dsl, "nl_query": request.nl_query})
+            assert len(store) == 0
+            await ac.post("/validate", json={
+                "index": "orders-*", "dsl": dsl, "nl_query": request.nl_query, "draft_id": draft_id
+            })
+        assert len(store) == 1
+        # New examples change the prompt, so drafts cached before them are not reused
+        assert draft._draft_cache_key(request) != key
@@ -0,0 +1,103 @@
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from unittest.mock import patch, AsyncMock
+
+@pytest.mark.asyncio
+async def test_explain_batch_two_round_trips():
+    inner = {"value": 1.2, "description": "weight(status:paid)", "details": []}
+    wrapped = {"value": 1.2, "description": "sum of:", "details": [
+        inner, {"value": 0.0, "description": "match on required clause, product of:", "details": []}
+    ]}
+    with patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search, \
+         patch("app.services.es_client.es_client.mget", new_callable=AsyncMock) as mock_mget, \
+         patch("app.services.es_client.es_client.explain", new_callable=AsyncMock) as mock_explain:
+        mock_search.return_value = {"hits": {"hits": [{"_id": "1", "_index": "orders-1", "_explanation": wrapped}]}}
+        mock_mget.return_value = {"docs": [
+            {"_id": "1", "_index": "orders-1", "found": True},
+            {"_id": "2", "_index": "orders-1", "found": True},
+            {"_id": "3", "_index": "orders", "found": False},
+        ]}
+        mock_explain.return_value = {"_index": "orders-1", "matched": False, "explanation": {"description": "no match"}}
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/explain/batch", json={
+                "index": "orders",
+                "doc_ids": ["1", "2", "3", "1"],
+                "dsl": {"query": {"term": {"status": "paid"}}},
+                "explain_misses": True
+            })
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["doc_id"] for r in results] == ["1", "2", "3"]
+    assert results[0]["matched"] and results[0]["explanation"] == inner
+    assert results[1]["found"] and not results[1]["matched"]
+    assert results[1]["explanation"] == {"description": "no match"}
+    assert not results[2]["found"]
+
+    body = mock_search.call_args.kwargs["body"]
+    assert body["explain"] is True
+    assert body["query"]["bool"]["filter"] == [{"ids": {"values": ["1", "2", "3"]}}]
+    # Only the found-but-unmatched doc needs its own _explain
+    assert mock_explain.call_count == 1
+    assert mock_explain.call_args.kwargs["id"] == "2"
+
+@pytest.mark.asyncio
+async def test_explain_batch_pattern_resolves_concrete_index():
+    with patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search, \
+         patch("app.services.es_client.es_client.mget", new_callable=AsyncMock) as mock_mget, \
+         patch("app.services.es_client.es_client.explain", new_callable=AsyncMock) as mock_explain:
+        mock_search.side_effect = [
+            {"hits": {"hits": []}},
+            {"hits": {"hits": [{"_id": "2", "_index": "orders-2024.05"}]}},
+        ]
+        mock_mget.side_effect = Exception("mget does not support wildcards")
+        mock_explain.return_value = {"_index": "orders-2024.05", "matched": False, "explanation": {}}
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            misses = await ac.post("/explain/batch", json={
+                "index": "orders-*", "doc_ids": ["2", "3"], "dsl": {"query": {"term": {"status": "paid"}}}
+            })
+            mock_search.side_effect = [
+                {"hits": {"hits": []}},
+                {"hits": {"hits": [{"_id": "2", "_index": "orders-2024.05"}]}},
+            ]
+            explained = await ac.post("/explain/batch", json={
+                "index": "orders-*", "doc_ids": ["2", "3"], "dsl": {"query": {"term": {"status": "paid"}}},
+                "explain_misses": True
+            })
+
+    results = misses.json()["results"]
+    assert results[0]["found"] and results[0]["index"] == "orders-2024.05" and not results[0]["matched"]
+    assert not results[1]["found"]
+    assert mock_search.call_args.kwargs["body"]["query"] == {"ids": {"values": ["2", "3"]}}
+    # The pattern never reaches _explain, and only with explain_misses
+    assert explained.status_code == 200
+    assert mock_explain.call_count == 1
+    assert mock_explain.call_args.kwargs["index"] == "orders-2024.05"
+
+@pytest.mark.asyncio
+async def test_explain_batch_same_id_in_several_indices():
+    with patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search, \
+         patch("app.services.es_client.es_client.mget", new_callable=AsyncMock) as mock_mget, \
+         patch("app.services.es_client.es_client.explain", new_callable=AsyncMock) as mock_explain:
+        mock_search.side_effect = [
+            {"hits": {"hits": [{"_id": "1", "_index": "orders-2024.05", "_explanation": {"description": "a"}}]}},
+            {"hits": {"hits": [{"_id": "1", "_index": "orders-2024.05"}, {"_id": "1", "_index": "orders-2024.06"}]}},
+        ]
+        mock_mget.side_effect = Exception("mget does not support wildcards")
+        mock_explain.return_value = {"_index": "orders-2024.06", "matched": False, "explanation": {"description": "b"}}
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/explain/batch", json={
+                "index": "orders-*", "doc_ids": ["1"], "dsl": {"query": {"term": {"status": "paid"}}},
+                "explain_misses": True
+            })
+
+    # The match in one index does not hide (or get overwritten by) the miss in the other
+    results = response.json()["results"]
+    assert [(r["index"], r["matched"]) for r in results] == [("orders-2024.05", True), ("orders-2024.06", False)]
+    assert results[0]["explanation"] == {"description": "a"}
+    assert results[1]["explanation"] == {"description": "b"}
+    assert mock_explain.call_args.kwargs["index"] == "orders-2024.06"
@@ -0,0 +1,111 @@
+import json
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from unittest.mock import patch, AsyncMock
+
+def _page(start, n):
+    return {"pit_id": "pit-1", "hits": {"hits": [
+        {"_id": str(i), "_source": {"status": "failed", "geo": {"country": "CN"}}, "sort": [i]}
+        for i in range(start, start + n)
+    ]}}
+
+@pytest.mark.asyncio
+async def test_export_ndjson_pages_through_pit():
+    with patch("app.services.es_client.es_client.open_point_in_time", new_callable=AsyncMock) as mock_open, \
+         patch("app.services.es_client.es_client.close_point_in_time", new_callable=AsyncMock) as mock_close, \
+         patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search, \
+         patch("app.core.config.settings.EXPORT_PAGE_SIZE", 2):
+        mock_open.return_value = "pit-1"
+        mock_search.side_effect = [_page(0, 2), _page(2, 1)]
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/export", json={
+                "index": "orders-*",
+                "dsl": {"query": {"match_all": {}}}
+            })
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["_id"] for line in lines] == ["0", "1", "2"]
+    assert mock_search.call_args_list[1].kwargs["body"]["search_after"] == [1]
+    mock_close.assert_awaited_once_with("pit-1")
+
+@pytest.mark.asyncio
+async def test_export_csv_with_slices():
+    async def fake_search(index, body, **kwargs):
+        # One page per slice, offset by slice id
+        return _page(body["slice"]["id"] * 10, 1)
+
+    with patch("app.services.es_client.es_client.open_point_in_time", new_callable=AsyncMock) as mock_open, \
+         patch("app.services.es_client.es_client.close_point_in_time", new_callable=AsyncMock), \
+         patch("app.services.es_client.es_client.search", new=fake_search):
+        mock_open.return_value = "pit-1"
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/export", json={
+                "index": "orders-*",
+                "dsl": {"query": {"match_all": {}}},
+                "format": "csv",
+                "slices": 3
+            })
+
+    rows = response.text.strip().splitlines()
+    assert rows[0] == "_id,status,geo.country"
+    assert sorted(row.split(",")[0] for row in rows[1:]) == ["0", "10", "20"]
+
+@pytest.mark.asyncio
+async def test_export_csv_aborts_on_mid_stream_error():
+    from app.core.errors import ESDriverError
+
+    with patch("app.services.es_client.es_client.open_point_in_time", new_callable=AsyncMock) as mock_open, \
+         patch("app.services.es_client.es_client.close_point_in_time", new_callable=AsyncMock) as mock_close, \
+         patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search, \
+         patch("app.core.config.settings.EXPORT_PAGE_SIZE", 2):
+        mock_open.return_value = "pit-1"
+        mock_search.side_effect = [_page(0, 2), ESDriverError("Search failed: shard failure")]
+
+        # A truncated CSV must not look like a complete one
+        with pytest.raises(ESDriverError):
+            async with AsyncClient(app=app, base_url="http://test") as ac:
+                await ac.post("/export", json={
+                    "index": "orders-*",
+                    "format": "csv",
+                    "dsl": {"query": {"match_all": {}}}
+                })
+    mock_close.assert_awaited_once_with("pit-1")
+
+@pytest.mark.asyncio
+async def test_export_takes_admission_slots():
+    from app.core.admission import admission, AdmissionRejected
+    with patch("app.services.es_client.es_client.open_point_in_time", new_callable=AsyncMock) as mock_open, \
+         patch("app.services.es_client.es_client.close_point_in_time", new_callable=AsyncMock), \
+         patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search, \
+         patch("app.core.config.settings.EXPORT_PAGE_SIZE", 2), \
+         patch.object(admission, "acquire", wraps=admission.acquire) as mock_acquire:
+        mock_open.return_value = "pit-1"
+        mock_search.side_effect = [_page(0, 2), _page(2, 1)]
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/export", json={
+                "index": "orders-*", "dsl": {"query": {"match_all": {}}}
+            }, headers={"X-Tenant-Id": "team-a"})
+
+            # Overloaded: rejected before any headers (or a PIT) go out
+            mock_acquire.side_effect = AdmissionRejected("queue full", retry_after=2)
+            rejected = await ac.post("/export", json={
+                "index": "orders-*", "dsl": {"query": {"match_all": {}}}
+            })
+
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 3
+    # PIT open plus every page fetch, each under the tenant with the same risk weight
+    calls = [c.args for c in mock_acquire.call_args_list[:-1]]
+    assert len(calls) >= 1 + mock_search.await_count
+    assert {tenant for tenant, _ in calls} == {"team-a"}
+    assert len({weight for _, weight in calls}) == 1
+    assert admission.in_use == 0
+
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "2"
+    assert mock_open.await_count == 1
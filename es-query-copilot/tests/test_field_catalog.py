@@ -0,0 +1,83 @@
+import json
+import os
+import pytest
+from app.core.field_catalog import FieldCatalog
+
+FIELDS = {"status": {"type": "keyword", "searchable": True, "aggregatable": True}}
+
+def test_pattern_resolution_prefers_most_specific(tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps({
+        "orders-*": FIELDS,
+        "orders-eu-*": {"country": {"type": "keyword"}},
+        "logs-2026.10": {"message": {"type": "text"}}
+    }))
+    catalog = FieldCatalog(path=str(path))
+
+    assert catalog.get_index_fields("orders-2026.10") == FIELDS
+    assert "country" in catalog.get_index_fields("orders-eu-2026.10")
+    assert "message" in catalog.get_index_fields("logs-2026.10")
+    assert "message" in catalog.get_index_fields("-orders-*,logs-2026.10")
+    assert catalog.get_index_fields("metrics-2026") == {}
+
+@pytest.mark.asyncio
+async def test_file_refresh_swaps_and_bumps_version(tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps({"orders-*": FIELDS}))
+    catalog = FieldCatalog(path=str(path))
+    version = catalog.version
+
+    # Unchanged file: no swap
+    assert await catalog.refresh_from_file() is False
+
+    path.write_text(json.dumps({"orders-*": {**FIELDS, "amount": {"type": "double"}}}))
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 5))
+
+    assert await catalog.refresh_from_file() is True
+    assert catalog.version == version + 1
+    assert "amount" in catalog.get_index_fields("orders-2026.10")
+
+def test_field_caps_conflicts_keep_majority_type():
+    from app.core.field_catalog import fields_from_field_caps
+    caps = {"fields": {
+        "_id": {"_id": {"type": "_id"}},
+        "amount": {
+            "long": {"type": "long", "searchable": True, "aggregatable": True, "indices": ["orders-1", "orders-2"]},
+            "keyword": {"type": "keyword", "searchable": True, "aggregatable": True, "indices": ["orders-0"]},
+        },
+    }}
+    fields = fields_from_field_caps(caps)
+
+    assert "_id" not in fields
+    assert fields["amount"]["type"] == "long"
+    assert fields["amount"]["conflicts"] == {"keyword": ["orders-0"], "long": ["orders-1", "orders-2"]}
+
+def test_compact_round_trip_and_diff(tmp_path):
+    from app.core.field_catalog import write_catalog, read_catalog, compact_path, diff_catalogs
+    data = {"orders-*": {**FIELDS, "amount": {"type": "double"}}, "logs-*": FIELDS}
+    path = tmp_path / "catalog.json"
+    write_catalog(str(path), data)
+
+    compact = json.loads(open(compact_path(str(path))).read())
+    assert len(compact["entries"]) == 2
+    assert read_catalog(str(path)) == data
+    assert FieldCatalog(path=str(path)).get_index_fields("orders-2026.10")["amount"] == {"type": "double"}
+
+    new = {"orders-*": {"amount": {"type": "long"}, "country": {"type": "keyword"}}, "logs-*": FIELDS}
+    assert diff_catalogs(data, new) == {
+        "orders-*": {"added": ["country"], "removed": ["status"], "changed": ["amount"]}
+    }
+
+def test_pattern_matcher_trie_prefers_specific_patterns():
+    from app.core.field_catalog import PatternMatcher
+
+    matcher = PatternMatcher(["orders-*", "orders-eu-*", "logs-*-app?", "*-archive", "orders-2026"])
+    assert matcher.match("orders-eu-2026.10") == "orders-eu-*"
+    assert matcher.match("orders-us-2026.10") == "orders-*"
+    assert matcher.match("logs-web-app1") == "logs-*-app?"
+    assert matcher.match("logs-web-app12") is None
+    assert matcher.match("orders-archive") == "*-archive"
+    assert matcher.match("metrics-2026") is None
+    # Literal keys are looked up directly, not through the matcher
+    assert PatternMatcher(["orders-2026"]).match("orders-2026") is None
@@ -0,0 +1,41 @@
+from app.core.field_index import FieldIndex, estimate_tokens
+
+def _wide_catalog(n: int = 2000) -> dict:
+    fields = {f"attr_{i}.value": {"type": "keyword", "searchable": True, "aggregatable": True} for i in range(n)}
+    fields.update({
+        "status": {"type": "text", "searchable": True, "aggregatable": False},
+        "status.keyword": {"type": "keyword", "searchable": True, "aggregatable": True},
+        "shipping.country": {"type": "keyword", "searchable": True, "aggregatable": True},
+        "amount": {"type": "double", "searchable": True, "aggregatable": True},
+        "@timestamp": {"type": "date", "searchable": True, "aggregatable": True},
+    })
+    return fields
+
+def test_relevant_fields_ranked_first():
+    index = FieldIndex(_wide_catalog())
+    selected = index.select("最近7天失败订单按国家前10", top_k=5, token_budget=1000)
+
+    assert "status.keyword" in selected
+    assert "shipping.country" in selected
+    assert "@timestamp" in selected
+    assert not any(name.startswith("attr_") for name in selected[:4])
+
+def test_selection_respects_token_budget():
+    index = FieldIndex(_wide_catalog())
+    selected = index.select("anything", top_k=10000, token_budget=200)
+    rendered = index.render(selected)
+
+    assert 0 < len(selected) < 2005
+    assert sum(estimate_tokens(line) for line in rendered.splitlines()) <= 200
+    assert "status: text [no-agg]" in index.render(["status"])
+
+def test_rank_is_lazy_and_ordered():
+    index = FieldIndex(_wide_catalog())
+    ranked = index.rank("failed orders by country")
+    first = [next(ranked) for _ in range(3)]
+    assert "shipping.country" in first
+    # Every field exactly once; unscored ones follow in catalog order
+    rest = list(ranked)
+    assert len(set(first + rest)) == len(first) + len(rest) == 2005
+    attrs = [name for name in rest if name.startswith("attr_")]
+    assert attrs == [f"attr_{i}.value" for i in range(2000)]
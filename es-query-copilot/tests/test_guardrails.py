@@ -1,3 +1,4 @@
+import pytest
 from app.core.risk import risk_analyzer
 
 def test_risk_scoring():
@@ -22,3 +23,94 @@ def test_risk_scoring():
     assert res["level"] == "high"
     assert "Wildcard query used" in res["reasons"]
     assert "Scripting used" in res["reasons"]
+
+def test_risk_wildcard_shape_and_time_filter():
+    leading = risk_analyzer.evaluate({"query": {"wildcard": {"sku": "*123"}}})
+    trailing = risk_analyzer.evaluate({"query": {"wildcard": {"sku": "abc*"}}})
+    assert leading["level"] == "high"
+    assert "Leading wildcard pattern" in leading["reasons"]
+    assert trailing["level"] == "medium"
+
+    # The same trailing wildcard inside a time window is cheap enough
+    scoped = risk_analyzer.evaluate({"query": {"bool": {"filter": [
+        {"wildcard": {"sku": "abc*"}},
+        {"range": {"@timestamp": {"gte": "now-7d/d"}}}
+    ]}}})
+    assert scoped["level"] == "low"
+    assert scoped["estimated_cost"] < trailing["estimated_cost"]
+
+def test_risk_nested_agg_bucket_explosion():
+    dsl = {"size": 0, "aggs": {"a": {
+        "terms": {"field": "country", "size": 200},
+        "aggs": {"b": {
+            "terms": {"field": "city", "size": 500},
+            "aggs": {"c": {"date_histogram": {"field": "@timestamp", "calendar_interval": "day"}}}
+        }}
+    }}}
+    res = risk_analyzer.evaluate(dsl)
+    features = risk_analyzer.analyze(dsl)
+    assert features.agg_depth == 3
+    assert features.bucket_product == 200 * 500 * 30
+    assert any("buckets" in r for r in res["reasons"])
+    assert res["level"] == "high"
+
+def test_risk_pluggable_cost_model():
+    from app.core.risk import RiskAnalyzer, CostModel
+
+    class FlatCost(CostModel):
+        def estimate(self, features, stats):
+            return 5e6, ["flat"]
+
+    res = RiskAnalyzer(cost_model=FlatCost()).evaluate({"query": {"match_all": {}}})
+    assert res["level"] == "medium"
+    assert res["reasons"] == ["flat"]
+
+def test_risk_scripts_outside_query_cost_per_doc():
+    plain = risk_analyzer.evaluate({"query": {"match_all": {}}})
+    scripted = risk_analyzer.evaluate({
+        "query": {"match_all": {}},
+        "sort": [{"_script": {"type": "number", "script": "doc['a'].value * 2", "order": "desc"}}],
+        "runtime_mappings": {"b": {"type": "long", "script": "emit(1)"}}
+    })
+    assert risk_analyzer.analyze({"runtime_mappings": {"b": {"script": "emit(1)"}}}).doc_scripts == 1
+    assert "Scripting used" in scripted["reasons"]
+    assert scripted["level"] == "high"
+    assert scripted["estimated_cost"] > 100 * plain["estimated_cost"]
+
+def test_risk_filters_do_not_add_up_linearly():
+    def filters(n):
+        return {"query": {"bool": {"filter": [{"term": {f"f{i}": "x"}} for i in range(n)]}}}
+    one = risk_analyzer.evaluate(filters(1))["estimated_cost"]
+    twenty = risk_analyzer.evaluate(filters(20))["estimated_cost"]
+    assert twenty < 2 * one
+    # The expensive clause is still paid in full
+    wildcard = {"wildcard": {"sku": "*123"}}
+    scoped = risk_analyzer.evaluate({"query": {"bool": {"filter": [wildcard, {"term": {"a": "x"}}]}}})
+    assert scoped["level"] == "high"
+
+def test_risk_date_fields_come_from_the_prebuilt_field_index():
+    from app.core.risk import RiskAnalyzer
+    from app.core.field_catalog import FieldCatalog
+
+    catalog = FieldCatalog(path="/nonexistent")
+    catalog.catalog = {"orders-*": {"@timestamp": {"type": "date"}, "status": {"type": "keyword"}}}
+    analyzer = RiskAnalyzer(catalog=catalog)
+    assert "No time filter" in analyzer.evaluate({"query": {"term": {"status": "x"}}}, "orders-*")["reasons"]
+    # Built once, then reused by every evaluation
+    assert catalog.get_field_index("orders-*") is catalog.get_field_index("orders-*")
+    assert "No time filter" not in analyzer.evaluate({"query": {"term": {"status": "x"}}})["reasons"]
+
+@pytest.mark.asyncio
+async def test_risk_calibration_stats_are_bounded():
+    from unittest.mock import patch, AsyncMock
+    from app.core.risk import RiskAnalyzer
+    from app.core.config import settings
+
+    analyzer = RiskAnalyzer()
+    with patch("app.core.risk.es_client.count", new_callable=AsyncMock) as mock_count, \
+         patch.object(settings, "RISK_STATS_MAX", 2):
+        mock_count.return_value = {"count": 5, "_shards": {"total": 1}}
+        for index in ("a", "b", "c"):
+            await analyzer.calibrate(index)
+    assert analyzer.index_stats("a") == {}
+    assert analyzer.index_stats("c") == {"docs": 5, "shards": 1}
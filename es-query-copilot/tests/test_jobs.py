@@ -0,0 +1,95 @@
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from unittest.mock import patch, AsyncMock
+
+RUNNING = {
+    "id": "es-async-1", "is_running": True, "is_partial": True,
+    "response": {"took": 900, "_shards": {"total": 10, "successful": 4, "failed": 0},
+                 "hits": {"total": {"value": 120, "relation": "gte"}, "hits": []},
+                 "aggregations": {"by_country": {"buckets": [{"key": "DE", "doc_count": 120}]}}}
+}
+
+@pytest.mark.asyncio
+async def test_job_submit_poll_partial_and_cancel():
+    with patch("app.services.es_client.es_client.submit_async_search", new_callable=AsyncMock) as mock_submit, \
+         patch("app.services.es_client.es_client.get_async_search", new_callable=AsyncMock) as mock_get, \
+         patch("app.services.es_client.es_client.delete_async_search", new_callable=AsyncMock) as mock_delete:
+        mock_submit.return_value = {"id": "es-async-1", "is_running": True, "is_partial": True, "response": {}}
+        mock_get.return_value = RUNNING
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            submitted = await ac.post("/jobs", json={
+                "index": "orders-*",
+                "dsl": {"size": 0, "aggs": {"by_country": {"terms": {"field": "country"}}}},
+                "wait_ms": 50
+            })
+            job_id = submitted.json()["job_id"]
+            partial = await ac.get(f"/jobs/{job_id}", params={"wait_ms": 10**9})
+            cancelled = await ac.delete(f"/jobs/{job_id}")
+            gone = await ac.get(f"/jobs/{job_id}")
+
+    assert submitted.status_code == 200
+    assert submitted.json()["state"] == "running"
+    assert job_id != "es-async-1"
+    assert mock_submit.call_args.kwargs["wait_for_completion_timeout"] == "50ms"
+
+    # Polls cannot hold the connection open beyond the configured cap
+    assert mock_get.call_args.kwargs["wait_for_completion_timeout"] == "30000ms"
+    body = partial.json()
+    assert body["state"] == "running" and body["is_partial"]
+    assert body["shards"]["successful"] == 4
+    assert body["aggs"]["by_country"]["buckets"][0]["doc_count"] == 120
+
+    assert cancelled.status_code == 200
+    mock_delete.assert_awaited_once_with("es-async-1")
+    assert gone.status_code == 404
+
+@pytest.mark.asyncio
+async def test_job_kept_on_transient_es_error_and_dropped_on_404():
+    from elasticsearch import NotFoundError
+    from app.core.errors import ESDriverError
+
+    def wrapped(exc):
+        async def fail(*args, **kwargs):
+            try:
+                raise exc
+            except Exception as e:
+                raise ESDriverError(f"Async search get failed: {str(e)}")
+        return fail
+
+    with patch("app.services.es_client.es_client.submit_async_search", new_callable=AsyncMock) as mock_submit, \
+         patch("app.services.es_client.es_client.get_async_search", new_callable=AsyncMock) as mock_get, \
+         patch("app.services.es_client.es_client.delete_async_search", new_callable=AsyncMock):
+        mock_submit.return_value = {"id": "es-async-2", "is_running": True, "response": {}}
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            job_id = (await ac.post("/jobs", json={"index": "orders-*", "dsl": {"size": 0}})).json()["job_id"]
+            mock_get.side_effect = wrapped(ConnectionError("connection reset"))
+            transient = await ac.get(f"/jobs/{job_id}")
+            mock_get.side_effect = None
+            mock_get.return_value = RUNNING
+            retried = await ac.get(f"/jobs/{job_id}")
+            mock_get.side_effect = wrapped(NotFoundError("resource_not_found_exception", None, None))
+            expired = await ac.get(f"/jobs/{job_id}")
+            mock_get.side_effect = None
+            gone = await ac.get(f"/jobs/{job_id}")
+
+    assert transient.status_code == 500
+    assert retried.status_code == 200
+    assert expired.status_code == 404
+    assert gone.status_code == 404
+    assert mock_get.await_count == 3
+
+@pytest.mark.asyncio
+async def test_job_status_poll_does_not_extend_ttl():
+    from app.core.job_store import JobStore
+
+    store = JobStore(maxsize=10, ttl=60)
+    with patch("app.core.job_store.es_client.delete_async_search", new_callable=AsyncMock):
+        job_id = await store.create({"es_id": "es-async-3", "warnings": []})
+        expires_at = store._data[job_id]["expires_at"]
+        assert await store.get(job_id, touch=False) is not None
+        assert store._data[job_id]["expires_at"] == expires_at
+        await store.get(job_id)
+        assert store._data[job_id]["expires_at"] > expires_at
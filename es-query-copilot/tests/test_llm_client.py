@@ -0,0 +1,80 @@
+import asyncio
+import json
+import pytest
+import httpx
+from app.services.llm_client import LLMClient, LLMBackend
+
+@pytest.mark.asyncio
+async def test_generate_json_reuses_client_and_caps_concurrency():
+    active = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        content = json.dumps({"dsl": {"query": {"match_all": {}}}})
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    client = LLMClient(backends=[LLMBackend("test", "http://llm.test", "gpt-4o")])
+    client._semaphore = asyncio.Semaphore(2)
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    pooled = client.client
+
+    results = await asyncio.gather(*[client.generate_json("sys", "q") for _ in range(6)])
+
+    assert all(r["dsl"] == {"query": {"match_all": {}}} for r in results)
+    assert peak <= 2
+    assert client.client is pooled
+    stats = client.stats()
+    assert stats["calls"] == 6
+    assert stats["in_flight"] == 0
+    assert stats["queue_wait_max_s"] > 0
+
+    await client.close()
+    assert client.client is None
+
+@pytest.mark.asyncio
+async def test_generate_json_hedges_slow_backend_and_trips_breaker():
+    from unittest.mock import patch
+    from app.core.config import settings
+
+    slow_calls = 0
+
+    async def handler(request):
+        nonlocal slow_calls
+        content = json.dumps({"backend": request.url.host})
+        if request.url.host == "slow.test":
+            slow_calls += 1
+            await asyncio.sleep(1)
+        elif request.url.host == "down.test":
+            return httpx.Response(503)
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    slow = LLMBackend("slow", "http://slow.test", "m")
+    local = LLMBackend("local", "http://local.test", "m")
+    client = LLMClient(backends=[slow, local])
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    # Slow primary is hedged after the default delay; the local backend wins
+    with patch.object(settings, "LLM_HEDGE_DEFAULT_DELAY_S", 0.05):
+        result = await asyncio.wait_for(client.generate_json("sys", "q"), timeout=0.5)
+    assert result == {"backend": "local.test"}
+    assert slow_calls == 1
+    assert client.stats()["hedged"] == 1
+    # The cancelled loser is neither a success nor a failure
+    assert slow.failures == 0 and len(slow.latencies) == 0
+
+    # A failing primary fails over at once and trips its breaker
+    down = LLMBackend("down", "http://down.test", "m")
+    client.backends = [down, local]
+    with patch.object(settings, "LLM_BREAKER_FAILURES", 2):
+        for _ in range(2):
+            assert await client.generate_json("sys", "q") == {"backend": "local.test"}
+    assert client.stats()["failovers"] == 2
+    assert client.stats()["backends"]["down"]["state"] == "open"
+    assert not down.available()
+
+    await client.close()
@@ -0,0 +1,44 @@
+import pytest
+from httpx import AsyncClient
+from unittest.mock import patch, AsyncMock
+from app.main import app
+from app.core.config import settings
+from app.core.metrics import Histogram, STAGE_SECONDS
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram("t_seconds", "test", ("stage",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 5.0):
+        h.observe(v, stage="llm")
+    lines = h.render()
+    assert 't_seconds_bucket{stage="llm",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{stage="llm",le="1"} 2' in lines
+    assert 't_seconds_bucket{stage="llm",le="+Inf"} 3' in lines
+    assert 't_seconds_count{stage="llm"} 3' in lines
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_and_debug_trace():
+    before = STAGE_SECONDS.count(stage="es_search")
+
+    with patch.object(settings, "DEBUG_TRACE_ENABLED", True), \
+         patch.object(settings, "SEARCH_CACHE_ENABLED", False), \
+         patch("app.services.es_client.es_client.client.search", new_callable=AsyncMock) as mock_search:
+        mock_search.return_value = {"took": 4, "hits": {"total": 1, "hits": []}}
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            traced = await ac.post("/run", json={"index": "orders-*", "dsl": {"query": {"match_all": {}}}},
+                                   headers={"X-Debug-Trace": "1"})
+            plain = await ac.post("/run", json={"index": "orders-*", "dsl": {"query": {"match_all": {}}}})
+            scrape = await ac.get("/metrics")
+
+    assert traced.status_code == 200
+    timing = traced.headers["Server-Timing"]
+    assert "risk;dur=" in timing and "es_search;dur=" in timing
+    assert "Server-Timing" not in plain.headers
+    assert STAGE_SECONDS.count(stage="es_search") == before + 2
+
+    body = scrape.text
+    assert scrape.headers["content-type"].startswith("text/plain")
+    assert 'copilot_http_request_seconds_count{method="POST",route="/run",status="200"}' in body
+    assert 'copilot_es_took_seconds_bucket{op="search",le="0.005"}' in body
+    assert 'copilot_cache_hits_total{cache="search"}' in body
+    assert "# TYPE copilot_repair_rounds histogram" in body
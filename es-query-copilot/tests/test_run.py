@@ -1,3 +1,4 @@
+import json
 import pytest
 from httpx import AsyncClient
 from app.main import app
@@ -29,3 +30,355 @@ async def test_run_endpoint_high_risk():
     # Expect 403 Forbidden
     assert response.status_code == 403
     assert "High risk query blocked" in response.json()["detail"]
+
+@pytest.mark.asyncio
+async def test_run_cursor_pagination():
+    pages = [
+        {"took": 3, "pit_id": "pit-2", "hits": {"hits": [{"_id": "1", "sort": [1]}, {"_id": "2", "sort": [2]}]}},
+        {"took": 2, "pit_id": "pit-3", "hits": {"hits": [{"_id": "3", "sort": [3]}]}},
+    ]
+
+    with patch("app.services.es_client.es_client.open_point_in_time", new_callable=AsyncMock) as mock_open, \
+         patch("app.services.es_client.es_client.close_point_in_time", new_callable=AsyncMock) as mock_close, \
+         patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search:
+        mock_open.return_value = "pit-1"
+        mock_search.side_effect = pages
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            first = await ac.post("/run", json={
+                "index": "orders-*",
+                "dsl": {"query": {"match_all": {}}, "size": 2, "from": 50000},
+                "paginate": True
+            })
+            cursor = first.json()["cursor"]
+            second = await ac.post("/run", json={"index": "orders-*", "cursor": cursor})
+            expired = await ac.post("/run", json={"index": "orders-*", "cursor": cursor})
+
+    assert first.status_code == 200
+    assert cursor
+    first_body = mock_search.call_args_list[0].kwargs["body"]
+    assert "from" not in first_body
+    assert first_body["pit"]["id"] == "pit-1"
+    assert first_body["sort"] == [{"_shard_doc": "asc"}]
+
+    second_body = mock_search.call_args_list[1].kwargs["body"]
+    assert second_body["pit"]["id"] == "pit-2"
+    assert second_body["search_after"] == [2]
+    assert second.json()["cursor"] is None
+    # Last page frees the PIT and the cursor
+    mock_close.assert_awaited_once_with("pit-3")
+    assert expired.status_code == 410
+
+@pytest.mark.asyncio
+async def test_cursor_in_flight_is_not_evicted_or_replayed():
+    import asyncio
+    from app.core.cursor_store import CursorStore
+
+    with patch("app.services.es_client.es_client.close_point_in_time", new_callable=AsyncMock) as mock_close:
+        store = CursorStore(maxsize=1, ttl=60)
+        busy = {"pit_id": "pit-busy", "in_flight": 1, "closed": False}
+        await store.create(busy)
+        await store.create({"pit_id": "pit-new", "in_flight": 0, "closed": False})
+        # Over the limit, but the page in flight keeps its PIT
+        assert not busy["closed"]
+        mock_close.assert_not_awaited()
+
+    page = {"took": 1, "pit_id": "pit-1", "hits": {"hits": [{"_id": "1", "sort": [1]}]}}
+    with patch("app.services.es_client.es_client.open_point_in_time", new_callable=AsyncMock) as mock_open, \
+         patch("app.services.es_client.es_client.close_point_in_time", new_callable=AsyncMock), \
+         patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search:
+        mock_open.return_value = "pit-1"
+        mock_search.side_effect = [page, {"took": 1, "pit_id": "pit-1", "hits": {"hits": []}}]
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            first = await ac.post("/run", json={
+                "index": "orders-*", "dsl": {"query": {"match_all": {}}, "size": 1}, "paginate": True
+            })
+            cursor = first.json()["cursor"]
+            # Two clients race on the same cursor: the loser must not restart at page one
+            last, late = await asyncio.gather(
+                ac.post("/run", json={"index": "orders-*", "cursor": cursor}),
+                ac.post("/run", json={"index": "orders-*", "cursor": cursor}),
+            )
+
+    assert sorted([last.status_code, late.status_code]) == [200, 410]
+    assert mock_search.await_count == 2
+    assert mock_search.call_args_list[1].kwargs["body"]["search_after"] == [1]
+
+@pytest.mark.asyncio
+async def test_run_batch_msearch():
+    with patch("app.services.es_client.es_client.msearch", new_callable=AsyncMock) as mock_msearch:
+        mock_msearch.return_value = {"took": 7, "responses": [
+            {"took": 3, "hits": {"total": {"value": 1}, "hits": []}},
+            {"error": {"type": "index_not_found_exception", "reason": "no such index"}, "status": 404},
+        ]}
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/run/batch", json={"requests": [
+                {"index": "orders-*", "dsl": {"query": {"match_all": {}}, "size": 1000}},
+                {"index": "orders-*", "dsl": {"query": {"wildcard": {"f": "*a"}}, "script": {}}},
+                {"index": "missing", "dsl": {"query": {"match_all": {}}}},
+            ]})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == [200, 403, 404]
+    assert results[0]["result"]["took"] == 3
+    assert results[2]["error"] == "no such index"
+
+    # Blocked item never reaches ES; the rest share one round trip
+    searches = mock_msearch.call_args.args[0]
+    assert [index for index, _ in searches] == ["orders-*", "missing"]
+    assert searches[0][1]["size"] == 200
+
+@pytest.mark.asyncio
+async def test_run_batch_options_optimizer_and_cache():
+    from app.core.cache import search_cache
+    search_cache.clear()
+    dsl = {"size": 0, "query": {"bool": {"must": [{"term": {"status": "failed"}}]}},
+           "aggs": {"n": {"terms": {"field": "status"}}}}
+
+    with patch("app.services.es_client.es_client.msearch", new_callable=AsyncMock) as mock_msearch:
+        mock_msearch.return_value = {"took": 4, "responses": [{"took": 2, "hits": {"total": {"value": 3}, "hits": []}}]}
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            first = await ac.post("/run/batch", json={"requests": [
+                {"index": "orders-*", "dsl": dsl},
+                {"index": "orders-*", "dsl": dsl, "format": "csv"},
+                {"index": "orders-*", "dsl": dsl, "mode": "approximate"},
+                {"index": "orders-*", "dsl": dsl, "passthrough": True},
+            ]})
+            again = await ac.post("/run/batch", json={"requests": [{"index": "orders-*", "dsl": dsl}]})
+
+    results = first.json()["results"]
+    assert [r["status"] for r in results] == [200, 400, 400, 400]
+    assert results[1]["error"].startswith("format=csv")
+    assert results[2]["error"].startswith("mode=approximate")
+
+    # Items go through the optimizer like /run ...
+    sent = mock_msearch.call_args.args[0][0][1]
+    assert "must" not in sent["query"]["bool"]
+    assert results[0]["result"]["warnings"]
+
+    # ... and through the result cache
+    assert mock_msearch.await_count == 1
+    assert again.json()["results"][0]["result"]["hits"]["total"]["value"] == 3
+    assert again.json()["results"][0]["result"]["warnings"] == results[0]["result"]["warnings"]
+
+@pytest.mark.asyncio
+async def test_run_result_cache():
+    from app.core.cache import search_cache, search_ttl
+    search_cache.clear()
+
+    assert search_ttl({"query": {"range": {"ts": {"gte": "now-15m"}}}}) == 0
+    assert 0 < search_ttl({"query": {"range": {"ts": {"gte": "now-1h/m"}}}}) <= 60
+    assert search_ttl({"query": {"term": {"status": "failed"}}}) == 300
+
+    rounded = {"query": {"range": {"ts": {"gte": "now-7d/d"}}}, "size": 5}
+    raw_now = {"size": 5, "query": {"range": {"ts": {"gte": "now-15m"}}}}
+
+    with patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search:
+        mock_search.return_value = {"took": 5, "hits": {"total": 1, "hits": []}}
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            first = await ac.post("/run", json={"index": "orders-*", "dsl": rounded})
+            # Same DSL with different key order is the same fingerprint
+            second = await ac.post("/run", json={"index": "orders-*", "dsl": {"size": 5, **rounded}})
+            bypass = await ac.post("/run", json={"index": "orders-*", "dsl": rounded},
+                                   headers={"Cache-Control": "no-cache"})
+            now_1 = await ac.post("/run", json={"index": "orders-*", "dsl": raw_now})
+            now_2 = await ac.post("/run", json={"index": "orders-*", "dsl": raw_now})
+
+    assert first.headers["X-Search-Cache"] == "miss"
+    assert second.headers["X-Search-Cache"] == "hit"
+    assert bypass.headers["X-Search-Cache"] == "bypass"
+    assert now_1.headers["X-Search-Cache"] == "miss"
+    assert now_2.headers["X-Search-Cache"] == "miss"
+    assert mock_search.call_count == 4
+
+@pytest.mark.asyncio
+async def test_run_partial_results_not_cached():
+    from app.core.cache import search_cache
+    search_cache.clear()
+    dsl = {"query": {"term": {"status": "failed"}}, "size": 5}
+
+    with patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search:
+        mock_search.return_value = {"took": 5, "timed_out": True, "hits": {"total": 1, "hits": []}}
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            first = await ac.post("/run", json={"index": "orders-*", "dsl": dsl})
+            second = await ac.post("/run", json={"index": "orders-*", "dsl": dsl})
+
+    assert first.json()["timed_out"] is True
+    assert second.headers["X-Search-Cache"] == "miss"
+    assert len(search_cache) == 0
+    assert mock_search.call_count == 2
+
+@pytest.mark.asyncio
+async def test_run_cache_sizes_from_content_length():
+    from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig, ObjectApiResponse
+    from app.core.cache import search_cache
+    search_cache.clear()
+
+    body = {"took": 5, "hits": {"total": 1, "hits": []}}
+    meta = ApiResponseMeta(200, "1.1", HttpHeaders({"content-length": "1234"}), 0.0,
+                           NodeConfig("http", "localhost", 9200))
+
+    with patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search, \
+         patch.object(search_cache, "sizeof") as mock_size:
+        mock_search.return_value = ObjectApiResponse(body=body, meta=meta)
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/run", json={"index": "orders-*", "dsl": {"query": {"match_all": {}}}})
+
+    assert response.status_code == 200
+    # The raw body length is used; the response is never re-serialized to measure it
+    assert search_cache.nbytes == 1234
+    mock_size.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_run_optimizer_rewrites():
+    from app.core.optimizer import DSLOptimizer, RULES
+    dsl = {
+        "size": 0,
+        "query": {"bool": {
+            "must": [{"wildcard": {"user.keyword": {"value": "abc*", "case_insensitive": True}}}],
+            "filter": [{"range": {"ts": {"gte": "now-15m"}}}]
+        }},
+        "aggs": {"by_status": {"terms": {"field": "status"}}}
+    }
+
+    # Approximate rules are opt-in
+    optimized, applied = DSLOptimizer([RULES["round_now"]], allow_inexact=True).optimize(dsl)
+    assert optimized["query"]["bool"]["filter"][0]["range"]["ts"]["gte"] == "now-15m/m"
+    assert dsl["query"]["bool"]["filter"][0]["range"]["ts"]["gte"] == "now-15m"
+    assert len(applied) == 1
+
+    with patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search:
+        mock_search.return_value = {"took": 5, "hits": {"total": 1, "hits": []}}
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            applied = await ac.post("/run", json={"index": "orders-*", "dsl": dsl},
+                                    headers={"Cache-Control": "no-cache"})
+            dry_run = await ac.post("/run", json={"index": "orders-*", "dsl": dsl, "optimize": "dry_run"},
+                                    headers={"Cache-Control": "no-cache"})
+            agg_only = await ac.post("/run", json={
+                "index": "orders-*",
+                "dsl": {"query": {"match": {"msg": "timeout"}}, "aggs": {"n": {"terms": {"field": "status"}}}}
+            }, headers={"Cache-Control": "no-cache"})
+
+    bool_body = mock_search.call_args_list[0].kwargs["body"]["query"]["bool"]
+    assert "must" not in bool_body
+    assert bool_body["filter"][1] == {"prefix": {"user.keyword": {"case_insensitive": True, "value": "abc"}}}
+    assert len(applied.json()["warnings"]) == 2
+
+    # Dry run reports the same rewrites but executes the DSL as given
+    assert mock_search.call_args_list[1].kwargs["body"] == dsl
+    assert all(w.startswith("[dry-run]") for w in dry_run.json()["warnings"])
+    assert len(dry_run.json()["warnings"]) == 2
+
+    # Scored query without sort keeps must; omitted size is not rewritten by default
+    agg_body = mock_search.call_args_list[2].kwargs["body"]
+    assert "size" not in agg_body
+    assert "match" in agg_body["query"]
+
+    with pytest.raises(ValueError):
+        DSLOptimizer([RULES["agg_only_no_hits"]])
+
+def test_must_to_filter_keeps_scoring_wrappers():
+    from app.core.optimizer import DSLOptimizer, RULES
+    dsl = {
+        "size": 0,
+        "query": {"function_score": {
+            "query": {"bool": {"must": [{"match": {"msg": "timeout"}}]}},
+            "min_score": 1
+        }},
+        "aggs": {"n": {"terms": {"field": "status"}}}
+    }
+    optimized, applied = DSLOptimizer([RULES["must_to_filter"]]).optimize(dsl)
+    assert optimized == dsl
+    assert applied == []
+
+def test_must_to_filter_keeps_scores_read_by_top_hits_and_collapse():
+    from app.core.optimizer import DSLOptimizer, RULES
+    optimizer = DSLOptimizer([RULES["must_to_filter"]])
+    query = {"bool": {"must": [{"match": {"msg": "timeout"}}]}}
+
+    top = {"size": 0, "query": query, "aggs": {"top": {"top_hits": {"size": 3}}}}
+    assert optimizer.optimize(top)[1] == []
+    collapsed = {"query": query, "sort": [{"ts": "desc"}], "collapse": {"field": "user", "inner_hits": {"name": "best"}}}
+    assert optimizer.optimize(collapsed)[1] == []
+
+    # Sorted on a field, top_hits never reads the score
+    by_time = {"size": 0, "query": query, "aggs": {"top": {"top_hits": {"size": 3, "sort": [{"ts": "desc"}]}}}}
+    assert optimizer.optimize(by_time)[0]["query"] == {"bool": {"filter": [{"match": {"msg": "timeout"}}]}}
+
+@pytest.mark.asyncio
+async def test_run_passthrough_relays_es_bytes():
+    import httpx
+    from app.services.es_client import es_client
+    raw = b'{"took":4,"timed_out":false,"hits":{"total":{"value":1,"relation":"eq"},"hits":[{"_id":"1","_source":{"status":"paid"}}]}}'
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen["url"] = request.url
+        seen["body"] = request.content
+        return httpx.Response(200, content=raw, headers={"Content-Type": "application/json"})
+
+    with patch.object(es_client, "http", httpx.AsyncClient(base_url="http://es.test", transport=httpx.MockTransport(handler))):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/run", json={
+                "index": "orders-*",
+                "dsl": {"query": {"match_all": {}}, "size": 5},
+                "fields": ["status"],
+                "passthrough": True
+            })
+
+    assert response.status_code == 200
+    assert response.content == raw
+    assert seen["url"].path == "/orders-*/_search"
+    assert "hits.hits._source" in seen["url"].params["filter_path"]
+    assert json.loads(seen["body"])["_source"] == {"includes": ["status"]}
+
+@pytest.mark.asyncio
+async def test_run_csv_pages_composite_aggregation():
+    pages = [
+        {"took": 2, "aggregations": {"groups": {"after_key": {"country": "DE"}, "buckets": [
+            {"key": {"country": "DE"}, "doc_count": 4, "spend": {"value": 10.0}}]}}},
+        {"took": 2, "aggregations": {"groups": {"after_key": {"country": "FR"}, "buckets": [
+            {"key": {"country": "FR"}, "doc_count": 1, "spend": {"value": 2.5}}]}}},
+        {"took": 1, "aggregations": {"groups": {"buckets": []}}},
+    ]
+    dsl = {"size": 0, "aggs": {"groups": {
+        "composite": {"sources": [{"country": {"terms": {"field": "country"}}}]},
+        "aggs": {"spend": {"sum": {"field": "amount"}}}
+    }}}
+    with patch("app.services.es_client.es_client.search", new_callable=AsyncMock) as mock_search:
+        mock_search.side_effect = pages
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/run", json={"index": "orders-*", "dsl": dsl, "format": "csv"})
+
+    assert response.status_code == 200
+    assert response.text.splitlines() == ["country,groups.doc_count,spend", "DE,4,10.0", "FR,1,2.5"]
+    assert response.headers["X-Columnar-Pages"] == "3"
+    assert mock_search.call_args_list[2].kwargs["body"]["aggs"]["groups"]["composite"]["after"] == {"country": "FR"}
+
+def test_wildcard_to_prefix_leaves_intervals_alone():
+    from app.core.optimizer import DSLOptimizer, RULES
+
+    optimizer = DSLOptimizer([RULES["wildcard_to_prefix"]])
+    intervals = {"query": {"intervals": {"title": {"wildcard": {"pattern": "abc*"}}}}}
+    out, applied = optimizer.optimize(intervals)
+    assert out == intervals and applied == []
+
+    nested = {"query": {"bool": {"filter": [{"constant_score": {"filter": {"wildcard": {"sku": "abc*"}}}}]}}}
+    out, applied = optimizer.optimize(nested)
+    assert out["query"]["bool"]["filter"][0]["constant_score"]["filter"] == {"prefix": {"sku": {"value": "abc"}}}
+
+@pytest.mark.asyncio
+async def test_run_requires_dsl_without_cursor():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        single = await ac.post("/run", json={"index": "orders-*"})
+        batch = await ac.post("/run/batch", json={"requests": [{"index": "orders-*"}]})
+    assert single.status_code == 422
+    assert batch.status_code == 422
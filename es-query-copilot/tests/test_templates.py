@@ -0,0 +1,89 @@
+import pytest
+from httpx import AsyncClient
+from unittest.mock import patch, AsyncMock
+from app.main import app
+from app.core.templates import TemplateStore, compile_template
+
+DSL = {
+    "size": 0,
+    "query": {"bool": {"filter": [
+        {"term": {"status.keyword": "FAILED"}},
+        {"range": {"created_at": {"gte": "now-7d/d"}}}
+    ]}},
+    "aggs": {"by_country": {"terms": {"field": "country.keyword", "size": 10}}}
+}
+
+def test_compile_and_fill_slots():
+    store = TemplateStore(maxsize=10)
+    assert store.learn("orders-*", "UTC", "Last 7 days failed orders by country top 10", DSL)
+
+    dsl, template = store.match("orders-*", "UTC", "last 30 days  refunded orders by country top 5")
+    assert dsl["query"]["bool"]["filter"][0] == {"term": {"status.keyword": "REFUNDED"}}
+    assert dsl["query"]["bool"]["filter"][1]["range"]["created_at"]["gte"] == "now-30d/d"
+    assert dsl["aggs"]["by_country"]["terms"]["size"] == 5
+    # The learned DSL itself is untouched
+    assert template.dsl == DSL
+
+    # Different shape, unit or scope is a miss
+    assert store.match("orders-*", "UTC", "last 30 weeks refunded orders by country top 5") is None
+    assert store.match("orders-*", "Asia/Shanghai", "last 7 days failed orders by country top 10") is None
+
+def test_ambiguous_numbers_are_not_learned():
+    dsl = {"size": 7, "query": {"range": {"ts": {"gte": "now-7d"}}}}
+    assert compile_template("top 7 in the last 7 days", dsl) is None
+    # A number that never reaches the DSL stays literal
+    template = compile_template("最近7天 top3 订单", {"size": 20, "query": {"range": {"ts": {"gte": "now-7d"}}}})
+    assert template is not None and len(template.slots) == 1
+
+@pytest.mark.asyncio
+async def test_validated_draft_feeds_template_fast_path():
+    from app.core.templates import template_store
+
+    drafted = {"size": 20, "query": {"range": {"amount": {"gt": 100}}}}
+    with patch("app.services.es_client.es_client.validate_query", new_callable=AsyncMock) as mock_es, \
+         patch("app.services.llm_client.llm_client.generate_json", new_callable=AsyncMock) as mock_llm:
+        mock_es.return_value = {"valid": True}
+        mock_llm.return_value = {"dsl": drafted, "explanation": [], "confidence": 0.9}
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            draft = (await ac.post("/draft", json={"index": "orders-*", "nl_query": "orders with amount over 100"})).json()
+            # A pairing the drafter never produced is validated but not learned
+            await ac.post("/validate", json={
+                "index": "orders-*",
+                "dsl": {"size": 20, "query": {"match_all": {}}},
+                "nl_query": "orders with amount over 100",
+                "draft_id": draft["draft_id"]
+            })
+            forged = await ac.post("/draft", json={"index": "orders-*", "nl_query": "Orders with amount over 250"})
+            await ac.post("/validate", json={
+                "index": "orders-*",
+                "dsl": drafted,
+                "nl_query": "orders with amount over 100",
+                "draft_id": draft["draft_id"]
+            })
+            response = await ac.post("/draft", json={
+                "index": "orders-*",
+                "nl_query": "Orders with amount over 250"
+            })
+
+    assert forged.headers["X-Draft-Source"] == "llm"
+    assert response.status_code == 200
+    assert response.headers["X-Draft-Source"] == "template"
+    assert response.json()["dsl"] == {"size": 20, "query": {"range": {"amount": {"gt": 250}}}}
+    assert response.json()["confidence"] == 1.0
+    assert mock_llm.await_count == 2
+    assert template_store.stats()["hits"] >= 1
+
+def test_eviction_is_global_lru_and_date_math_is_integer():
+    store = TemplateStore(maxsize=2)
+    dsl = {"size": 0, "query": {"range": {"ts": {"gte": "now-7d"}}}}
+    assert store.learn("a-*", "UTC", "orders in the last 7 days", dsl)
+    assert store.learn("b-*", "UTC", "orders in the last 7 days", dsl)
+    # Using a-* makes b-* the oldest template overall
+    assert store.match("a-*", "UTC", "orders in the last 3 days") is not None
+    assert store.learn("a-*", "UTC", "refunds in the last 7 days", dsl)
+    assert len(store) == 2
+    assert store.match("b-*", "UTC", "orders in the last 7 days") is None
+    assert store.match("a-*", "UTC", "orders in the last 3 days") is not None
+    # Fractional units cannot fill date math
+    assert store.match("a-*", "UTC", "orders in the last 1.5 days") is None
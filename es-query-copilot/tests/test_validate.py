@@ -44,3 +44,63 @@ async def test_validate_invalid_query_and_fix():
         assert data["valid"] is True
         assert data["auto_fixed"] is True
         assert data["fixed_dsl"] == {"query": {"fixed": True}}
+
+@pytest.mark.asyncio
+async def test_validate_local_fix_skips_llm():
+    from app.core.field_catalog import field_catalog
+    catalog = {"orders-*": {
+        "status": {"type": "text", "searchable": True, "aggregatable": False},
+        "status.keyword": {"type": "keyword", "searchable": True, "aggregatable": True},
+    }}
+
+    with patch.object(field_catalog, "catalog", catalog), \
+         patch("app.services.es_client.es_client.validate_query", new_callable=AsyncMock) as mock_es, \
+         patch("app.services.llm_client.llm_client.generate_json", new_callable=AsyncMock) as mock_llm:
+        mock_es.return_value = {"valid": True}
+
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/validate", json={
+                "index": "orders-*",
+                "dsl": {"aggs": {"s": {"terms": {"field": "status"}}}}
+            })
+
+    data = response.json()
+    assert data["valid"] is True
+    assert data["auto_fixed"] is True
+    assert data["fixed_dsl"] == {"aggs": {"s": {"terms": {"field": "status.keyword"}}}}
+    assert data["warnings"]
+    mock_llm.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_speculative_repair_first_valid_wins():
+    import asyncio
+    from app.core.fixer import dsl_fixer
+    from app.core.config import settings
+
+    cancelled = []
+
+    async def fake_llm(system_prompt, user_prompt, temperature):
+        if "smallest change" in user_prompt:
+            return {"query": {"fixed": True}}
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(temperature)
+            raise
+        return {"query": {"slow": True}}
+
+    async def fake_validate(index, dsl):
+        return {"valid": True} if dsl.get("query", {}).get("fixed") else {"valid": False, "error": "bad"}
+
+    with patch.object(settings, "REPAIR_CANDIDATES", 3), \
+         patch("app.services.es_client.es_client.validate_query", side_effect=fake_validate), \
+         patch("app.services.llm_client.llm_client.generate_json", side_effect=fake_llm) as mock_llm:
+        valid, dsl, errors, was_fixed, _ = await asyncio.wait_for(
+            dsl_fixer.validate_and_fix("orders-*", {"query": {"bad": True}}), timeout=1
+        )
+
+    assert valid and was_fixed and errors == []
+    assert dsl == {"query": {"fixed": True}}
+    assert mock_llm.call_count == 3
+    # Both REPAIR_PROMPT candidates lost the race and were cancelled
+    assert sorted(cancelled) == [0.0, 0.4]